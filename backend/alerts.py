@@ -0,0 +1,168 @@
+"""Rolling alert counts per zone and severity over fixed windows (e.g. 1h, 24h, 7d)
+
+Each window is a ring of time slots. A reading increments the slot for its
+timestamp, reusing the slot once its previous period has left the window, so
+memory and query cost depend on zones x severities x slots and not on how
+many readings are stored.
+
+The counts are rebuilt from sensor_data once, at startup. After that a reading
+is counted when this process stores it, and ``catch_up`` counts the alert
+readings other workers stored, found by their change_seq.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from changes import CursorExpired
+from common import as_epoch
+
+
+ALERT_SEVERITIES = ("warning", "critical")
+UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_windows(spec: str) -> Dict[str, int]:
+    """'1h,24h,7d' -> {'1h': 3600, '24h': 86400, '7d': 604800}"""
+    windows = {}
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        unit = UNIT_SECONDS.get(name[-1])
+        if unit is None or not name[:-1].isdigit() or int(name[:-1]) <= 0:
+            raise ValueError(f"Invalid alert window {name!r}, expected e.g. 30m, 1h or 7d")
+        windows[name] = int(name[:-1]) * unit
+    if not windows:
+        raise ValueError("At least one alert window is required")
+    return windows
+
+
+class RingCounter:
+    """Event count over the trailing ``window`` seconds, in ``slots`` time slots"""
+
+    def __init__(self, window: int, slots: int):
+        self.width = window / slots
+        self.slots = slots
+        self.counts = [0] * slots
+        self.periods = [-1] * slots
+
+    def add(self, at: float, now: float, count: int = 1):
+        period = int(min(at, now) // self.width)
+        if period <= int(now // self.width) - self.slots:
+            return
+        slot = period % self.slots
+        if self.periods[slot] != period:
+            if self.periods[slot] > period:
+                return
+            self.periods[slot] = period
+            self.counts[slot] = 0
+        self.counts[slot] += count
+
+    def total(self, now: float) -> int:
+        oldest = int(now // self.width) - self.slots
+        return sum(count for count, period in zip(self.counts, self.periods) if period > oldest)
+
+
+class AlertCounters:
+    """{(zone_id, severity): {window: RingCounter}}"""
+
+    def __init__(self, windows: Dict[str, int], slots: int = 60):
+        self.windows = windows
+        self.slots = slots
+        self._counters: Dict[Tuple[str, str], Dict[str, RingCounter]] = {}
+        # Alert readings counted by add_many that catch_up has not seen yet
+        self._local: Set[str] = set()
+
+    @property
+    def longest(self) -> int:
+        return max(self.windows.values())
+
+    def clear(self):
+        self._counters = {}
+        self._local = set()
+
+    def add(self, zone_id: str, severity: str, timestamp: datetime, now: Optional[float] = None):
+        if severity not in ALERT_SEVERITIES:
+            return
+        now = time.time() if now is None else now
+        at = as_epoch(timestamp)
+        if at <= now - self.longest:
+            return
+        counters = self._counters.get((zone_id, severity))
+        if counters is None:
+            counters = self._counters[(zone_id, severity)] = {
+                name: RingCounter(window, self.slots) for name, window in self.windows.items()
+            }
+        for counter in counters.values():
+            counter.add(at, now)
+
+    def add_many(self, readings: Iterable[Tuple[str, str, str, datetime]]):
+        """Count readings stored by this process: (reading_id, zone_id, severity, timestamp)"""
+        now = time.time()
+        for reading_id, zone_id, severity, timestamp in readings:
+            if severity in ALERT_SEVERITIES:
+                self._local.add(reading_id)
+                self.add(zone_id, severity, timestamp, now)
+
+    def _empty(self) -> Dict[str, Dict[str, int]]:
+        return {name: {severity: 0 for severity in ALERT_SEVERITIES} for name in self.windows}
+
+    def stats(self, zone_id: Optional[str] = None) -> dict:
+        """Totals and per-zone counts for every window"""
+        now = time.time()
+        totals = self._empty()
+        zones: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (counter_zone, severity), counters in self._counters.items():
+            if zone_id is not None and counter_zone != zone_id:
+                continue
+            zone = zones.setdefault(counter_zone, self._empty())
+            for name, counter in counters.items():
+                count = counter.total(now)
+                zone[name][severity] = count
+                totals[name][severity] += count
+        return {"windows": list(self.windows), "totals": totals, "zones": zones}
+
+    def count(self, severity: str, window: str) -> int:
+        now = time.time()
+        return sum(
+            counters[window].total(now)
+            for (_, counter_severity), counters in self._counters.items()
+            if counter_severity == severity
+        )
+
+    async def rebuild(self, db, change_sequence) -> int:
+        """Recount the longest window from sensor_data; returns the cursor the count covers
+
+        Readings changed after that cursor, including ones this process
+        stores while the recount runs, are counted by the next ``catch_up``.
+        """
+        cursor = await change_sequence.cursor(db, "sensor_data")
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.longest)
+        rebuilt = AlertCounters(self.windows, self.slots)
+        now = time.time()
+        for severity in ALERT_SEVERITIES:
+            readings = db.sensor_data.find(
+                {"alert_level": severity, "timestamp": {"$gte": since}, "change_seq": {"$not": {"$gt": cursor}}},
+                {"_id": 0, "zone_id": 1, "timestamp": 1},
+            )
+            async for reading in readings:
+                rebuilt.add(reading["zone_id"], severity, reading["timestamp"], now)
+        self._counters = rebuilt._counters
+        self._local = set()
+        return cursor
+
+    async def catch_up(self, db, change_sequence, since: int) -> int:
+        """Count alert readings stored after cursor ``since`` by other processes; returns the next cursor"""
+        try:
+            readings, cursor = await change_sequence.changes_since(
+                db, "sensor_data", since, {"alert_level": {"$in": list(ALERT_SEVERITIES)}}
+            )
+        except CursorExpired:
+            # sensor_data was cleared
+            return await self.rebuild(db, change_sequence)
+        now = time.time()
+        for reading in readings:
+            if reading["id"] in self._local:
+                self._local.discard(reading["id"])
+            else:
+                self.add(reading["zone_id"], reading["alert_level"], reading["timestamp"], now)
+        return cursor
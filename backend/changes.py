@@ -0,0 +1,86 @@
+"""Monotonic change sequence numbers for delta sync (``?since=<cursor>``)
+
+Every insert or update of a synced collection stamps ``change_seq`` with a
+number reserved from the ``change_counters`` collection. A client that holds
+cursor N asks for documents with change_seq > N and gets back a new cursor.
+
+A number is reserved before its write commits, so a later number can become
+visible first. While this process has writes in flight, cursors stop just
+below the oldest of them, so a client does not skip past a write that has
+not landed yet.
+
+Deletes leave nothing to stamp. A bulk delete runs inside ``reset``, which
+records a reset number for the collection; a cursor older than that raises
+CursorExpired, and the client reloads the full list to get a new cursor.
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+
+COUNTER_COLLECTION = "change_counters"
+
+
+class CursorExpired(Exception):
+    """Raised when a cursor predates a reset of the collection"""
+
+
+class ChangeSequence:
+    def __init__(self):
+        self._in_flight: Dict[str, List[int]] = {}
+
+    @asynccontextmanager
+    async def reserve(self, db, collection: str, count: int = 1) -> AsyncIterator[int]:
+        """Reserve ``count`` consecutive numbers for ``collection`` and yield the first"""
+        counter = await db[COUNTER_COLLECTION].find_one_and_update(
+            {"_id": collection},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = counter["seq"] - count + 1
+        in_flight = self._in_flight.setdefault(collection, [])
+        in_flight.append(first)
+        try:
+            yield first
+        finally:
+            in_flight.remove(first)
+
+    @asynccontextmanager
+    async def reset(self, db, collection: str) -> AsyncIterator[int]:
+        """Wrap a bulk delete of ``collection``; cursors issued before it ends expire"""
+        async with self.reserve(db, collection) as number:
+            await db[COUNTER_COLLECTION].update_one({"_id": collection}, {"$max": {"reset_seq": number}})
+            yield number
+
+    def _cursor(self, collection: str, counter: Optional[dict]) -> int:
+        current = counter["seq"] if counter else 0
+        in_flight = self._in_flight.get(collection)
+        if in_flight:
+            current = min(current, min(in_flight) - 1)
+        return current
+
+    async def cursor(self, db, collection: str) -> int:
+        """Highest number a client can safely resume from right now"""
+        return self._cursor(collection, await db[COUNTER_COLLECTION].find_one({"_id": collection}))
+
+    async def changes_since(self, db, collection: str, since: int, query: Optional[dict] = None,
+                            limit: Optional[int] = None):
+        """Documents changed after ``since`` in change order, and the cursor to resume from
+
+        When ``limit`` cuts the page short the cursor is the last returned
+        document, so the client keeps paging until it gets a short page.
+        Raises CursorExpired if the collection was reset after ``since``.
+        """
+        counter = await db[COUNTER_COLLECTION].find_one({"_id": collection})
+        if counter and since < counter.get("reset_seq", 0):
+            raise CursorExpired(f"Cursor {since} predates a reset of {collection}")
+        cursor = self._cursor(collection, counter)
+        find = db[collection].find({**(query or {}), "change_seq": {"$gt": since, "$lte": cursor}}).sort("change_seq", 1)
+        if limit:
+            find = find.limit(limit)
+        documents = await find.to_list(length=None)
+        if limit and len(documents) == limit:
+            cursor = documents[-1]["change_seq"]
+        return documents, max(cursor, since)
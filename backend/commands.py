@@ -0,0 +1,314 @@
+"""Outbound valve and drone commands, batched per gateway
+
+``CommandBus.submit`` queues a command for the gateway that drives the
+device. Pending commands are keyed by (kind, device_id), so a newer command
+for the same valve or drone replaces one that has not gone out yet. All
+commands for a gateway that arrive within ``batch_interval`` are published as
+one message. Once sent, a command waits for an ack from the gateway. If no
+ack arrives within ``ack_timeout`` it is resent, up to ``max_attempts`` sends,
+unless a newer command for the same device has replaced it.
+
+Transports deliver one batch to one gateway:
+
+* ``MqttTransport`` publishes to ``<prefix>/<gateway>/cmd`` on a broker such
+  as mosquitto and reads acks from ``<prefix>/<gateway>/ack``. It needs the
+  optional ``paho-mqtt`` package.
+* ``InProcessTransport`` hands batches to in-process queues. Nothing outside
+  the process receives them, so gateways poll ``GET /api/commands`` for the
+  commands waiting on them and ack over HTTP. Also used by tests.
+
+A batch message is ``{"gateway", "sent_at", "commands": [{"id", "kind",
+"device_id", "payload", "attempt"}]}`` and an ack is ``{"ids": [...]}``.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from common import latency_summary
+
+
+logger = logging.getLogger(__name__)
+
+VALVE = "valve"
+MISSION = "mission"
+
+AckHandler = Callable[[str, List[str]], None]
+
+
+class Command:
+    __slots__ = ("id", "gateway", "kind", "device_id", "payload", "created", "sent", "attempts")
+
+    def __init__(self, gateway: str, kind: str, device_id: str, payload: dict):
+        self.id = uuid.uuid4().hex[:16]
+        self.gateway = gateway
+        self.kind = kind
+        self.device_id = device_id
+        self.payload = payload
+        self.created = time.monotonic()
+        self.sent: Optional[float] = None
+        self.attempts = 0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.kind, self.device_id
+
+    def message(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "device_id": self.device_id, "payload": self.payload, "attempt": self.attempts}
+
+
+class InProcessTransport:
+    """Batches go to queues from ``subscribe``; acks come in through ``ack``"""
+
+    def __init__(self, history: int = 100):
+        self.subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self.published = deque(maxlen=history)
+        self._on_ack: Optional[AckHandler] = None
+
+    async def start(self, on_ack: AckHandler):
+        self._on_ack = on_ack
+
+    async def publish(self, gateway: str, message: dict):
+        self.published.append(message)
+        for queue in self.subscribers.get(gateway, []) + self.subscribers.get("*", []):
+            queue.put_nowait(message)
+
+    def subscribe(self, gateway: str = "*") -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(gateway, []).append(queue)
+        return queue
+
+    def ack(self, gateway: str, ids: List[str]):
+        if self._on_ack is not None:
+            self._on_ack(gateway, ids)
+
+    async def close(self):
+        self.subscribers = {}
+
+
+class MqttTransport:
+    """QoS 1 publishes to ``<prefix>/<gateway>/cmd``; acks subscribed on ``<prefix>/+/ack``
+
+    paho runs its own network thread, reconnects by itself and re-subscribes
+    on every connect. Acks are handed back to the event loop thread.
+    """
+
+    def __init__(self, host: str, port: int = 1883, topic_prefix: str = "smartfarm",
+                 client_id: Optional[str] = None, username: Optional[str] = None, password: Optional[str] = None,
+                 keepalive: int = 30):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError as exc:
+            raise RuntimeError("The mqtt command transport needs the paho-mqtt package") from exc
+        self._mqtt = mqtt
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.topic_prefix = topic_prefix.rstrip("/")
+        client_id = client_id or f"smartfarm-backend-{uuid.uuid4().hex[:8]}"
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            self.client = mqtt.Client(client_id=client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._on_ack: Optional[AckHandler] = None
+
+    async def start(self, on_ack: AckHandler):
+        self._loop = asyncio.get_running_loop()
+        self._on_ack = on_ack
+        # connect_async + loop_start: a broker that is down does not block startup
+        self.client.connect_async(self.host, self.port, keepalive=self.keepalive)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        client.subscribe(f"{self.topic_prefix}/+/ack", qos=1)
+        logger.info("Command transport connected to MQTT broker %s:%d", self.host, self.port)
+
+    def _on_message(self, client, userdata, message):
+        parts = message.topic.split("/")
+        try:
+            ids = json.loads(message.payload)["ids"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed command ack on %s", message.topic)
+            return
+        if len(parts) >= 2 and self._loop is not None and self._on_ack is not None:
+            self._loop.call_soon_threadsafe(self._on_ack, parts[-2], [str(command_id) for command_id in ids])
+
+    async def publish(self, gateway: str, message: dict):
+        info = self.client.publish(f"{self.topic_prefix}/{gateway}/cmd", json.dumps(message, separators=(",", ":")), qos=1)
+        if info.rc != self._mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f"MQTT publish to gateway {gateway} failed ({self._mqtt.error_string(info.rc)})")
+
+    async def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class CommandBus:
+    def __init__(self, transport, batch_interval: float = 0.05, ack_timeout: float = 5.0, max_attempts: int = 3,
+                 max_unacked: int = 10000):
+        self.transport = transport
+        self.batch_interval = batch_interval
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.max_unacked = max_unacked
+        self._pending: Dict[str, Dict[Tuple[str, str], Command]] = {}  # gateway -> key -> command
+        # id -> command; kept in send order, so the first entry is the next to time out
+        self._unacked: Dict[str, Command] = {}
+        self._latest: Dict[Tuple[str, str, str], str] = {}  # (gateway, kind, device_id) -> newest command id
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.sent = 0
+        self.resent = 0
+        self.acked = 0
+        self.failed = 0
+        self.failed_publishes = 0
+        self._latencies = deque(maxlen=512)
+
+    async def start(self):
+        if self._task is None:
+            await self.transport.start(self.ack)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self._pending:
+                # Queued by the last work before shutdown; sent once, without waiting for acks
+                await self._send()
+            await self.transport.close()
+
+    def submit(self, gateway: str, kind: str, device_id: str, payload: dict) -> str:
+        """Queue a command and return its id; replaces an unsent command for the same device"""
+        command = Command(gateway, kind, device_id, payload)
+        pending = self._pending.setdefault(gateway, {})
+        if pending.pop(command.key, None) is not None:
+            self.coalesced += 1
+        pending[command.key] = command
+        self._latest[(gateway, kind, device_id)] = command.id
+        self.submitted += 1
+        self._wakeup.set()
+        return command.id
+
+    def submit_many(self, commands: Iterable[Tuple[str, str, str, dict]]) -> List[str]:
+        """``submit`` for (gateway, kind, device_id, payload) tuples"""
+        return [self.submit(gateway, kind, device_id, payload) for gateway, kind, device_id, payload in commands]
+
+    def ack(self, gateway: Optional[str], ids: Iterable[str]) -> List[str]:
+        """Mark commands delivered; returns the ids that were not waiting for an ack from ``gateway``"""
+        now = time.monotonic()
+        unknown = []
+        for command_id in ids:
+            command = self._unacked.get(command_id)
+            if command is None or (gateway is not None and command.gateway != gateway):
+                unknown.append(command_id)
+                continue
+            del self._unacked[command_id]
+            self._forget(command)
+            self.acked += 1
+            self._latencies.append((now - command.created) * 1000)
+        return unknown
+
+    def _forget(self, command: Command):
+        latest = (command.gateway, command.kind, command.device_id)
+        if self._latest.get(latest) == command.id:
+            del self._latest[latest]
+
+    def unacked(self, gateway: Optional[str] = None, limit: int = 100) -> List[dict]:
+        commands = (command for command in self._unacked.values() if gateway is None or command.gateway == gateway)
+        return [{"gateway": command.gateway, **command.message()} for _, command in zip(range(limit), commands)]
+
+    def clear(self):
+        self._pending = {}
+        self._unacked = {}
+        self._latest = {}
+
+    def _expire(self, now: float):
+        """Requeue commands whose ack is overdue, or give up on them after max_attempts"""
+        failed: Dict[str, int] = {}
+        while self._unacked:
+            command_id, command = next(iter(self._unacked.items()))
+            overflow = len(self._unacked) > self.max_unacked
+            if not overflow and command.sent + self.ack_timeout > now:
+                break
+            del self._unacked[command_id]
+            if self._latest.get((command.gateway, command.kind, command.device_id)) != command.id:
+                continue  # replaced by a newer command for the device
+            if overflow or command.attempts >= self.max_attempts:
+                self._forget(command)
+                self.failed += 1
+                failed[command.gateway] = failed.get(command.gateway, 0) + 1
+                continue
+            self._pending.setdefault(command.gateway, {}).setdefault(command.key, command)
+            self.resent += 1
+        if failed:
+            logger.warning("Gave up on %d unacked commands for gateways %s", sum(failed.values()), ", ".join(sorted(failed)[:10]))
+
+    async def _send(self):
+        pending, self._pending = self._pending, {}
+        now = time.monotonic()
+        for gateway, commands in pending.items():
+            for command in commands.values():
+                command.attempts += 1
+                command.sent = now
+            message = {"gateway": gateway, "sent_at": time.time(), "commands": [command.message() for command in commands.values()]}
+            try:
+                await self.transport.publish(gateway, message)
+            except Exception:
+                # Left unacked, so the batch is retried after ack_timeout like a lost one
+                logger.exception("Publishing %d commands to gateway %s failed", len(commands), gateway)
+                self.failed_publishes += 1
+            else:
+                self.batches += 1
+                self.sent += len(commands)
+            for command in commands.values():
+                self._unacked.pop(command.id, None)
+                self._unacked[command.id] = command
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            self._expire(time.monotonic())
+            if self._pending:
+                # Let the rest of a burst arrive so a gateway gets one message
+                await asyncio.sleep(self.batch_interval)
+                await self._send()
+                continue
+            timeout = None
+            if self._unacked:
+                timeout = max(next(iter(self._unacked.values())).sent + self.ack_timeout - time.monotonic(), 0.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "transport": type(self.transport).__name__,
+            "pending": sum(len(commands) for commands in self._pending.values()),
+            "unacked": len(self._unacked),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "sent": self.sent,
+            "resent": self.resent,
+            "acked": self.acked,
+            "failed": self.failed,
+            "failed_publishes": self.failed_publishes,
+            "ack_latency_ms": latency_summary(self._latencies),
+        }
@@ -0,0 +1,88 @@
+"""Small helpers shared by the backend services and their maintenance CLIs"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from pymongo.errors import BulkWriteError
+
+
+# MongoDB's E11000: an insert or upsert collided with a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """Timezone-aware datetime for a stored timestamp; None for anything else
+
+    Timestamps are stored both as datetimes and as ISO strings, and Mongo hands
+    datetimes back naive, in UTC.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if not isinstance(value, datetime):
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def as_epoch(value) -> Optional[float]:
+    """Unix seconds for a stored timestamp (see ``as_datetime``); None for anything else"""
+    value = as_datetime(value)
+    return None if value is None else value.timestamp()
+
+
+async def bulk_write_upserts(collection, ops: list):
+    """Ordered bulk_write of $inc/$set upserts that tolerates a concurrent writer
+
+    Two writers upserting the same new document: the loser hits the unique
+    index, so it retries from the failed operation, which now matches the
+    winner's document.
+    """
+    try:
+        await collection.bulk_write(ops, ordered=True)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if not errors or errors[0].get("code") != DUPLICATE_KEY_ERROR:
+            raise
+        await collection.bulk_write(ops[errors[0]["index"]:], ordered=True)
+
+
+def latency_summary(latencies: Iterable[float]) -> dict:
+    """last / avg / p99 of recent latencies in milliseconds, oldest first"""
+    latencies = list(latencies)
+    if not latencies:
+        return {"last": None, "avg": None, "p99": None}
+    ordered = sorted(latencies)
+    return {
+        "last": round(latencies[-1], 3),
+        "avg": round(sum(ordered) / len(ordered), 3),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    }
+
+
+def maintenance_cli(help: str):
+    """Typer app for a ``python <module>.py <command>`` maintenance script"""
+    import typer
+
+    cli = typer.Typer(help=help)
+
+    # Without a callback typer runs a lone command without its name, so
+    # "python rollups.py backfill" would reject "backfill" as an extra argument
+    @cli.callback()
+    def main():
+        pass
+
+    return cli
+
+
+def run_with_db(action: Callable[[Any], Awaitable[Any]]) -> Any:
+    """Run ``action(db)`` against the database configured in backend/.env"""
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        return asyncio.run(action(client[os.environ['DB_NAME']]))
+    finally:
+        client.close()
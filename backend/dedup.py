@@ -0,0 +1,60 @@
+"""Bounded sliding-window cache of recently ingested (device_id, sequence) keys"""
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class DedupCache:
+    """Remembers keys for ``window`` seconds, holding at most ``max_entries``.
+
+    Keys are kept in arrival order, so eviction of the oldest entry (by age or
+    by size) is O(1). A miss here is not proof of novelty - the unique index on
+    ``sensor_data`` is the backstop for retransmits older than the window.
+    """
+
+    def __init__(self, max_entries: int = 100000, window: float = 3600.0):
+        self.max_entries = max_entries
+        self.window = window
+        self._seen = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff:
+                break
+            self._seen.popitem(last=False)
+
+    def check_and_add(self, key: Hashable) -> bool:
+        """Return True if ``key`` was already seen, otherwise remember it"""
+        now = time.monotonic()
+        self._expire(now)
+        if key in self._seen:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return False
+
+    def discard(self, key: Hashable):
+        """Forget a key whose write failed so a retransmit is not dropped"""
+        self._seen.pop(key, None)
+
+    def clear(self):
+        self._seen = OrderedDict()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "window_seconds": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,96 @@
+"""One-shot drone-to-task assignment for simultaneous zone alerts
+
+Costs are round-trip distances from every candidate drone to every task,
+computed as one NumPy haversine matrix. Pairs the drone cannot fly (wrong
+payload, too little payload or battery for the round trip) are marked
+infeasible. The matrix is solved with the Hungarian method
+(shortest augmenting paths, vectorized over columns), which minimizes the
+total distance flown while keeping the number of infeasible pairs to a
+minimum.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mission_planner import usable_range_m
+from spatial import EARTH_RADIUS_M
+
+
+def distance_matrix(from_lat: np.ndarray, from_lng: np.ndarray,
+                    to_lat: np.ndarray, to_lng: np.ndarray) -> np.ndarray:
+    """Haversine distances in meters, shape (len(from), len(to))"""
+    phi1 = np.radians(from_lat)[:, None]
+    phi2 = np.radians(to_lat)[None, :]
+    dlambda = np.radians(to_lng)[None, :] - np.radians(from_lng)[:, None]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def solve_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """Minimum-cost matching of rows to columns; every row is matched when rows <= columns"""
+    if cost.size == 0:
+        return []
+    if cost.shape[0] > cost.shape[1]:
+        return [(row, col) for col, row in solve_assignment(cost.T)]
+
+    rows, cols = cost.shape
+    u = np.zeros(rows + 1)
+    v = np.zeros(cols + 1)
+    owner = np.zeros(cols + 1, dtype=int)  # owner[j] = 1-based row matched to column j, 0 if free
+    way = np.zeros(cols + 1, dtype=int)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        column = 0
+        slack = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = owner[column]
+            free = ~used[1:]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            better = free & (reduced < slack[1:])
+            slack[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, slack[1:], np.inf)
+            nxt = int(np.argmin(candidates)) + 1
+            delta = candidates[nxt - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            slack[~used] -= delta
+            column = nxt
+            if owner[column] == 0:
+                break
+        # Flip the augmenting path back to the root
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+    return sorted((owner[col] - 1, col - 1) for col in range(1, cols + 1) if owner[col])
+
+
+def plan_dispatch(drone_lat: Sequence[float], drone_lng: Sequence[float], drone_battery: Sequence[float],
+                  drone_payload: Sequence[float], drone_payload_type: Sequence[Optional[str]],
+                  task_lat: Sequence[float], task_lng: Sequence[float], task_payload_type: Sequence[Optional[str]],
+                  full_range_m: float, reserve_percent: float, min_payload: float) -> List[Tuple[int, int, float]]:
+    """(task index, drone index, distance_m) for every task that gets a feasible drone"""
+    if not len(drone_lat) or not len(task_lat):
+        return []
+    distance = distance_matrix(np.asarray(drone_lat, float), np.asarray(drone_lng, float),
+                               np.asarray(task_lat, float), np.asarray(task_lng, float)).T
+
+    battery = np.asarray(drone_battery, float)
+    reach = np.array([usable_range_m(full_range_m, level, reserve_percent) for level in battery])
+    feasible = (2 * distance <= reach[None, :]) & (np.asarray(drone_payload, float) >= min_payload)[None, :]
+    # A drone carrying a payload only takes tasks for that payload
+    loaded = np.array([kind or "" for kind in drone_payload_type], dtype=object)
+    wanted = np.array([kind or "" for kind in task_payload_type], dtype=object)
+    feasible &= (loaded[None, :] == "") | (wanted[:, None] == "") | (loaded[None, :] == wanted[:, None])
+
+    # Any single infeasible pair costs more than every feasible pair together
+    penalty = (float(distance[feasible].sum()) if feasible.any() else 0.0) + 1.0
+    cost = np.where(feasible, distance, penalty)
+    return [
+        (task, drone, float(distance[task, drone]))
+        for task, drone in solve_assignment(cost)
+        if feasible[task, drone]
+    ]
@@ -0,0 +1,180 @@
+"""In-process drone fleet state fed by high-rate telemetry
+
+Telemetry updates a compact per-drone record in memory. Changed drones are
+written back to the ``drones`` collection in one bulk_write per interval, or
+straight away when their status changes. The map's position list is rebuilt
+only when the fleet changed since it was last served.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from changes import CursorExpired
+from common import as_epoch
+from spatial import PointGrid
+
+
+class DroneState:
+    __slots__ = (
+        "id", "name", "status", "lat", "lng", "altitude", "heading", "speed",
+        "battery", "payload", "payload_type", "target_lat", "target_lng", "updated", "dirty",
+    )
+
+    # state attribute -> drones document field
+    FIELDS = {
+        "name": "drone_name",
+        "status": "status",
+        "lat": "current_lat",
+        "lng": "current_lng",
+        "altitude": "altitude",
+        "heading": "heading",
+        "speed": "speed",
+        "battery": "battery_level",
+        "payload": "payload_remaining",
+        "payload_type": "payload_type",
+        "target_lat": "target_lat",
+        "target_lng": "target_lng",
+    }
+
+    def __init__(self, document: dict):
+        self.id = document["id"]
+        for attribute, field in self.FIELDS.items():
+            setattr(self, attribute, document.get(field))
+        self.updated = as_epoch(document.get("last_updated")) or 0.0
+        self.dirty = False
+
+    def document(self) -> dict:
+        fields = {field: getattr(self, attribute) for attribute, field in self.FIELDS.items()}
+        fields["last_updated"] = datetime.fromtimestamp(self.updated, tz=timezone.utc)
+        return fields
+
+    def position(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "battery": self.battery,
+            "payload": self.payload,
+            "payload_type": self.payload_type or "unknown",
+            "position": [self.lat, self.lng],
+            "target": [self.target_lat, self.target_lng] if self.target_lat else None,
+            "altitude": self.altitude,
+            "heading": self.heading,
+            "speed": self.speed,
+        }
+
+
+class FleetStore:
+    def __init__(self, cell_degrees: float = 0.01):
+        self.drones: Dict[str, DroneState] = {}
+        self.grid = PointGrid(cell_degrees)
+        self._positions: Optional[List[dict]] = None
+        self.telemetry_count = 0
+        self.persisted_count = 0
+
+    def __contains__(self, drone_id: str) -> bool:
+        return drone_id in self.drones
+
+    def clear(self):
+        self.drones = {}
+        self.grid.clear()
+        self._positions = None
+
+    def merge_document(self, document: dict):
+        """Take a drones document unless the in-memory record is newer or not yet persisted"""
+        current = self.drones.get(document["id"])
+        if current is not None and (current.dirty or current.updated >= (as_epoch(document.get("last_updated")) or 0.0)):
+            return
+        drone = self.drones[document["id"]] = DroneState(document)
+        self._index(drone)
+        self._positions = None
+
+    async def load(self, db):
+        """Merge the drones collection into memory, dropping drones that were deleted"""
+        seen = set()
+        async for document in db.drones.find({}, {"_id": 0}):
+            seen.add(document["id"])
+            self.merge_document(document)
+        for drone_id in set(self.drones) - seen:
+            del self.drones[drone_id]
+            self.grid.remove(drone_id)
+            self._positions = None
+
+    async def sync(self, db, change_sequence, since: int) -> int:
+        """Merge drones persisted after cursor ``since`` and return the next cursor
+
+        Falls back to a full ``load`` when drones were deleted since then.
+        """
+        try:
+            documents, cursor = await change_sequence.changes_since(db, "drones", since)
+        except CursorExpired:
+            cursor = await change_sequence.cursor(db, "drones")
+            await self.load(db)
+            return cursor
+        for document in documents:
+            self.merge_document(document)
+        return cursor
+
+    def update(self, drone_id: str, fields: Dict[str, object], at: Optional[float] = None) -> Optional[str]:
+        """Apply changed state attributes; returns the previous status when the status changed"""
+        drone = self.drones[drone_id]
+        previous_status = drone.status
+        for attribute, value in fields.items():
+            if value is not None:
+                setattr(drone, attribute, value)
+        drone.updated = time.time() if at is None else at
+        drone.dirty = True
+        if fields.get("lat") is not None or fields.get("lng") is not None:
+            self._index(drone)
+        self._positions = None
+        return previous_status if drone.status != previous_status else None
+
+    def _index(self, drone: DroneState):
+        if drone.lat is not None and drone.lng is not None:
+            self.grid.put(drone.id, drone.lat, drone.lng)
+
+    def nearest(self, lat: float, lng: float, limit: int, min_battery: float = 0.0,
+                statuses: Optional[Set[str]] = None) -> List[Tuple[float, DroneState]]:
+        """Closest drones to a point with enough battery and, if given, one of ``statuses``"""
+        def accept(drone_id: str) -> bool:
+            drone = self.drones[drone_id]
+            return (drone.battery or 0.0) >= min_battery and (not statuses or drone.status in statuses)
+
+        return [(distance, self.drones[drone_id]) for distance, drone_id in self.grid.nearest(lat, lng, limit, accept)]
+
+    def positions(self) -> List[dict]:
+        if self._positions is None:
+            self._positions = [drone.position() for drone in self.drones.values()]
+        return self._positions
+
+    async def persist(self, db, change_sequence, drone_ids: Optional[List[str]] = None) -> int:
+        """Write dirty drones (or just ``drone_ids``) to the drones collection in one bulk_write"""
+        candidates = [self.drones[drone_id] for drone_id in drone_ids if drone_id in self.drones] if drone_ids else self.drones.values()
+        dirty = [drone for drone in candidates if drone.dirty]
+        if not dirty:
+            return 0
+        for drone in dirty:
+            drone.dirty = False
+        try:
+            async with change_sequence.reserve(db, "drones", len(dirty)) as first:
+                ops = [
+                    UpdateOne({"id": drone.id}, {"$set": {**drone.document(), "change_seq": first + offset}})
+                    for offset, drone in enumerate(dirty)
+                ]
+                await db.drones.bulk_write(ops, ordered=False)
+        except Exception:
+            for drone in dirty:
+                drone.dirty = True
+            raise
+        self.persisted_count += len(dirty)
+        return len(dirty)
+
+    def stats(self) -> dict:
+        return {
+            "drones": len(self.drones),
+            "dirty": sum(1 for drone in self.drones.values() if drone.dirty),
+            "telemetry": self.telemetry_count,
+            "persisted": self.persisted_count,
+        }
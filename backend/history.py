@@ -0,0 +1,114 @@
+"""Time-bucketed sensor history (mean/min/max per sensor type) for charts
+
+Buckets of an hour or more are computed from the hourly rollups, so a 30-day
+window touches at most 720 x sensor types x zones small documents. Sub-hour
+buckets group raw sensor_data on the (zone_id, timestamp) / timestamp indexes.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import resample
+from common import as_datetime
+from rollups import ROLLUP_COLLECTION
+
+
+BUCKET_WIDTHS = {"5m": 300, "1h": 3600, "1d": 86400}  # seconds
+
+
+def from_rollups(width: int) -> bool:
+    """Whole-hour buckets are summed from the hourly rollups; shorter ones group raw readings"""
+    return width % 3600 == 0
+
+
+def bucket_start(timestamp: datetime, width: int) -> datetime:
+    """Start of the UTC-aligned bucket containing ``timestamp``"""
+    seconds = int(timestamp.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % width, tz=timezone.utc)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _bucket_expression(field: str, width: int) -> dict:
+    # date - date is milliseconds and date - milliseconds is a date, so this
+    # truncates the field to the start of its bucket
+    return {"$subtract": [f"${field}", {"$mod": [{"$subtract": [f"${field}", EPOCH]}, width * 1000]}]}
+
+
+async def aggregate_history(db, start: datetime, width: int, zone_id: Optional[str] = None) -> List[dict]:
+    """Return {bucket, sensor_type, count, sum, min, max} for every non-empty bucket since ``start``"""
+    if from_rollups(width):
+        collection = db[ROLLUP_COLLECTION]
+        time_field = "bucket"
+        group = {"count": {"$sum": "$count"}, "sum": {"$sum": "$sum"}, "min": {"$min": "$min"}, "max": {"$max": "$max"}}
+    else:
+        collection = db.sensor_data
+        time_field = "timestamp"
+        group = {"count": {"$sum": 1}, "sum": {"$sum": "$value"}, "min": {"$min": "$value"}, "max": {"$max": "$value"}}
+
+    match = {time_field: {"$gte": start}}
+    if zone_id:
+        match["zone_id"] = zone_id
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"bucket": _bucket_expression(time_field, width), "sensor_type": "$sensor_type"},
+            **group,
+        }},
+    ]
+
+    series = []
+    async for row in collection.aggregate(pipeline, allowDiskUse=True):
+        series.append({
+            "bucket": as_datetime(row["_id"]["bucket"]),
+            "sensor_type": row["_id"]["sensor_type"],
+            "count": row["count"],
+            "sum": row["sum"],
+            "min": row["min"],
+            "max": row["max"],
+        })
+    return series
+
+
+def chart_rows(series: List[dict], start: datetime, width: int, buckets: int,
+               fill: str = "none", max_points: Optional[int] = None) -> List[Dict]:
+    """Lay the series out as rows of {"time", type, type_min, type_max}
+
+    Without downsampling there is one row per bucket. When the grid is longer
+    than ``max_points`` each sensor type keeps its own LTTB-selected buckets,
+    so a row only carries the types that selected it.
+    """
+    points = [
+        (int((point["bucket"] - start).total_seconds() // width), point["sensor_type"],
+         point["count"], point["sum"], point["min"], point["max"])
+        for point in series
+    ]
+    dense = resample.dense_series(points, buckets)
+    for stats in dense.values():
+        for field in ("mean", "min", "max"):
+            stats[field] = resample.fill_gaps(stats[field], fill)
+
+    if max_points and buckets > max_points:
+        picks = resample.downsample({sensor_type: stats["mean"] for sensor_type, stats in dense.items()}, max_points)
+        rows = {}
+    else:
+        picks = {sensor_type: np.flatnonzero(~np.isnan(stats["mean"])) for sensor_type, stats in dense.items()}
+        rows = {i: {} for i in range(buckets)}
+
+    for sensor_type, indices in picks.items():
+        stats = dense[sensor_type]
+        means = np.round(stats["mean"][indices], 2).tolist()
+        lows = np.round(stats["min"][indices], 2).tolist()
+        highs = np.round(stats["max"][indices], 2).tolist()
+        for index, mean, low, high in zip(indices.tolist(), means, lows, highs):
+            row = rows.setdefault(index, {})
+            row[sensor_type] = mean
+            row[f"{sensor_type}_min"] = low
+            row[f"{sensor_type}_max"] = high
+
+    return [
+        {"time": (start + timedelta(seconds=width * index)).isoformat(), **rows[index]}
+        for index in sorted(rows)
+    ]
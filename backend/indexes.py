@@ -0,0 +1,130 @@
+"""Declared MongoDB indexes, ensured idempotently at startup"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+
+logger = logging.getLogger(__name__)
+
+
+def unique_id(collection: str) -> IndexModel:
+    return IndexModel([("id", ASCENDING)], name=f"{collection}_id_unique", unique=True)
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "sensor_data": [
+        unique_id("sensor_data"),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+        IndexModel([("zone_id", ASCENDING), ("timestamp", DESCENDING)], name="zone_timestamp"),
+        IndexModel(
+            [("zone_id", ASCENDING), ("sensor_type", ASCENDING), ("timestamp", DESCENDING)],
+            name="zone_type_timestamp",
+        ),
+        # Alert queries only ever look at a small slice of the collection. Two partial
+        # indexes on the same keys with different filters need MongoDB 5.0+.
+        IndexModel(
+            [("alert_level", ASCENDING), ("timestamp", DESCENDING)],
+            name="alert_critical",
+            partialFilterExpression={"alert_level": "critical"},
+        ),
+        IndexModel(
+            [("alert_level", ASCENDING), ("timestamp", DESCENDING)],
+            name="alert_warning",
+            partialFilterExpression={"alert_level": "warning"},
+        ),
+        # Backstop for retransmits that fell out of the in-memory dedup window
+        IndexModel(
+            [("device_id", ASCENDING), ("sequence", ASCENDING)],
+            name="device_sequence_unique",
+            unique=True,
+            partialFilterExpression={"device_id": {"$type": "string"}, "sequence": {"$type": "number"}},
+        ),
+        IndexModel([("change_seq", ASCENDING)], name="change_seq"),
+    ],
+    "sensor_rollups_hourly": [
+        IndexModel(
+            [("zone_id", ASCENDING), ("sensor_type", ASCENDING), ("bucket", ASCENDING)],
+            name="zone_type_bucket_unique",
+            unique=True,
+        ),
+        IndexModel([("bucket", ASCENDING)], name="bucket"),
+    ],
+    "sensor_latest": [
+        IndexModel([("zone_id", ASCENDING), ("sensor_type", ASCENDING)], name="zone_type_unique", unique=True),
+    ],
+    "farm_zones": [
+        unique_id("farm_zones"),
+    ],
+    "irrigation_systems": [
+        unique_id("irrigation_systems"),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+        IndexModel([("zone_id", ASCENDING), ("created_at", DESCENDING)], name="zone_created_at"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("change_seq", ASCENDING)], name="change_seq"),
+    ],
+    "drones": [
+        unique_id("drones"),
+        IndexModel([("last_updated", DESCENDING)], name="last_updated"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("change_seq", ASCENDING)], name="change_seq"),
+    ],
+    "drone_tracks": [
+        IndexModel([("drone_id", ASCENDING), ("start", ASCENDING)], name="drone_start"),
+    ],
+    "usage_daily": [
+        IndexModel(
+            [("zone_id", ASCENDING), ("day", ASCENDING), ("source", ASCENDING), ("type", ASCENDING)],
+            name="zone_day_source_type_unique",
+            unique=True,
+        ),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "usage_events": [
+        IndexModel([("zone_id", ASCENDING), ("ended", DESCENDING)], name="zone_ended"),
+    ],
+}
+
+
+class IndexProvisioner:
+    """Ensures INDEXES exist and remembers the outcome of each build"""
+
+    def __init__(self, indexes: Dict[str, List[IndexModel]] = INDEXES):
+        self.indexes = indexes
+        self.status: Dict[str, dict] = {}
+        for collection, models in indexes.items():
+            for model in models:
+                name = model.document["name"]
+                self.status[f"{collection}.{name}"] = {
+                    "collection": collection,
+                    "name": name,
+                    "keys": dict(model.document["key"]),
+                    "status": "pending",
+                    "error": None,
+                    "finished_at": None,
+                }
+
+    async def ensure(self, db):
+        """Create each index in turn; an index that already exists is a no-op"""
+        for collection, models in self.indexes.items():
+            for model in models:
+                entry = self.status[f"{collection}.{model.document['name']}"]
+                entry["status"] = "building"
+                try:
+                    await db[collection].create_indexes([model])
+                    entry["status"] = "ready"
+                    entry["error"] = None
+                except Exception as e:
+                    # e.g. an index with the same keys but other options, or duplicate ids
+                    entry["status"] = "failed"
+                    entry["error"] = str(e)
+                    logger.error("Index %s.%s could not be built: %s", collection, entry["name"], e)
+                entry["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    def report(self) -> dict:
+        entries = list(self.status.values())
+        summary = {}
+        for entry in entries:
+            summary[entry["status"]] = summary.get(entry["status"], 0) + 1
+        return {"summary": summary, "indexes": entries}
@@ -0,0 +1,146 @@
+"""Write-behind buffer that groups sensor readings into batched Mongo writes"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional
+
+from common import latency_summary
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBufferFull(Exception):
+    """Raised when the buffer is at capacity and the caller should back off"""
+
+
+class IngestBuffer:
+    """Bounded in-process queue flushed by size or by time.
+
+    Items are handed to ``flush`` in lists of at most ``batch_size``. A batch is
+    written as soon as it is full, or ``flush_interval`` seconds after its first
+    item arrived, whichever comes first. If ``flush`` raises, the batch is put
+    back at the head of the queue and retried after ``flush_interval``.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[None]],
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.25,
+    ):
+        self._flush = flush
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._pending: List[Any] = []
+        self._first_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()  # clear while a batch is being flushed
+        self._idle.set()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._latencies = deque(maxlen=512)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, item: Any):
+        """Queue one item without waiting; raises IngestBufferFull when at capacity"""
+        if self._closing or len(self._pending) >= self.max_size:
+            self.rejected += 1
+            raise IngestBufferFull()
+        self._pending.append(item)
+        self.enqueued += 1
+        if len(self._pending) == 1:
+            self._first_at = time.monotonic()
+            self._wakeup.set()
+        elif len(self._pending) == self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not (self._closing and not self._pending):
+            if not self._pending:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            if len(self._pending) < self.batch_size and not self._closing:
+                delay = self._first_at + self.flush_interval - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    continue
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._first_at = time.monotonic() if self._pending else None
+
+            started = time.perf_counter()
+            self._idle.clear()
+            try:
+                await self._flush(batch)
+            except Exception:
+                logger.exception("Ingest flush of %d items failed, retrying", len(batch))
+                self.failed_flushes += 1
+                self._pending[:0] = batch
+                self._first_at = time.monotonic()
+                self._idle.set()
+                await asyncio.sleep(self.flush_interval)
+                continue
+            finally:
+                self._idle.set()
+
+            self._latencies.append((time.perf_counter() - started) * 1000)
+            self.flushes += 1
+            self.flushed += len(batch)
+
+    async def discard(self) -> int:
+        """Wait for a flush in progress, then drop everything still queued; returns how many were dropped"""
+        await self._idle.wait()
+        dropped = len(self._pending)
+        self._pending = []
+        self._first_at = None
+        return dropped
+
+    async def close(self, timeout: float = 10.0):
+        """Stop accepting items and flush whatever is still queued"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Ingest buffer drain timed out, %d readings were not written", len(self._pending))
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._pending),
+            "capacity": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flush_latency_ms": latency_summary(self._latencies),
+        }
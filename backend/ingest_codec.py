@@ -0,0 +1,83 @@
+"""Compact binary sensor frame decoder for constrained devices (ESP32/LoRa)
+
+Frame layout, all fields little-endian:
+
+    header v1  magic "SF" (2 bytes) | version u8 | record count u16
+    header v2  v1 header | device id u32 | first sequence number u32
+    record     zone id (16 raw UUID bytes) | sensor type code u8 | value float32 | timestamp u32
+
+A record is 25 bytes. The timestamp is Unix seconds; 0 means "use the time the
+server received the frame". In a v2 frame record ``i`` carries sequence number
+``first sequence + i`` so retransmitted frames can be deduplicated.
+"""
+import struct
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+
+FRAME_CONTENT_TYPE = "application/x-sensor-frame"
+FRAME_MAGIC = b"SF"
+FRAME_VERSIONS = (1, 2)
+
+HEADER = struct.Struct("<2sBH")
+DEVICE_HEADER = struct.Struct("<II")
+RECORD = struct.Struct("<16sBfI")
+
+# (zone_id, sensor type code, value, timestamp or None, sequence or None)
+FrameRecord = Tuple[str, int, float, Optional[datetime], Optional[int]]
+
+
+class FrameError(ValueError):
+    """Raised when a payload is not a well-formed sensor frame"""
+
+
+def decode_frame(payload: bytes) -> Tuple[Optional[str], List[FrameRecord]]:
+    """Decode a frame without copying the record area, returning (device_id, records)"""
+    view = memoryview(payload)
+    if len(view) < HEADER.size:
+        raise FrameError("Frame shorter than header")
+
+    magic, version, count = HEADER.unpack_from(view)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Bad frame magic")
+    if version not in FRAME_VERSIONS:
+        raise FrameError(f"Unsupported frame version {version}")
+
+    offset = HEADER.size
+    device_id = None
+    sequence = None
+    if version == 2:
+        if len(view) < offset + DEVICE_HEADER.size:
+            raise FrameError("Frame shorter than header")
+        device, sequence = DEVICE_HEADER.unpack_from(view, offset)
+        device_id = str(device)
+        offset += DEVICE_HEADER.size
+
+    body = view[offset:]
+    if len(body) != count * RECORD.size:
+        raise FrameError(f"Frame declares {count} records but carries {len(body)} bytes")
+
+    zone_ids = {}
+    records = []
+    for index, (zone_bytes, code, value, ts) in enumerate(RECORD.iter_unpack(body)):
+        zone_id = zone_ids.get(zone_bytes)
+        if zone_id is None:
+            zone_id = zone_ids[zone_bytes] = str(uuid.UUID(bytes=zone_bytes))
+        timestamp = datetime.fromtimestamp(ts, tz=timezone.utc) if ts else None
+        # float32 carries ~7 significant digits; trim the binary noise
+        records.append((zone_id, code, round(value, 3), timestamp, None if sequence is None else sequence + index))
+    return device_id, records
+
+
+def encode_frame(records: List[Tuple[str, int, float, Optional[datetime]]],
+                 device: Optional[int] = None, sequence: int = 0) -> bytes:
+    """Build a frame, mainly for tests and gateway simulators"""
+    if device is None:
+        out = bytearray(HEADER.pack(FRAME_MAGIC, 1, len(records)))
+    else:
+        out = bytearray(HEADER.pack(FRAME_MAGIC, 2, len(records)) + DEVICE_HEADER.pack(device, sequence))
+    for zone_id, code, value, timestamp in records:
+        ts = int(timestamp.timestamp()) if timestamp else 0
+        out += RECORD.pack(uuid.UUID(zone_id).bytes, code, value, ts)
+    return bytes(out)
@@ -0,0 +1,164 @@
+"""Deadline-driven start and stop of irrigation runs
+
+Each system has at most one pending event: a start at its ``scheduled_time``
+or a stop when its run's ``duration`` is over. Events sit in a min-heap keyed
+by deadline and the loop sleeps until the earliest one, so thousands of idle
+valves cost nothing between deadlines. Rescheduling a system leaves its old
+heap entry behind; stale entries are skipped when they reach the top and
+compacted away when they outnumber live ones.
+
+Due events are handed to ``execute`` in one batch. The heap is rebuilt from
+``irrigation_systems`` at startup and on every reload, so it survives
+restarts and picks up schedules written by other workers.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from common import as_epoch
+
+
+logger = logging.getLogger(__name__)
+
+START = "start"
+STOP = "stop"
+
+# (kind, system_id, token); a stop's token is the last_activated of the run it ends
+IrrigationEvent = Tuple[str, str, object]
+
+
+class IrrigationScheduler:
+    def __init__(self, execute: Callable[[List[IrrigationEvent]], Awaitable[None]],
+                 default_duration_minutes: int = 10, retry_delay: float = 5.0):
+        self._execute = execute
+        self.default_duration_minutes = default_duration_minutes
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[float, int, str, str, object]] = []
+        self._live: Dict[str, int] = {}  # system_id -> sequence number of its pending heap entry
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.executed = {START: 0, STOP: 0}
+        self.failed_batches = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, system_id: str, kind: str, at: float, token: object = None):
+        """Replace any pending event of the system with ``kind`` at epoch seconds ``at``"""
+        seq = next(self._counter)
+        self._live[system_id] = seq
+        heapq.heappush(self._heap, (at, seq, kind, system_id, token))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._compact()
+
+    def schedule_stop(self, system_id: str, activated, duration_minutes: Optional[int]):
+        """Stop the run that started at ``activated`` once its duration is over"""
+        minutes = duration_minutes if duration_minutes is not None else self.default_duration_minutes
+        self.schedule(system_id, STOP, as_epoch(activated) + minutes * 60, activated)
+
+    def cancel(self, system_id: str):
+        self._live.pop(system_id, None)
+
+    def clear(self):
+        self._heap = []
+        self._live = {}
+        self._wakeup.set()
+
+    def load(self, systems: Iterable[dict]):
+        """Rebuild from irrigation_systems documents, replacing every pending event"""
+        self._heap = []
+        self._live = {}
+        for system in systems:
+            status = system.get("status")
+            if status == "scheduled" and system.get("scheduled_time") is not None:
+                entry = (as_epoch(system["scheduled_time"]), START, None)
+            elif status == "active" and system.get("last_activated") is not None:
+                minutes = system.get("duration") or self.default_duration_minutes
+                entry = (as_epoch(system["last_activated"]) + minutes * 60, STOP, system["last_activated"])
+            else:
+                continue
+            seq = next(self._counter)
+            self._live[system["id"]] = seq
+            self._heap.append((entry[0], seq, entry[1], system["id"], entry[2]))
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._live.get(entry[3]) == entry[1]]
+        heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        while self._heap and self._live.get(self._heap[0][3]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: float) -> List[IrrigationEvent]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, seq, kind, system_id, token = heapq.heappop(self._heap)
+            if self._live.get(system_id) == seq:
+                del self._live[system_id]
+                due.append((kind, system_id, token))
+        return due
+
+    async def _run(self):
+        while True:
+            # Cleared before reading the deadline so a schedule() in between still wakes us
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            delay = None if deadline is None else deadline - time.time()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = self._pop_due(time.time())
+            try:
+                await self._execute(due)
+            except Exception:
+                logger.exception("Irrigation schedule batch of %d events failed, retrying", len(due))
+                self.failed_batches += 1
+                retry_at = time.time() + self.retry_delay
+                for kind, system_id, token in due:
+                    if system_id not in self._live:
+                        self.schedule(system_id, kind, retry_at, token)
+                continue
+            for kind, _, _ in due:
+                self.executed[kind] += 1
+
+    def stats(self) -> dict:
+        deadline = self.next_deadline()
+        kinds = {START: 0, STOP: 0}
+        for at, seq, kind, system_id, _ in self._heap:
+            if self._live.get(system_id) == seq:
+                kinds[kind] += 1
+        return {
+            "pending_starts": kinds[START],
+            "pending_stops": kinds[STOP],
+            "next_deadline": datetime.fromtimestamp(deadline, tz=timezone.utc).isoformat() if deadline else None,
+            "executed_starts": self.executed[START],
+            "executed_stops": self.executed[STOP],
+            "failed_batches": self.failed_batches,
+        }
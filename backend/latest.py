@@ -0,0 +1,72 @@
+"""Latest reading per (zone, sensor type), persisted in sensor_latest and mirrored in memory"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from common import DUPLICATE_KEY_ERROR, as_datetime
+
+
+LATEST_COLLECTION = "sensor_latest"
+
+
+class LatestReadings:
+    """Current farm state: one reading per (zone_id, sensor_type)"""
+
+    def __init__(self):
+        self._latest: Dict[Tuple[str, str], dict] = {}
+
+    def __len__(self):
+        return len(self._latest)
+
+    def offer(self, reading: dict) -> bool:
+        """Keep ``reading`` if it is newer than what is held for its key"""
+        key = (reading["zone_id"], reading["sensor_type"])
+        current = self._latest.get(key)
+        if current is not None and as_datetime(current["timestamp"]) >= as_datetime(reading["timestamp"]):
+            return False
+        self._latest[key] = reading
+        return True
+
+    def clear(self):
+        self._latest = {}
+
+    def snapshot(self, zone_id: Optional[str] = None) -> Dict[str, Dict[str, dict]]:
+        """{zone_id: {sensor_type: reading}}"""
+        zones: Dict[str, Dict[str, dict]] = {}
+        for (reading_zone, sensor_type), reading in self._latest.items():
+            if zone_id is None or reading_zone == zone_id:
+                zones.setdefault(reading_zone, {})[sensor_type] = reading
+        return zones
+
+    async def load(self, db):
+        """Merge the persisted view into memory (newer in-memory readings win)"""
+        async for reading in db[LATEST_COLLECTION].find({}, {"_id": 0}):
+            self.offer(reading)
+
+    async def apply(self, db, readings: Iterable[dict]):
+        """Record stored readings, writing only the newest one per key in the batch"""
+        newest: Dict[Tuple[str, str], dict] = {}
+        for reading in readings:
+            key = (reading["zone_id"], reading["sensor_type"])
+            current = newest.get(key)
+            if current is None or as_datetime(reading["timestamp"]) >= as_datetime(current["timestamp"]):
+                newest[key] = reading
+
+        ops: List[UpdateOne] = []
+        for (zone_id, sensor_type), reading in newest.items():
+            self.offer(reading)
+            # If a newer reading is already stored the filter misses, the upsert
+            # collides with the unique (zone_id, sensor_type) index, and we skip it
+            ops.append(UpdateOne(
+                {"zone_id": zone_id, "sensor_type": sensor_type, "timestamp": {"$lt": reading["timestamp"]}},
+                {"$set": reading},
+                upsert=True,
+            ))
+        if not ops:
+            return
+        try:
+            await db[LATEST_COLLECTION].bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get("code") != DUPLICATE_KEY_ERROR for err in e.details.get("writeErrors", [])):
+                raise
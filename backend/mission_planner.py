@@ -0,0 +1,222 @@
+"""Boustrophedon coverage plans for spraying a zone polygon
+
+The polygon is projected to local meters around its centroid and rotated so
+the passes run along the sweep angle. All pass/edge intersections are
+computed in one NumPy step, and passes alternate direction. The resulting
+spray segments are then split into sorties that respect the drone's flight
+range and the area a tank can cover.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from spatial import METERS_PER_DEGREE
+
+
+class PlanningError(ValueError):
+    pass
+
+
+def _project(points: np.ndarray, origin: Tuple[float, float]) -> np.ndarray:
+    """[[lat, lng], ...] -> local [[x east, y north], ...] in meters"""
+    lat0, lng0 = origin
+    x = (points[:, 1] - lng0) * METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    y = (points[:, 0] - lat0) * METERS_PER_DEGREE
+    return np.column_stack((x, y))
+
+
+def _unproject(xy: np.ndarray, origin: Tuple[float, float]) -> np.ndarray:
+    lat0, lng0 = origin
+    lat = lat0 + xy[:, 1] / METERS_PER_DEGREE
+    lng = lng0 + xy[:, 0] / (METERS_PER_DEGREE * math.cos(math.radians(lat0)))
+    return np.column_stack((lat, lng))
+
+
+def _rotation(angle_deg: float) -> np.ndarray:
+    theta = math.radians(angle_deg)
+    return np.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+
+
+def polygon_area_m2(xy: np.ndarray) -> float:
+    x, y = xy[:, 0], xy[:, 1]
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
+
+def longest_edge_angle(xy: np.ndarray) -> float:
+    """Direction of the longest edge in degrees counter-clockwise from east"""
+    edges = np.roll(xy, -1, axis=0) - xy
+    longest = edges[np.argmax(np.hypot(edges[:, 0], edges[:, 1]))]
+    return math.degrees(math.atan2(longest[1], longest[0]))
+
+
+def usable_range_m(full_range_m: float, battery_percent: float, reserve_percent: float) -> float:
+    """Ground distance the battery allows before dipping into the reserve"""
+    return full_range_m * max(0.0, battery_percent - reserve_percent) / 100
+
+
+def square_boundary(lat: float, lng: float, area_ha: float) -> List[List[float]]:
+    """Square of ``area_ha`` centered on a point, for zones without a surveyed boundary"""
+    half = math.sqrt(area_ha * 10000) / 2
+    corners = np.array([[-half, -half], [half, -half], [half, half], [-half, half]])
+    return _unproject(corners, (lat, lng)).tolist()
+
+
+def sweep_segments(xy: np.ndarray, swath: float) -> np.ndarray:
+    """Spray segments [[x0, y, x1, y], ...] covering a polygon with horizontal passes
+
+    Passes are ``swath`` apart starting half a swath inside the polygon, and
+    alternate direction. A pass that crosses a concave part yields several
+    segments.
+    """
+    y_min, y_max = xy[:, 1].min(), xy[:, 1].max()
+    passes = np.arange(y_min + swath / 2, y_max, swath)
+    if len(passes) == 0:
+        passes = np.array([(y_min + y_max) / 2])
+
+    start = xy
+    end = np.roll(xy, -1, axis=0)
+    y1, y2 = start[:, 1][None, :], end[:, 1][None, :]
+    x1, x2 = start[:, 0][None, :], end[:, 0][None, :]
+    ys = passes[:, None]
+    # Half-open test so a pass through a vertex counts it once
+    crosses = ((y1 <= ys) & (ys < y2)) | ((y2 <= ys) & (ys < y1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xs = np.where(crosses, x1 + (ys - y1) * (x2 - x1) / (y2 - y1), np.nan)
+    xs.sort(axis=1)  # NaN sorts last
+
+    segments = []
+    for index, (y, row) in enumerate(zip(passes, xs)):
+        row = row[~np.isnan(row)]
+        pairs = row[: len(row) // 2 * 2].reshape(-1, 2)
+        if index % 2:
+            pairs = pairs[::-1, ::-1]
+        for a, b in pairs:
+            if a != b:
+                segments.append((a, y, b, y))
+    return np.array(segments).reshape(-1, 4)
+
+
+def split_sorties(segments: np.ndarray, home: np.ndarray, swath: float,
+                  first_range: float, full_range: float,
+                  first_area: float, full_area: float) -> List[List[Tuple[np.ndarray, np.ndarray]]]:
+    """Greedily pack spray segments into sorties that start and end at ``home``
+
+    A sortie's flight distance stays within its range and its sprayed area
+    within what the tank covers. Segments are cut where a sortie runs out.
+    The first sortie uses the drone's current battery and payload; later
+    ones assume a full charge and tank.
+    """
+    sorties = []
+    current: List[Tuple[np.ndarray, np.ndarray]] = []
+    position = home
+    flown = 0.0
+    sprayed = 0.0
+    limit_range, limit_area = first_range, first_area
+    queue = [(segment[:2], segment[2:]) for segment in segments]
+    index = 0
+    while index < len(queue):
+        start, end = queue[index]
+        transit = float(np.linalg.norm(start - position))
+        length = float(np.linalg.norm(end - start))
+        back_from_start = float(np.linalg.norm(home - start))
+        # Conservative: returning from a point on the segment costs at most back_from_start + distance along it
+        by_range = (limit_range - flown - transit - back_from_start) / 2
+        if flown + transit + length + float(np.linalg.norm(home - end)) <= limit_range:
+            by_range = length
+        by_area = (limit_area - sprayed) / swath
+        allowed = min(length, by_range, by_area)
+
+        if allowed <= 0 or (allowed < length and allowed < swath):
+            if not current:
+                if limit_range == full_range and limit_area == full_area:
+                    raise PlanningError("Zone is out of reach for a fully charged drone")
+                # Current battery/payload cannot even start; the next sortie is full
+                limit_range, limit_area = full_range, full_area
+                continue
+            sorties.append(current)
+            current, position, flown, sprayed = [], home, 0.0, 0.0
+            limit_range, limit_area = full_range, full_area
+            continue
+
+        if allowed < length:
+            cut = start + (end - start) * (allowed / length)
+            current.append((start, cut))
+            queue[index] = (cut, end)
+            end = cut
+        else:
+            current.append((start, end))
+            index += 1
+        flown += transit + allowed
+        sprayed += allowed * swath
+        position = end
+
+    if current:
+        sorties.append(current)
+    return sorties
+
+
+def plan_coverage(boundary: Sequence[Sequence[float]], home: Tuple[float, float], swath: float,
+                  angle_deg: Optional[float], battery_percent: float, payload_percent: float,
+                  full_range_m: float, tank_coverage_ha: float, reserve_percent: float) -> Dict:
+    """Coverage plan for a [[lat, lng], ...] polygon flown from ``home``"""
+    if swath <= 0:
+        raise PlanningError("swath_width_m must be positive")
+    points = np.asarray(boundary, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+        raise PlanningError("boundary needs at least three [lat, lng] points")
+    if np.allclose(points[0], points[-1]):
+        points = points[:-1]
+
+    origin = (float(points[:, 0].mean()), float(points[:, 1].mean()))
+    xy = _project(points, origin)
+    if angle_deg is None:
+        angle_deg = longest_edge_angle(xy)
+    # Rotate the field so passes along angle_deg become horizontal
+    to_sweep = _rotation(-angle_deg)
+    from_sweep = _rotation(angle_deg)
+    segments = sweep_segments(xy @ to_sweep.T, swath)
+    if len(segments) == 0:
+        raise PlanningError("Boundary encloses no area")
+
+    home_xy = _project(np.array([home]), origin) @ to_sweep.T
+    full_area = tank_coverage_ha * 10000
+    sorties = split_sorties(
+        segments, home_xy[0], swath,
+        first_range=usable_range_m(full_range_m, battery_percent, reserve_percent),
+        full_range=usable_range_m(full_range_m, 100, reserve_percent),
+        first_area=full_area * payload_percent / 100,
+        full_area=full_area,
+    )
+
+    planned = []
+    total_distance = 0.0
+    for sortie in sorties:
+        legs = [home_xy[0]]
+        spray = [False]
+        for start, end in sortie:
+            legs += [start, end]
+            spray += [False, True]
+        legs.append(home_xy[0])
+        spray.append(False)
+        path = np.array(legs)
+        distance = float(np.hypot(*np.diff(path, axis=0).T).sum())
+        sprayed = float(sum(np.linalg.norm(end - start) for start, end in sortie) * swath)
+        latlng = _unproject(path @ from_sweep.T, origin)
+        planned.append({
+            "waypoints": [
+                {"lat": round(lat, 7), "lng": round(lng, 7), "spray": on}
+                for (lat, lng), on in zip(latlng.tolist(), spray)
+            ],
+            "distance_m": round(distance, 1),
+            "spray_area_ha": round(sprayed / 10000, 4),
+        })
+        total_distance += distance
+
+    return {
+        "angle_deg": round(angle_deg, 2),
+        "area_ha": round(polygon_area_m2(xy) / 10000, 4),
+        "passes": int(len(np.unique(segments[:, 1]))),
+        "total_distance_m": round(total_distance, 1),
+        "sorties": planned,
+    }
@@ -0,0 +1,123 @@
+"""Server-sent event fan-out for dashboard clients
+
+Writers call ``EventHub.publish`` with a coalescing key. Each subscriber merges
+unsent payloads per key (later fields win), so a burst of updates to one
+sensor or drone reaches the client as a single event. A subscriber that falls
+more than ``max_pending`` distinct keys behind is told to resync (refetch the
+REST snapshot) instead of being buffered without bound.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+
+PUSH_TOPICS = ("readings", "drones", "irrigation")
+
+
+class Subscriber:
+    def __init__(self, topics: Set[str], zones: Set[str], drones: Set[str], max_pending: int):
+        self.topics = topics
+        self.zones = zones
+        self.drones = drones
+        self.max_pending = max_pending
+        self.pending: Dict[tuple, tuple] = {}
+        self.resync_reason: Optional[str] = None
+        self.ready = asyncio.Event()
+
+    def wants(self, topic: str, zone_id: Optional[str], drone_id: Optional[str]) -> bool:
+        if topic not in self.topics:
+            return False
+        if self.zones and zone_id is not None and zone_id not in self.zones:
+            return False
+        if self.drones and drone_id is not None and drone_id not in self.drones:
+            return False
+        return True
+
+    def offer(self, key: tuple, event: str, data: dict):
+        if self.resync_reason is not None:
+            return
+        previous = self.pending.pop(key, None)
+        self.pending[key] = (event, {**previous[1], **data} if previous else data)
+        if len(self.pending) > self.max_pending:
+            self.resync("slow consumer")
+        self.ready.set()
+
+    def resync(self, reason: str):
+        """Replace anything unsent with a single resync event"""
+        self.pending = {}
+        self.resync_reason = reason
+        self.ready.set()
+
+    def drain(self) -> Iterable[tuple]:
+        if self.resync_reason is not None:
+            events = [("resync", {"reason": self.resync_reason})]
+            self.resync_reason = None
+        else:
+            events = list(self.pending.values())
+        self.pending = {}
+        self.ready.clear()
+        return events
+
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventHub:
+    def __init__(self, coalesce_interval: float = 0.25, keepalive_interval: float = 15.0, max_pending: int = 1000):
+        self.coalesce_interval = coalesce_interval
+        self.keepalive_interval = keepalive_interval
+        self.max_pending = max_pending
+        self.subscribers: Set[Subscriber] = set()
+        self.closed = False
+
+    def publish(self, topic: str, event: str, key: tuple, data: Any,
+                zone_id: Optional[str] = None, drone_id: Optional[str] = None):
+        """Queue ``data`` (a model or dict) for every interested subscriber, merged into any unsent event with the same key"""
+        if not self.subscribers:
+            return
+        data = jsonable_encoder(data)
+        for subscriber in self.subscribers:
+            if subscriber.wants(topic, zone_id, drone_id):
+                subscriber.offer((event,) + key, event, data)
+
+    def resync(self, reason: str):
+        """Ask every subscriber to refetch, e.g. after bulk changes not sent as events"""
+        for subscriber in self.subscribers:
+            subscriber.resync(reason)
+
+    def subscribe(self, topics: Set[str], zones: Set[str], drones: Set[str]) -> Subscriber:
+        subscriber = Subscriber(topics, zones, drones, self.max_pending)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def close(self):
+        """Wake every stream so it can finish (used on shutdown)"""
+        self.closed = True
+        for subscriber in self.subscribers:
+            subscriber.ready.set()
+
+    async def stream(self, subscriber: Subscriber, is_disconnected) -> AsyncIterator[str]:
+        """SSE body for one subscriber: batched events, keepalive comments, stops on disconnect"""
+        try:
+            yield format_event("ready", {"topics": sorted(subscriber.topics)})
+            while not self.closed:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), timeout=self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                # Let the rest of a burst arrive and coalesce before sending
+                await asyncio.sleep(self.coalesce_interval)
+                if self.closed:
+                    break
+                yield "".join(format_event(event, data) for event, data in subscriber.drain())
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,122 @@
+"""Vectorized resampling for chart series: bucket aggregation, gap filling and LTTB
+
+Series are dense float arrays over a fixed bucket grid, with NaN marking
+buckets that had no readings.
+"""
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+
+FILL_METHODS = ("none", "previous", "linear")
+
+
+def aggregate_buckets(indices: np.ndarray, counts: np.ndarray, sums: np.ndarray,
+                      mins: np.ndarray, maxs: np.ndarray, size: int) -> Dict[str, np.ndarray]:
+    """Combine partial aggregates (e.g. one per zone) into dense per-bucket mean/min/max
+
+    ``indices`` gives the bucket of each partial; partials sharing a bucket are
+    merged by summing count/sum and taking the min of mins and max of maxes.
+    """
+    count = np.zeros(size)
+    total = np.zeros(size)
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+    np.add.at(count, indices, counts)
+    np.add.at(total, indices, sums)
+    np.minimum.at(low, indices, mins)
+    np.maximum.at(high, indices, maxs)
+
+    empty = count == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    mean[empty] = np.nan
+    low[empty] = np.nan
+    high[empty] = np.nan
+    return {"count": count, "mean": mean, "min": low, "max": high}
+
+
+def fill_gaps(values: np.ndarray, method: str = "none") -> np.ndarray:
+    """Fill NaN buckets by carrying the previous value forward or interpolating linearly
+
+    Leading gaps (before the first reading) and, for linear, trailing gaps stay NaN.
+    """
+    if method == "none":
+        return values
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return values
+    positions = np.arange(len(values))
+    if method == "previous":
+        last_valid = np.maximum.accumulate(np.where(valid, positions, -1))
+        filled = values[np.maximum(last_valid, 0)]
+        filled[last_valid < 0] = np.nan
+        return filled
+    if method == "linear":
+        valid_positions = positions[valid]
+        filled = np.interp(positions, valid_positions, values[valid])
+        outside = (positions < valid_positions[0]) | (positions > valid_positions[-1])
+        filled[outside] = np.nan
+        return filled
+    raise ValueError(f"Unknown fill method {method}")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``threshold`` points that keep the shape of y(x)
+
+    Always keeps the first and last point. Points with NaN y are ignored.
+    """
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if threshold >= n:
+        return valid
+    if threshold < 3:
+        return valid[np.linspace(0, n - 1, threshold, dtype=int)]
+
+    xs = x[valid].astype(float)
+    ys = y[valid]
+    # Bucket edges over the interior points 1..n-2
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[next_start:next_end].mean()
+        avg_y = ys[next_start:next_end].mean()
+
+        bucket_x = xs[start:end]
+        bucket_y = ys[start:end]
+        areas = np.abs((xs[a] - avg_x) * (bucket_y - ys[a]) - (xs[a] - bucket_x) * (avg_y - ys[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return valid[selected]
+
+
+def downsample(series: Dict[str, np.ndarray], max_points: int) -> Dict[str, np.ndarray]:
+    """LTTB-select at most ``max_points`` bucket indices for each named series"""
+    return {
+        name: lttb(np.arange(len(values)), values, max_points)
+        for name, values in series.items()
+    }
+
+
+def dense_series(points: Iterable[Tuple[int, str, float, float, float, float]], size: int) -> Dict[str, Dict[str, np.ndarray]]:
+    """Group (bucket index, sensor_type, count, sum, min, max) rows into dense arrays per sensor type"""
+    by_type: Dict[str, list] = {}
+    for point in points:
+        if 0 <= point[0] < size:
+            by_type.setdefault(point[1], []).append(point)
+
+    result = {}
+    for sensor_type, rows in by_type.items():
+        indices, _, counts, sums, mins, maxs = zip(*rows)
+        result[sensor_type] = aggregate_buckets(
+            np.asarray(indices, dtype=int), np.asarray(counts, dtype=float), np.asarray(sums, dtype=float),
+            np.asarray(mins, dtype=float), np.asarray(maxs, dtype=float), size,
+        )
+    return result
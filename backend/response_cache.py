@@ -0,0 +1,65 @@
+"""Short-TTL cache for a rendered response, shared by every caller of an endpoint
+
+Concurrent misses wait on a single build, so N viewers polling the same
+endpoint cost the database about as much as one. ``invalidate()`` drops the
+cached body; a build that was already running when it was called is still
+returned to its waiters but not kept.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+
+class CachedResponse:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._generation = 0
+        self._entry: Optional[Tuple[bytes, str, float]] = None
+        self._pending: Optional[Tuple[int, asyncio.Future]] = None
+        self.hits = 0
+        self.builds = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._entry = None
+
+    async def get(self, build: Callable[[], Awaitable[bytes]]) -> Tuple[bytes, str]:
+        """Return (body, etag), building the body with ``build`` when the cache is stale"""
+        entry = self._entry
+        if entry is not None and entry[2] > time.monotonic():
+            self.hits += 1
+            return entry[0], entry[1]
+
+        if self._pending is None or self._pending[0] != self._generation:
+            self._pending = (self._generation, asyncio.ensure_future(self._build(build, self._generation)))
+        body, etag, _ = await asyncio.shield(self._pending[1])
+        return body, etag
+
+    async def _build(self, build: Callable[[], Awaitable[bytes]], generation: int) -> Tuple[bytes, str, float]:
+        try:
+            body = await build()
+        finally:
+            if self._pending is not None and self._pending[0] == generation:
+                self._pending = None
+        self.builds += 1
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()}"', time.monotonic() + self.ttl)
+        if generation == self._generation:
+            self._entry = entry
+        return entry
+
+    def stats(self) -> dict:
+        return {"ttl_seconds": self.ttl, "hits": self.hits, "builds": self.builds}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers ``etag`` (weak comparison)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
@@ -0,0 +1,133 @@
+"""Hourly pre-aggregated sensor rollups, one small document per (zone, sensor type, hour)
+
+Each bucket document holds count, sum, min, max and the last value seen in the
+hour. Buckets are updated on ingest with $inc/$min/$max upserts, so chart
+queries read at most hours x sensor types documents instead of raw readings.
+
+Backfill existing readings with:
+
+    python rollups.py backfill [--hours 168]
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from common import as_datetime, bulk_write_upserts, maintenance_cli, run_with_db
+
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "sensor_rollups_hourly"
+HOUR_MS = 3600 * 1000
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return as_datetime(timestamp).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def group_readings(readings: Iterable[Tuple[str, str, float, datetime]]) -> Dict[tuple, dict]:
+    """Pre-aggregate (zone_id, sensor_type, value, timestamp) tuples per hour bucket"""
+    buckets: Dict[tuple, dict] = {}
+    for zone_id, sensor_type, value, timestamp in readings:
+        key = (zone_id, sensor_type, hour_bucket(timestamp))
+        stats = buckets.get(key)
+        if stats is None:
+            buckets[key] = {"count": 1, "sum": value, "min": value, "max": value, "last": value, "last_ts": timestamp}
+            continue
+        stats["count"] += 1
+        stats["sum"] += value
+        if value < stats["min"]:
+            stats["min"] = value
+        if value > stats["max"]:
+            stats["max"] = value
+        if timestamp >= stats["last_ts"]:
+            stats["last"] = value
+            stats["last_ts"] = timestamp
+    return buckets
+
+
+def rollup_operations(buckets: Dict[tuple, dict]) -> List[UpdateOne]:
+    ops = []
+    for (zone_id, sensor_type, bucket), stats in buckets.items():
+        key = {"zone_id": zone_id, "sensor_type": sensor_type, "bucket": bucket}
+        ops.append(UpdateOne(
+            key,
+            {
+                "$inc": {"count": stats["count"], "sum": stats["sum"]},
+                "$min": {"min": stats["min"]},
+                "$max": {"max": stats["max"], "last_ts": stats["last_ts"]},
+            },
+            upsert=True,
+        ))
+        # Only the writer holding the newest timestamp wins "last"
+        ops.append(UpdateOne({**key, "last_ts": {"$lte": stats["last_ts"]}}, {"$set": {"last": stats["last"]}}))
+    return ops
+
+
+async def apply_readings(db, readings: Iterable[Tuple[str, str, float, datetime]]):
+    """Fold stored readings into their hourly buckets with one ordered bulk_write"""
+    ops = rollup_operations(group_readings(readings))
+    if not ops:
+        return
+    await bulk_write_upserts(db[ROLLUP_COLLECTION], ops)
+
+
+async def backfill(db, since: Optional[datetime] = None) -> int:
+    """Rebuild buckets from raw sensor_data, replacing any existing bucket in range
+
+    Run it for ranges that are no longer receiving readings (or with ingest
+    paused), since a rebuilt bucket replaces what live ingest wrote.
+    """
+    pipeline = []
+    if since is not None:
+        pipeline.append({"$match": {"timestamp": {"$gte": hour_bucket(since)}}})
+    pipeline += [
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {
+                "zone_id": "$zone_id",
+                "sensor_type": "$sensor_type",
+                "bucket": {"$subtract": ["$timestamp", {"$mod": [{"$toLong": "$timestamp"}, HOUR_MS]}]},
+            },
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$value"},
+            "min": {"$min": "$value"},
+            "max": {"$max": "$value"},
+            "last": {"$last": "$value"},
+            "last_ts": {"$max": "$timestamp"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "zone_id": "$_id.zone_id",
+            "sensor_type": "$_id.sensor_type",
+            "bucket": "$_id.bucket",
+            "count": 1, "sum": 1, "min": 1, "max": 1, "last": 1, "last_ts": 1,
+        }},
+        {"$merge": {
+            "into": ROLLUP_COLLECTION,
+            "on": ["zone_id", "sensor_type", "bucket"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await db.sensor_data.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+    query = {"bucket": {"$gte": hour_bucket(since)}} if since is not None else {}
+    return await db[ROLLUP_COLLECTION].count_documents(query)
+
+
+if __name__ == "__main__":
+    import typer
+
+    cli = maintenance_cli("Maintain the hourly sensor rollup collection")
+
+    @cli.command("backfill")
+    def backfill_command(hours: Optional[int] = typer.Option(None, help="Only rebuild the last N hours")):
+        """Rebuild hourly rollups from raw sensor_data"""
+        since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+        count = run_with_db(lambda db: backfill(db, since))
+        typer.echo(f"{count} hourly buckets rebuilt")
+
+    cli()
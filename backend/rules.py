@@ -0,0 +1,168 @@
+"""Threshold rules evaluated on every stored reading
+
+Each sensor type listed in a zone's ``irrigation_threshold`` compiles to a
+Rule keyed by (zone_id, sensor_type). A rule fires when a reading drops
+below its threshold. It then disarms until a reading climbs back above
+``threshold + hysteresis``, so a value hovering at the threshold fires
+once. Two firings are also at least ``cooldown`` seconds apart.
+Evaluating a reading is one dict lookup and a few comparisons.
+
+A threshold value may be a number or a dict. The dict form can override
+``hysteresis``, ``cooldown_minutes``, ``action`` ("irrigate" or "drone") and
+``payload_type``, e.g.
+``{"soil_moisture": {"warning": 35, "hysteresis": 3, "cooldown_minutes": 15}}``.
+"""
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from common import as_epoch
+from thresholds import threshold_level
+
+
+logger = logging.getLogger(__name__)
+
+
+IRRIGATE = "irrigate"
+DRONE = "drone"
+
+# sensor_type -> (action, drone payload type) when the zone does not say
+DEFAULT_ACTIONS: Dict[str, Tuple[str, Optional[str]]] = {
+    "soil_moisture": (IRRIGATE, None),
+    "nutrient_n": (DRONE, "pupuk_organik"),
+    "nutrient_p": (DRONE, "pupuk_organik"),
+    "nutrient_k": (DRONE, "pupuk_organik"),
+}
+
+
+class Rule:
+    __slots__ = ("zone_id", "sensor_type", "threshold", "rearm", "cooldown", "action", "payload_type",
+                 "armed", "last_fired")
+
+    def __init__(self, zone_id: str, sensor_type: str, threshold: float, hysteresis: float, cooldown: float,
+                 action: str, payload_type: Optional[str]):
+        self.zone_id = zone_id
+        self.sensor_type = sensor_type
+        self.threshold = threshold
+        self.rearm = threshold + hysteresis
+        self.cooldown = cooldown
+        self.action = action
+        self.payload_type = payload_type
+        self.armed = True
+        self.last_fired = float("-inf")
+
+    def definition(self) -> tuple:
+        return self.threshold, self.rearm, self.cooldown, self.action, self.payload_type
+
+    def evaluate(self, value: float, now: float) -> bool:
+        if not self.armed:
+            if value >= self.rearm:
+                self.armed = True
+            return False
+        if value < self.threshold and now - self.last_fired >= self.cooldown:
+            self.armed = False
+            self.last_fired = now
+            return True
+        return False
+
+
+class RuleEngine:
+    def __init__(self, hysteresis_ratio: float = 0.1, cooldown: float = 1800.0, max_age: float = 300.0,
+                 history: int = 50):
+        self.hysteresis_ratio = hysteresis_ratio
+        self.cooldown = cooldown
+        self.max_age = max_age
+        self._rules: Dict[Tuple[str, str], Rule] = {}
+        self.evaluated = 0
+        self.fired = 0
+        self.recent = deque(maxlen=history)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def compile_zone(self, zone_id: str, irrigation_threshold: Optional[dict]) -> Dict[Tuple[str, str], Rule]:
+        """Raises ValueError for an invalid level or an unknown ``action``; a type with no default action gets no rule"""
+        rules = {}
+        for sensor_type, limit in (irrigation_threshold or {}).items():
+            options = limit if isinstance(limit, dict) else {"warning": limit}
+            if "warning" not in options:
+                continue
+            default_action, default_payload = DEFAULT_ACTIONS.get(sensor_type, (None, None))
+            action = options.get("action", default_action)
+            if action is None:
+                continue
+            if action not in (IRRIGATE, DRONE):
+                raise ValueError(f"{sensor_type}: unknown action {action!r}, expected {IRRIGATE!r} or {DRONE!r}")
+            threshold = threshold_level(sensor_type, options["warning"])
+            rules[(zone_id, sensor_type)] = Rule(
+                zone_id, sensor_type, threshold,
+                hysteresis=threshold_level(sensor_type, options.get("hysteresis", abs(threshold) * self.hysteresis_ratio)),
+                cooldown=threshold_level(sensor_type, options["cooldown_minutes"]) * 60 if "cooldown_minutes" in options else self.cooldown,
+                action=action,
+                payload_type=options.get("payload_type", default_payload),
+            )
+        return rules
+
+    def _merge(self, rules: Dict[Tuple[str, str], Rule]):
+        """Install rules, keeping the armed/cool-down state of rules that did not change"""
+        for key, rule in rules.items():
+            current = self._rules.get(key)
+            if current is not None and current.definition() == rule.definition():
+                rules[key] = current
+        return rules
+
+    def set_zone(self, zone_id: str, irrigation_threshold: Optional[dict]):
+        rules = self._merge(self.compile_zone(zone_id, irrigation_threshold))
+        self._rules = {key: rule for key, rule in self._rules.items() if key[0] != zone_id}
+        self._rules.update(rules)
+
+    def load(self, zones: Iterable[dict]):
+        """Replace all rules from farm_zones documents; a zone with invalid thresholds gets no rules"""
+        rules: Dict[Tuple[str, str], Rule] = {}
+        for zone in zones:
+            try:
+                rules.update(self.compile_zone(zone["id"], zone.get("irrigation_threshold")))
+            except ValueError as e:
+                logger.warning("Zone %s has an invalid irrigation_threshold (%s), skipping its rules", zone["id"], e)
+        self._rules = self._merge(rules)
+
+    def clear(self):
+        self._rules = {}
+
+    def evaluate_many(self, readings: Iterable[Tuple[str, str, float, datetime]]) -> List[dict]:
+        """Firings for (zone_id, sensor_type, value, timestamp) readings; older than max_age are skipped"""
+        rules = self._rules
+        now = time.time()
+        oldest = now - self.max_age
+        fired = []
+        for zone_id, sensor_type, value, at in readings:
+            rule = rules.get((zone_id, sensor_type))
+            if rule is None:
+                continue
+            if as_epoch(at) < oldest:
+                continue
+            self.evaluated += 1
+            if rule.evaluate(value, now):
+                fired.append({
+                    "zone_id": zone_id,
+                    "sensor_type": sensor_type,
+                    "value": value,
+                    "threshold": rule.threshold,
+                    "action": rule.action,
+                    "payload_type": rule.payload_type,
+                    "at": now,
+                })
+        if fired:
+            self.fired += len(fired)
+            self.recent.extend(fired)
+        return fired
+
+    def stats(self) -> dict:
+        return {
+            "rules": len(self._rules),
+            "disarmed": sum(1 for rule in self._rules.values() if not rule.armed),
+            "evaluated": self.evaluated,
+            "fired": self.fired,
+        }
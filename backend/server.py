@@ -1,18 +1,51 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
+import json
 import logging
+import math
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Optional, Set, Tuple
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from enum import Enum
 import random
+import time
 import asyncio
 
+from alerts import AlertCounters, parse_windows
+from commands import MISSION, VALVE, CommandBus, InProcessTransport, MqttTransport
+from changes import ChangeSequence, CursorExpired
+from common import DUPLICATE_KEY_ERROR, as_datetime
+from dedup import DedupCache
+from fleet import DroneState, FleetStore
+from spatial import ZoneGrid
+from mission_planner import PlanningError, plan_coverage, square_boundary
+from dispatch import plan_dispatch
+from simulator import FleetSimulation
+from irrigation_scheduler import START, IrrigationScheduler
+from rules import DRONE, IRRIGATE, RuleEngine
+from trajectory import TRACK_COLLECTION, TrackRecorder, load_track, track_columns
+from indexes import IndexProvisioner
+import history
+from latest import LATEST_COLLECTION, LatestReadings
+import resample
+import rollups
+import usage
+from usage import REPORT_GROUPS, SprayMeter
+from push import PUSH_TOPICS, EventHub
+from response_cache import CachedResponse, etag_matches
+from ingest_buffer import IngestBuffer, IngestBufferFull
+from ingest_codec import FRAME_CONTENT_TYPE, FrameError, decode_frame
+from thresholds import ZoneThresholdTable, compile_thresholds
+
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -22,6 +55,191 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Maximum number of readings accepted in one POST /api/sensors/batch request
+SENSOR_BATCH_MAX = int(os.environ.get('SENSOR_BATCH_MAX', '1000'))
+
+# Maximum number of items in one bulk irrigation or drone mission request
+BULK_COMMAND_MAX = int(os.environ.get('BULK_COMMAND_MAX', '1000'))
+
+# Optional write-behind buffer for single-reading ingest (POST /api/sensors)
+SENSOR_WRITE_BEHIND = os.environ.get('SENSOR_WRITE_BEHIND', 'false').lower() == 'true'
+INGEST_BUFFER_MAX = int(os.environ.get('INGEST_BUFFER_MAX', '10000'))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '500'))
+INGEST_FLUSH_INTERVAL_MS = int(os.environ.get('INGEST_FLUSH_INTERVAL_MS', '250'))
+
+ingest_buffer: Optional[IngestBuffer] = None
+
+# Longest window /api/sensors/historical will aggregate
+HISTORY_MAX_HOURS = int(os.environ.get('HISTORY_MAX_HOURS', str(31 * 24)))
+# 5-minute buckets group raw sensor_data, so their window is kept short
+HISTORY_RAW_MAX_HOURS = int(os.environ.get('HISTORY_RAW_MAX_HOURS', '48'))
+# Default cap on points per chart series (LTTB downsampling beyond it)
+HISTORY_MAX_POINTS = int(os.environ.get('HISTORY_MAX_POINTS', '500'))
+
+# Retransmit suppression for readings carrying device_id + sequence
+DEDUP_CACHE_SIZE = int(os.environ.get('DEDUP_CACHE_SIZE', '100000'))
+DEDUP_WINDOW_SECONDS = int(os.environ.get('DEDUP_WINDOW_SECONDS', '3600'))
+
+dedup_cache = DedupCache(max_entries=DEDUP_CACHE_SIZE, window=DEDUP_WINDOW_SECONDS)
+
+# Readings with device_id + sequence get a deterministic id, so a retry maps to the same document
+READING_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "sensor-readings.smartfarm")
+
+# Alert levels are assigned server-side from each zone's irrigation_threshold.
+# Zones changed by this process update the table directly; the periodic reload
+# picks up zones written by other workers.
+ZONE_THRESHOLD_REFRESH_SECONDS = int(os.environ.get('ZONE_THRESHOLD_REFRESH_SECONDS', '60'))
+
+zone_thresholds = ZoneThresholdTable()
+
+background_tasks: List[asyncio.Task] = []
+
+index_provisioner = IndexProvisioner()
+
+# Drone state lives in memory (telemetry at 5-10 Hz per drone) and is written
+# back to the drones collection every FLEET_PERSIST_INTERVAL_MS, or at once
+# when a drone's status changes. The same loop merges drones other workers
+# persisted since its last pass, found by their change_seq.
+FLEET_PERSIST_INTERVAL_MS = int(os.environ.get('FLEET_PERSIST_INTERVAL_MS', '1000'))
+
+# Grid cell size for the drone and zone spatial indexes (0.01 degrees is about 1.1 km)
+SPATIAL_CELL_DEGREES = float(os.environ.get('SPATIAL_CELL_DEGREES', '0.01'))
+
+fleet = FleetStore(cell_degrees=SPATIAL_CELL_DEGREES)
+zone_index = ZoneGrid(cell_degrees=SPATIAL_CELL_DEGREES)
+
+# Scheduled irrigation runs are started at scheduled_time and every run is
+# stopped when its duration is over. The schedule is rebuilt from Mongo at
+# startup and every IRRIGATION_SCHEDULE_REFRESH_SECONDS, which also picks up
+# schedules written by other workers.
+IRRIGATION_DEFAULT_DURATION_MINUTES = int(os.environ.get('IRRIGATION_DEFAULT_DURATION_MINUTES', '10'))
+IRRIGATION_SCHEDULE_REFRESH_SECONDS = int(os.environ.get('IRRIGATION_SCHEDULE_REFRESH_SECONDS', '60'))
+
+# Threshold rules on the ingest path: a reading below a zone's
+# irrigation_threshold starts the zone's irrigation or queues a drone task.
+# A rule re-arms once the value is RULE_HYSTERESIS_RATIO above the threshold
+# and fires at most once per RULE_COOLDOWN_MINUTES. Queued drone tasks are
+# dispatched together every RULE_DISPATCH_INTERVAL_SECONDS.
+RULE_HYSTERESIS_RATIO = float(os.environ.get('RULE_HYSTERESIS_RATIO', '0.1'))
+RULE_COOLDOWN_MINUTES = int(os.environ.get('RULE_COOLDOWN_MINUTES', '30'))
+RULE_MAX_READING_AGE_SECONDS = int(os.environ.get('RULE_MAX_READING_AGE_SECONDS', '300'))
+RULE_DISPATCH_INTERVAL_SECONDS = int(os.environ.get('RULE_DISPATCH_INTERVAL_SECONDS', '10'))
+
+rule_engine = RuleEngine(
+    hysteresis_ratio=RULE_HYSTERESIS_RATIO,
+    cooldown=RULE_COOLDOWN_MINUTES * 60,
+    max_age=RULE_MAX_READING_AGE_SECONDS,
+)
+# (zone_id, payload_type) -> task waiting for a drone
+queued_drone_tasks: Dict[Tuple[str, Optional[str]], "DispatchTask"] = {}
+
+# Usage accounting: each completed irrigation run and drone spray is stored as
+# a usage event and added to per-zone daily totals. A drone spray uses its
+# payload drop times USAGE_DRONE_TANK_LITERS.
+USAGE_DRONE_TANK_LITERS = float(os.environ.get('USAGE_DRONE_TANK_LITERS', '10'))
+# Longest range one /api/usage report may cover
+USAGE_REPORT_MAX_DAYS = int(os.environ.get('USAGE_REPORT_MAX_DAYS', '366'))
+
+spray_meter = SprayMeter(tank_liters=USAGE_DRONE_TANK_LITERS)
+
+# Drone tracks: positions are buffered per drone and written as compressed
+# chunks of up to TRACK_CHUNK_SAMPLES samples, or after TRACK_FLUSH_SECONDS
+TRACK_CHUNK_SAMPLES = int(os.environ.get('TRACK_CHUNK_SAMPLES', '3000'))
+TRACK_FLUSH_SECONDS = int(os.environ.get('TRACK_FLUSH_SECONDS', '30'))
+
+tracks = TrackRecorder(chunk_samples=TRACK_CHUNK_SAMPLES, flush_seconds=TRACK_FLUSH_SECONDS)
+
+# Load-test fleet (/simulate-fleet): simulated drones move through the same
+# in-memory fleet state, persistence and stream events as real telemetry
+FLEET_SIM_MAX_DRONES = int(os.environ.get('FLEET_SIM_MAX_DRONES', '5000'))
+FLEET_SIM_NAME_PREFIX = "SIM-"
+# Simulated drones are not real aircraft: /drones/dispatch and rule-triggered
+# tasks skip them, and they never get mission commands. FLEET_SIM_DISPATCH=true
+# lets dispatch assign them too, to load-test the planner
+FLEET_SIM_DISPATCH = os.environ.get('FLEET_SIM_DISPATCH', 'false').lower() == 'true'
+
+fleet_simulation: Optional[FleetSimulation] = None
+fleet_simulation_task: Optional[asyncio.Task] = None
+
+# Device commands: valve and mission commands are pushed to the gateway that
+# drives the device, over MQTT (COMMAND_TRANSPORT=mqtt) or in-process, where
+# gateways poll GET /api/commands and ack over HTTP. Commands for one gateway within
+# COMMAND_BATCH_MS go out as one message; a command not acked within
+# COMMAND_ACK_TIMEOUT_SECONDS is resent, up to COMMAND_MAX_ATTEMPTS sends.
+COMMAND_TRANSPORT = os.environ.get('COMMAND_TRANSPORT', 'inprocess')
+COMMAND_MQTT_HOST = os.environ.get('COMMAND_MQTT_HOST', 'localhost')
+COMMAND_MQTT_PORT = int(os.environ.get('COMMAND_MQTT_PORT', '1883'))
+COMMAND_MQTT_USERNAME = os.environ.get('COMMAND_MQTT_USERNAME')
+COMMAND_MQTT_PASSWORD = os.environ.get('COMMAND_MQTT_PASSWORD')
+COMMAND_TOPIC_PREFIX = os.environ.get('COMMAND_TOPIC_PREFIX', 'smartfarm')
+COMMAND_BATCH_MS = int(os.environ.get('COMMAND_BATCH_MS', '50'))
+COMMAND_ACK_TIMEOUT_SECONDS = float(os.environ.get('COMMAND_ACK_TIMEOUT_SECONDS', '5'))
+COMMAND_MAX_ATTEMPTS = int(os.environ.get('COMMAND_MAX_ATTEMPTS', '3'))
+
+if COMMAND_TRANSPORT == 'mqtt':
+    command_transport = MqttTransport(
+        COMMAND_MQTT_HOST, COMMAND_MQTT_PORT, topic_prefix=COMMAND_TOPIC_PREFIX,
+        username=COMMAND_MQTT_USERNAME, password=COMMAND_MQTT_PASSWORD,
+    )
+elif COMMAND_TRANSPORT == 'inprocess':
+    command_transport = InProcessTransport()
+else:
+    raise ValueError(f"COMMAND_TRANSPORT must be 'mqtt' or 'inprocess', not {COMMAND_TRANSPORT!r}")
+
+command_bus = CommandBus(
+    command_transport,
+    batch_interval=COMMAND_BATCH_MS / 1000,
+    ack_timeout=COMMAND_ACK_TIMEOUT_SECONDS,
+    max_attempts=COMMAND_MAX_ATTEMPTS,
+)
+
+# Coverage plan limits: ground distance a fully charged drone can fly, the
+# area one full tank sprays, and the battery share kept back for landing
+MISSION_FULL_RANGE_M = float(os.environ.get('MISSION_FULL_RANGE_M', '6000'))
+MISSION_TANK_COVERAGE_HA = float(os.environ.get('MISSION_TANK_COVERAGE_HA', '1.0'))
+MISSION_RESERVE_PERCENT = float(os.environ.get('MISSION_RESERVE_PERCENT', '20'))
+
+# change_seq stamps for delta sync (?since=<cursor> on the list endpoints)
+change_sequence = ChangeSequence()
+CHANGE_CURSOR_HEADER = "X-Change-Cursor"
+
+# Current value per (zone, sensor type), mirrored from sensor_latest. Readings
+# stored by other workers reach this process on the periodic reload.
+SENSOR_LATEST_REFRESH_SECONDS = int(os.environ.get('SENSOR_LATEST_REFRESH_SECONDS', '30'))
+
+latest_readings = LatestReadings()
+
+# The assembled dashboard is shared by all viewers for a few seconds and dropped
+# on any sensor, zone, irrigation or drone write made through this process
+DASHBOARD_CACHE_TTL_SECONDS = float(os.environ.get('DASHBOARD_CACHE_TTL_SECONDS', '5'))
+
+dashboard_cache = CachedResponse(ttl=DASHBOARD_CACHE_TTL_SECONDS)
+
+# Rolling warning/critical counts per zone, updated on ingest. The dashboard's
+# critical_alerts is the critical count over ALERT_DASHBOARD_WINDOW. Each worker
+# recounts from sensor_data at startup only; every ALERT_COUNTER_REFRESH_SECONDS
+# it adds the alert readings other workers stored since (by change_seq).
+ALERT_WINDOWS = parse_windows(os.environ.get('ALERT_WINDOWS', '1h,24h,7d'))
+ALERT_WINDOW_SLOTS = int(os.environ.get('ALERT_WINDOW_SLOTS', '60'))
+ALERT_DASHBOARD_WINDOW = os.environ.get('ALERT_DASHBOARD_WINDOW', '24h')
+ALERT_COUNTER_REFRESH_SECONDS = int(os.environ.get('ALERT_COUNTER_REFRESH_SECONDS', '10'))
+
+if ALERT_DASHBOARD_WINDOW not in ALERT_WINDOWS:
+    raise ValueError(f"ALERT_DASHBOARD_WINDOW {ALERT_DASHBOARD_WINDOW!r} is not one of ALERT_WINDOWS")
+
+alert_counters = AlertCounters(ALERT_WINDOWS, slots=ALERT_WINDOW_SLOTS)
+
+# Server-sent events for dashboard clients (GET /api/stream)
+PUSH_COALESCE_MS = int(os.environ.get('PUSH_COALESCE_MS', '250'))
+PUSH_KEEPALIVE_SECONDS = int(os.environ.get('PUSH_KEEPALIVE_SECONDS', '15'))
+PUSH_MAX_PENDING = int(os.environ.get('PUSH_MAX_PENDING', '1000'))
+
+event_hub = EventHub(
+    coalesce_interval=PUSH_COALESCE_MS / 1000,
+    keepalive_interval=PUSH_KEEPALIVE_SECONDS,
+    max_pending=PUSH_MAX_PENDING,
+)
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -39,6 +257,19 @@ class SensorType(str, Enum):
     TEMPERATURE = "temperature"
     HUMIDITY = "humidity"
 
+# Sensor type codes used by the binary ingest frame, in enum order
+SENSOR_TYPE_CODES = list(SensorType)
+
+SENSOR_UNITS = {
+    SensorType.SOIL_MOISTURE: "%",
+    SensorType.NUTRIENT_N: "ppm",
+    SensorType.NUTRIENT_P: "ppm",
+    SensorType.NUTRIENT_K: "ppm",
+    SensorType.PH_LEVEL: "pH",
+    SensorType.TEMPERATURE: "°C",
+    SensorType.HUMIDITY: "%",
+}
+
 class IrrigationStatus(str, Enum):
     IDLE = "idle"
     ACTIVE = "active"
@@ -63,6 +294,9 @@ class SensorData(BaseModel):
     unit: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     alert_level: Optional[str] = None  # normal, warning, critical
+    device_id: Optional[str] = None
+    sequence: Optional[int] = None  # per-device counter, must not wrap
+    change_seq: Optional[int] = None
 
 class SensorDataCreate(BaseModel):
     zone_id: str
@@ -70,6 +304,22 @@ class SensorDataCreate(BaseModel):
     value: float
     unit: str
     alert_level: Optional[str] = None
+    device_id: Optional[str] = None
+    sequence: Optional[int] = None
+
+class SensorBatchCreate(BaseModel):
+    readings: List[dict]
+
+class SensorBatchError(BaseModel):
+    index: int
+    error: str
+
+class SensorBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    ids: List[str]
+    errors: List[SensorBatchError]
 
 class IrrigationSystem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -79,8 +329,10 @@ class IrrigationSystem(BaseModel):
     flow_rate: float  # liter per minute
     duration: Optional[int] = None  # minutes
     scheduled_time: Optional[datetime] = None
+    gateway_id: Optional[str] = None  # gateway driving the valve; zone_id when unset
     last_activated: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    change_seq: Optional[int] = None
 
 class IrrigationSystemCreate(BaseModel):
     zone_id: str
@@ -89,6 +341,7 @@ class IrrigationSystemCreate(BaseModel):
     flow_rate: float
     duration: Optional[int] = None
     scheduled_time: Optional[datetime] = None
+    gateway_id: Optional[str] = None
 
 class DroneData(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -102,6 +355,17 @@ class DroneData(BaseModel):
     payload_type: Optional[str] = None  # water, fertilizer, pesticide
     payload_remaining: float  # percentage
     last_updated: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    change_seq: Optional[int] = None
+
+class DroneTelemetry(BaseModel):
+    lat: float
+    lng: float
+    altitude: Optional[float] = None  # meters above takeoff
+    heading: Optional[float] = None  # degrees from north
+    speed: Optional[float] = None  # m/s
+    battery_level: Optional[float] = None
+    payload_remaining: Optional[float] = None
+    status: Optional[DroneStatus] = None
 
 class DroneDataCreate(BaseModel):
     drone_name: str
@@ -122,6 +386,7 @@ class FarmZone(BaseModel):
     latitude: float
     longitude: float
     irrigation_threshold: dict  # {"soil_moisture": 30, "nutrient_n": 50}
+    boundary: Optional[List[Tuple[float, float]]] = None  # [[lat, lng], ...] field outline
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class FarmZoneCreate(BaseModel):
@@ -131,6 +396,50 @@ class FarmZoneCreate(BaseModel):
     latitude: float
     longitude: float
     irrigation_threshold: dict
+    boundary: Optional[List[Tuple[float, float]]] = None
+
+class MissionPlanRequest(BaseModel):
+    zone_id: str
+    swath_width_m: float = 5.0
+    angle_deg: Optional[float] = None  # pass direction, counter-clockwise from east; default follows the longest boundary edge
+    full_range_m: Optional[float] = None
+    tank_coverage_ha: Optional[float] = None
+    reserve_percent: Optional[float] = None
+
+class FleetSimulationStart(BaseModel):
+    drones: int = 100
+    tick_ms: int = 200
+    speed_mps: float = 8.0
+    seed: Optional[int] = None
+
+class DispatchTask(BaseModel):
+    zone_id: str
+    payload_type: Optional[str] = None
+
+class DispatchRequest(BaseModel):
+    tasks: List[DispatchTask]
+    min_payload: float = 10.0  # percentage a drone needs left to take a task
+    dry_run: bool = False
+
+class IrrigationActivation(BaseModel):
+    id: str
+    duration: int = 10  # minutes
+
+class BulkIrrigationActivation(BaseModel):
+    items: List[IrrigationActivation]
+
+class DroneMission(BaseModel):
+    id: str
+    target_lat: float
+    target_lng: float
+    payload_type: Optional[str] = None  # keeps the drone's current payload when unset
+
+class BulkDroneMission(BaseModel):
+    items: List[DroneMission]
+
+class CommandAck(BaseModel):
+    gateway_id: str
+    ids: List[str]
 
 class DashboardSummary(BaseModel):
     total_zones: int
@@ -142,36 +451,332 @@ class DashboardSummary(BaseModel):
     drone_fleet: List[DroneData]
 
 
+async def insert_synced(collection: str, documents: List[dict]):
+    """insert_many with consecutive change_seq stamps"""
+    async with change_sequence.reserve(db, collection, len(documents)) as first:
+        for offset, document in enumerate(documents):
+            document["change_seq"] = first + offset
+        await db[collection].insert_many(documents)
+
+async def update_synced(collection: str, query: dict, fields: dict, projection: dict) -> Optional[dict]:
+    """Set ``fields`` and a new change_seq (added to ``fields``) on one document
+
+    Returns the updated document with ``projection``, or None when nothing matched.
+    """
+    async with change_sequence.reserve(db, collection) as seq:
+        fields["change_seq"] = seq
+        return await db[collection].find_one_and_update(
+            query, {"$set": fields}, projection=projection, return_document=ReturnDocument.AFTER
+        )
+
+async def update_many_synced(collection: str, updates: List[Tuple[dict, dict]]):
+    """One bulk_write of (query, fields) updates, each with its own change_seq"""
+    async with change_sequence.reserve(db, collection, len(updates)) as first:
+        ops = [
+            UpdateOne(query, {"$set": {**fields, "change_seq": first + offset}})
+            for offset, (query, fields) in enumerate(updates)
+        ]
+        return await db[collection].bulk_write(ops, ordered=False)
+
+async def list_synced(collection: str, response: Response, since: Optional[int], query: dict,
+                      sort: str, limit: Optional[int] = None) -> List[dict]:
+    """Full list (newest ``sort`` first) or, with ``since``, what changed after that cursor"""
+    if since is not None:
+        try:
+            documents, cursor = await change_sequence.changes_since(db, collection, since, query, limit)
+        except CursorExpired as e:
+            raise HTTPException(status_code=410, detail=f"{e}; reload without since")
+    else:
+        # Read the cursor first: anything written meanwhile is sent again on the next sync
+        cursor = await change_sequence.cursor(db, collection)
+        find = db[collection].find(query).sort(sort, -1)
+        if limit:
+            find = find.limit(limit)
+        documents = await find.to_list(length=None)
+    response.headers[CHANGE_CURSOR_HEADER] = str(cursor)
+    return documents
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Smart Farm Monitoring System API"}
 
 # Sensor Data Endpoints
+def build_sensor_reading(fields: dict) -> SensorData:
+    """Raises ValueError for a value that is not a finite number (JSON allows NaN and Infinity)"""
+    if not math.isfinite(fields["value"]):
+        raise ValueError(f"value: {fields['value']} is not a finite number")
+    if fields.get("device_id") is not None and fields.get("sequence") is not None:
+        fields["id"] = str(uuid.uuid5(READING_ID_NAMESPACE, f"{fields['device_id']}:{fields['sequence']}"))
+    return SensorData(**fields)
+
+def classify_readings(readings: List[SensorData]):
+    """Set alert_level on every reading from the cached zone thresholds"""
+    levels = zone_thresholds.classify_many(
+        (reading.zone_id, reading.sensor_type.value, reading.value) for reading in readings
+    )
+    for reading, level in zip(readings, levels):
+        reading.alert_level = level
+
+def dedup_key(reading: SensorData) -> Optional[Tuple[str, int]]:
+    if reading.device_id is None or reading.sequence is None:
+        return None
+    return (reading.device_id, reading.sequence)
+
+def is_duplicate_reading(reading: SensorData) -> bool:
+    key = dedup_key(reading)
+    return key is not None and dedup_cache.check_and_add(key)
+
+def forget_readings(readings):
+    for reading in readings:
+        key = dedup_key(reading)
+        if key is not None:
+            dedup_cache.discard(key)
+
 @api_router.post("/sensors", response_model=SensorData)
 async def create_sensor_data(sensor_data: SensorDataCreate):
     sensor_dict = sensor_data.dict()
-    sensor_obj = SensorData(**sensor_dict)
-    await db.sensor_data.insert_one(sensor_obj.dict())
+    try:
+        sensor_obj = build_sensor_reading(sensor_dict)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if is_duplicate_reading(sensor_obj):
+        return sensor_obj
+    classify_readings([sensor_obj])
+    if ingest_buffer is not None:
+        try:
+            ingest_buffer.submit(sensor_obj)
+        except IngestBufferFull:
+            forget_readings([sensor_obj])
+            raise HTTPException(status_code=503, detail="Ingest buffer full, retry later", headers={"Retry-After": "1"})
+        return sensor_obj
+    write_errors, _ = await write_sensor_batch([sensor_obj])
+    if write_errors:
+        raise HTTPException(status_code=500, detail=write_errors[0])
     return sensor_obj
 
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+async def write_sensor_batch(readings: List[SensorData]) -> Tuple[dict, Set[int]]:
+    """Insert readings with one unordered insert_many.
+
+    Returns failed positions mapped to their error, and the positions the unique
+    device/sequence index rejected as duplicates.
+    """
+    if not readings:
+        return {}, set()
+    errors = {}
+    duplicates = set()
+    try:
+        async with change_sequence.reserve(db, "sensor_data", len(readings)) as first:
+            for offset, reading in enumerate(readings):
+                reading.change_seq = first + offset
+            await db.sensor_data.insert_many([reading.dict() for reading in readings], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            if err.get("code") == DUPLICATE_KEY_ERROR:
+                duplicates.add(err["index"])
+            else:
+                errors[err["index"]] = err.get("errmsg", "write failed")
+        forget_readings(readings[position] for position in errors)
+    except Exception:
+        forget_readings(readings)
+        raise
+
+    if errors or duplicates:
+        stored = [reading for position, reading in enumerate(readings) if position not in errors and position not in duplicates]
+    else:
+        stored = readings
+    await after_readings_stored(stored)
+    return errors, duplicates
+
+async def after_readings_stored(readings: List[SensorData]):
+    """Maintain derived views for readings that reached sensor_data"""
+    if not readings:
+        return
+    dashboard_cache.invalidate()
+    alert_counters.add_many((reading.id, reading.zone_id, reading.alert_level, reading.timestamp) for reading in readings)
+    for reading in readings:
+        event_hub.publish("readings", "reading", (reading.zone_id, reading.sensor_type.value), reading, zone_id=reading.zone_id)
+    try:
+        await rollups.apply_readings(
+            db, ((reading.zone_id, reading.sensor_type.value, reading.value, reading.timestamp) for reading in readings)
+        )
+    except Exception:
+        # Readings are stored; `python rollups.py backfill` repairs the buckets
+        logger.exception("Rollup update failed for %d readings", len(readings))
+    try:
+        await latest_readings.apply(db, ({**reading.dict(), "sensor_type": reading.sensor_type.value} for reading in readings))
+    except Exception:
+        logger.exception("Latest-value update failed for %d readings", len(readings))
+    fired = rule_engine.evaluate_many(
+        (reading.zone_id, reading.sensor_type.value, reading.value, reading.timestamp) for reading in readings
+    )
+    if fired:
+        try:
+            await run_rule_actions(fired)
+        except Exception:
+            logger.exception("Threshold rule actions failed for %d firings", len(fired))
+
+async def run_rule_actions(fired: List[dict]):
+    """Start irrigation in zones whose irrigate rules fired and queue drone tasks for the rest"""
+    for firing in fired:
+        if firing["action"] == DRONE:
+            key = (firing["zone_id"], firing["payload_type"])
+            queued_drone_tasks.setdefault(key, DispatchTask(zone_id=firing["zone_id"], payload_type=firing["payload_type"]))
+    zone_ids = sorted({firing["zone_id"] for firing in fired if firing["action"] == IRRIGATE})
+    if zone_ids:
+        await start_zone_irrigation(zone_ids, IRRIGATION_DEFAULT_DURATION_MINUTES)
+
+async def start_zone_irrigation(zone_ids: List[str], duration: int):
+    """Activate every idle or scheduled irrigation system in the zones, in one bulk write"""
+    systems = await db.irrigation_systems.find(
+        {"zone_id": {"$in": zone_ids}, "status": {"$in": [IrrigationStatus.IDLE, IrrigationStatus.SCHEDULED]}},
+        {"_id": 0, "id": 1, "zone_id": 1, "status": 1, "gateway_id": 1},
+    ).to_list(length=None)
+    if not systems:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    update = {"status": IrrigationStatus.ACTIVE, "duration": duration, "last_activated": now}
+    await update_many_synced("irrigation_systems", [
+        ({"id": system["id"], "status": system["status"]}, dict(update)) for system in systems
+    ])
+    for system in systems:
+        irrigation_scheduler.schedule_stop(system["id"], now, duration)
+        send_valve_command(system, True, duration)
+        event_hub.publish("irrigation", "irrigation", (system["id"],), {"id": system["id"], **update}, zone_id=system["zone_id"])
+    dashboard_cache.invalidate()
+
+async def flush_sensor_buffer(readings: List[SensorData]):
+    write_errors, _ = await write_sensor_batch(readings)
+    if write_errors:
+        logger.warning("Write-behind flush rejected %d of %d readings", len(write_errors), len(readings))
+
+@api_router.get("/ingest/stats")
+async def get_ingest_stats():
+    """Write-behind buffer depth, throughput and flush latency counters"""
+    stats = {"write_behind": ingest_buffer is not None, "dedup": dedup_cache.stats(), "telemetry": fleet.stats()}
+    if ingest_buffer is not None:
+        stats.update(ingest_buffer.stats())
+    return stats
+
+async def ingest_sensor_batch(readings: List[SensorData], positions: List[int], errors: List[SensorBatchError]) -> SensorBatchResult:
+    """Drop retransmits, write validated readings and merge write failures into the per-item report"""
+    fresh = []
+    fresh_positions = []
+    duplicates = 0
+    for reading, position in zip(readings, positions):
+        if is_duplicate_reading(reading):
+            duplicates += 1
+        else:
+            fresh.append(reading)
+            fresh_positions.append(position)
+
+    classify_readings(fresh)
+    write_errors, write_duplicates = await write_sensor_batch(fresh)
+    ids = []
+    for position, reading in enumerate(fresh):
+        if position in write_errors:
+            errors.append(SensorBatchError(index=fresh_positions[position], error=write_errors[position]))
+        elif position in write_duplicates:
+            duplicates += 1
+        else:
+            ids.append(reading.id)
+    errors.sort(key=lambda err: err.index)
+
+    return SensorBatchResult(accepted=len(ids), rejected=len(errors), duplicates=duplicates, ids=ids, errors=errors)
+
+@api_router.post("/sensors/batch", response_model=SensorBatchResult)
+async def create_sensor_data_batch(batch: SensorBatchCreate):
+    """Bulk ingest for gateways - validates every reading and writes the valid ones at once"""
+    if len(batch.readings) > SENSOR_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {SENSOR_BATCH_MAX} readings")
+
+    valid = []
+    positions = []
+    errors = []
+    for index, item in enumerate(batch.readings):
+        try:
+            valid.append(build_sensor_reading(SensorDataCreate(**item).dict()))
+            positions.append(index)
+        except ValidationError as e:
+            errors.append(SensorBatchError(index=index, error=format_validation_error(e)))
+        except ValueError as e:
+            errors.append(SensorBatchError(index=index, error=str(e)))
+
+    return await ingest_sensor_batch(valid, positions, errors)
+
+@api_router.post("/sensors/frame", response_model=SensorBatchResult)
+async def create_sensor_data_frame(request: Request):
+    """Bulk ingest from a compact binary frame (application/x-sensor-frame)"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != FRAME_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {FRAME_CONTENT_TYPE}")
+    try:
+        device_id, records = decode_frame(await request.body())
+    except FrameError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(records) > SENSOR_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {SENSOR_BATCH_MAX} readings")
+
+    received_at = datetime.now(timezone.utc)
+    valid = []
+    positions = []
+    errors = []
+    for index, (zone_id, code, value, timestamp, sequence) in enumerate(records):
+        if code >= len(SENSOR_TYPE_CODES):
+            errors.append(SensorBatchError(index=index, error=f"sensor_type: unknown code {code}"))
+            continue
+        sensor_type = SENSOR_TYPE_CODES[code]
+        try:
+            valid.append(build_sensor_reading({
+                "zone_id": zone_id,
+                "sensor_type": sensor_type,
+                "value": value,
+                "unit": SENSOR_UNITS[sensor_type],
+                "timestamp": timestamp or received_at,
+                "device_id": device_id,
+                "sequence": sequence,
+            }))
+        except ValueError as e:
+            errors.append(SensorBatchError(index=index, error=str(e)))
+            continue
+        positions.append(index)
+
+    return await ingest_sensor_batch(valid, positions, errors)
+
 @api_router.get("/sensors", response_model=List[SensorData])
-async def get_sensor_data(zone_id: Optional[str] = None, sensor_type: Optional[str] = None, limit: int = 100):
+async def get_sensor_data(response: Response, zone_id: Optional[str] = None, sensor_type: Optional[str] = None,
+                          limit: int = 100, since: Optional[int] = None):
     query = {}
     if zone_id:
         query["zone_id"] = zone_id
     if sensor_type:
         query["sensor_type"] = sensor_type
     
-    sensors = await db.sensor_data.find(query).sort("timestamp", -1).limit(limit).to_list(length=None)
+    sensors = await list_synced("sensor_data", response, since, query, "timestamp", limit)
     return [SensorData(**sensor) for sensor in sensors]
 
 # Farm Zones Endpoints
 @api_router.post("/zones", response_model=FarmZone)
 async def create_farm_zone(zone: FarmZoneCreate):
+    if zone.boundary is not None and len(zone.boundary) < 3:
+        raise HTTPException(status_code=400, detail="boundary needs at least three [lat, lng] points")
     zone_dict = zone.dict()
     zone_obj = FarmZone(**zone_dict)
+    try:
+        compile_thresholds(zone_obj.irrigation_threshold)
+        rule_engine.compile_zone(zone_obj.id, zone_obj.irrigation_threshold)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid irrigation_threshold: {e}")
     await db.farm_zones.insert_one(zone_obj.dict())
+    zone_thresholds.set_zone(zone_obj.id, zone_obj.irrigation_threshold)
+    rule_engine.set_zone(zone_obj.id, zone_obj.irrigation_threshold)
+    zone_index.put(zone_obj.dict())
+    dashboard_cache.invalidate()
     return zone_obj
 
 @api_router.get("/zones", response_model=List[FarmZone])
@@ -179,183 +784,662 @@ async def get_farm_zones():
     zones = await db.farm_zones.find().to_list(length=None)
     return [FarmZone(**zone) for zone in zones]
 
+@api_router.get("/zones/locate")
+async def locate_zone(lat: float, lng: float):
+    """Zone containing a coordinate (from the in-memory zone index)"""
+    matches = zone_index.locate(lat, lng)
+    if not matches:
+        raise HTTPException(status_code=404, detail="No zone contains this point")
+    return {
+        "zone": FarmZone(**zone_index.documents[matches[0][1]]),
+        "distance_to_center_m": round(matches[0][0], 1),
+        "overlapping_zone_ids": [zone_id for _, zone_id in matches[1:]],
+    }
+
 # Irrigation System Endpoints
 @api_router.post("/irrigation", response_model=IrrigationSystem)
 async def create_irrigation_system(irrigation: IrrigationSystemCreate):
     irrigation_dict = irrigation.dict()
     irrigation_obj = IrrigationSystem(**irrigation_dict)
-    await db.irrigation_systems.insert_one(irrigation_obj.dict())
+    document = irrigation_obj.dict()
+    await insert_synced("irrigation_systems", [document])
+    irrigation_obj.change_seq = document["change_seq"]
+    if irrigation_obj.status == IrrigationStatus.SCHEDULED and irrigation_obj.scheduled_time is not None:
+        scheduled_time = as_datetime(irrigation_obj.scheduled_time)
+        irrigation_scheduler.schedule(irrigation_obj.id, START, scheduled_time.timestamp())
+    dashboard_cache.invalidate()
+    event_hub.publish("irrigation", "irrigation", (irrigation_obj.id,), irrigation_obj, zone_id=irrigation_obj.zone_id)
     return irrigation_obj
 
 @api_router.get("/irrigation", response_model=List[IrrigationSystem])
-async def get_irrigation_systems(zone_id: Optional[str] = None):
+async def get_irrigation_systems(response: Response, zone_id: Optional[str] = None, since: Optional[int] = None):
     query = {}
     if zone_id:
         query["zone_id"] = zone_id
         
-    systems = await db.irrigation_systems.find(query).sort("created_at", -1).to_list(length=None)
+    systems = await list_synced("irrigation_systems", response, since, query, "created_at")
     return [IrrigationSystem(**system) for system in systems]
 
 @api_router.put("/irrigation/{system_id}/activate")
 async def activate_irrigation(system_id: str, duration: int = 10):
-    result = await db.irrigation_systems.update_one(
-        {"id": system_id},
-        {
-            "$set": {
-                "status": IrrigationStatus.ACTIVE,
-                "duration": duration,
-                "last_activated": datetime.now(timezone.utc).isoformat()
-            }
-        }
+    if duration < 1:
+        raise HTTPException(status_code=400, detail="duration must be at least 1 minute")
+    update = {
+        "status": IrrigationStatus.ACTIVE,
+        "duration": duration,
+        "last_activated": datetime.now(timezone.utc).isoformat()
+    }
+    system = await update_synced(
+        "irrigation_systems", {"id": system_id}, update, {"_id": 0, "id": 1, "zone_id": 1, "gateway_id": 1}
     )
-    if result.modified_count == 0:
+    if system is None:
         raise HTTPException(status_code=404, detail="Irrigation system not found")
+    irrigation_scheduler.schedule_stop(system_id, update["last_activated"], duration)
+    send_valve_command(system, True, duration)
+    dashboard_cache.invalidate()
+    event_hub.publish("irrigation", "irrigation", (system_id,), {"id": system_id, **update}, zone_id=system.get("zone_id"))
     return {"message": "Irrigation system activated", "duration": duration}
 
+def bulk_item_positions(ids: List[str]) -> Dict[str, int]:
+    """Position of the item that applies to each id; a later item for the same id wins"""
+    if len(ids) > BULK_COMMAND_MAX:
+        raise HTTPException(status_code=413, detail=f"Request exceeds {BULK_COMMAND_MAX} items")
+    return {item_id: index for index, item_id in enumerate(ids)}
+
+def bulk_item_results(ids: List[str], positions: Dict[str, int], applied: Set[str], status: str,
+                      errors: Dict[str, str]) -> dict:
+    results = []
+    not_found = []
+    for index, item_id in enumerate(ids):
+        if positions[item_id] != index:
+            results.append({"index": index, "id": item_id, "status": "superseded"})
+        elif item_id in errors:
+            results.append({"index": index, "id": item_id, "status": "rejected", "error": errors[item_id]})
+        elif item_id in applied:
+            results.append({"index": index, "id": item_id, "status": status})
+        else:
+            results.append({"index": index, "id": item_id, "status": "not_found"})
+            not_found.append(item_id)
+    return {"results": results, "not_found": not_found}
+
+@api_router.post("/irrigation/activate")
+async def activate_irrigation_bulk(request: BulkIrrigationActivation):
+    """Activate many irrigation systems in one bulk_write; unknown ids are reported per item"""
+    ids = [item.id for item in request.items]
+    positions = bulk_item_positions(ids)
+    errors = {
+        item_id: "duration must be at least 1 minute"
+        for item_id, index in positions.items() if request.items[index].duration < 1
+    }
+    systems = {
+        system["id"]: system
+        for system in await db.irrigation_systems.find(
+            {"id": {"$in": [item_id for item_id in positions if item_id not in errors]}},
+            {"_id": 0, "id": 1, "zone_id": 1, "gateway_id": 1},
+        ).to_list(length=None)
+    }
+    now = datetime.now(timezone.utc).isoformat()
+    updates = {
+        system_id: {"status": IrrigationStatus.ACTIVE, "duration": request.items[positions[system_id]].duration, "last_activated": now}
+        for system_id in systems
+    }
+    if updates:
+        await update_many_synced("irrigation_systems", [({"id": system_id}, fields) for system_id, fields in updates.items()])
+        for system_id, fields in updates.items():
+            irrigation_scheduler.schedule_stop(system_id, now, fields["duration"])
+            send_valve_command(systems[system_id], True, fields["duration"])
+            event_hub.publish("irrigation", "irrigation", (system_id,), {"id": system_id, **fields}, zone_id=systems[system_id]["zone_id"])
+        dashboard_cache.invalidate()
+    return {"activated": len(updates), **bulk_item_results(ids, positions, set(updates), "activated", errors)}
+
+@api_router.put("/irrigation/{system_id}/schedule")
+async def schedule_irrigation(system_id: str, start_time: datetime, duration: Optional[int] = None):
+    """Schedule a run; the scheduler starts it at start_time and stops it after duration minutes"""
+    start_time = as_datetime(start_time)
+    if duration is not None and duration < 1:
+        raise HTTPException(status_code=400, detail="duration must be at least 1 minute")
+    update = {"status": IrrigationStatus.SCHEDULED, "scheduled_time": start_time}
+    if duration is not None:
+        update["duration"] = duration
+    system = await update_synced("irrigation_systems", {"id": system_id}, update, {"_id": 0, "zone_id": 1})
+    if system is None:
+        raise HTTPException(status_code=404, detail="Irrigation system not found")
+    irrigation_scheduler.schedule(system_id, START, start_time.timestamp())
+    dashboard_cache.invalidate()
+    event_hub.publish("irrigation", "irrigation", (system_id,), {"id": system_id, **update}, zone_id=system.get("zone_id"))
+    return {"message": "Irrigation run scheduled", "start_time": start_time.isoformat(), "duration": duration}
+
+@api_router.get("/rules")
+async def get_rule_status():
+    """Threshold rule counters, recent firings and drone tasks waiting for a drone"""
+    return {
+        **rule_engine.stats(),
+        "recent": [
+            {**firing, "at": datetime.fromtimestamp(firing["at"], tz=timezone.utc).isoformat()}
+            for firing in reversed(rule_engine.recent)
+        ],
+        "queued_drone_tasks": [task.dict() for task in queued_drone_tasks.values()],
+    }
+
+def send_valve_command(system: dict, open_valve: bool, duration: Optional[int] = None) -> str:
+    """Queue an open/close command for the system's valve on its gateway (zone_id when it has none)"""
+    payload = {"action": "open" if open_valve else "close"}
+    if open_valve:
+        payload["duration"] = duration or IRRIGATION_DEFAULT_DURATION_MINUTES
+    return command_bus.submit(system.get("gateway_id") or system["zone_id"], VALVE, system["id"], payload)
+
+def is_simulated(drone: Optional[DroneState]) -> bool:
+    return drone is not None and (drone.name or "").startswith(FLEET_SIM_NAME_PREFIX)
+
+def send_mission_commands(missions: Dict[str, dict]):
+    """Queue mission commands; each drone is its own gateway. Simulated drones get none"""
+    command_bus.submit_many(
+        (drone_id, MISSION, drone_id, {
+            "target_lat": fields["target_lat"],
+            "target_lng": fields["target_lng"],
+            "payload_type": fields.get("payload_type"),
+        })
+        for drone_id, fields in missions.items() if not is_simulated(fleet.drones.get(drone_id))
+    )
+
+@api_router.get("/commands")
+async def get_command_status(gateway_id: Optional[str] = None, limit: int = 100):
+    """Command bus counters and the commands still waiting for an ack"""
+    return {**command_bus.stats(), "waiting": command_bus.unacked(gateway_id, limit)}
+
+@api_router.post("/commands/ack")
+async def ack_commands(ack: CommandAck):
+    """Ack delivered commands over HTTP, for gateways that are not on MQTT"""
+    unknown = command_bus.ack(ack.gateway_id, ack.ids)
+    return {"acked": len(ack.ids) - len(unknown), "unknown": unknown}
+
+@api_router.get("/irrigation/scheduler")
+async def get_irrigation_scheduler():
+    """Pending starts/stops and the next deadline of the irrigation scheduler"""
+    return irrigation_scheduler.stats()
+
+async def run_irrigation_events(events):
+    """Start due scheduled runs and stop finished ones in one bulk write
+
+    Each update only applies if the system is still in the state the event
+    was planned for, so a run that was rescheduled, restarted or already
+    handled by another worker is left alone.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    starts = [system_id for kind, system_id, _ in events if kind == START]
+    updates = [
+        ({"id": system_id, "status": IrrigationStatus.SCHEDULED}, {"status": IrrigationStatus.ACTIVE, "last_activated": now})
+        for system_id in starts
+    ] + [
+        ({"id": system_id, "status": IrrigationStatus.ACTIVE, "last_activated": token}, {"status": IrrigationStatus.IDLE})
+        for kind, system_id, token in events if kind != START
+    ]
+    if not updates:
+        return
+    await update_many_synced("irrigation_systems", updates)
+
+    changed = await db.irrigation_systems.find(
+        {"id": {"$in": [system_id for _, system_id, _ in events]}}, {"_id": 0}
+    ).to_list(length=None)
+    kinds = {system_id: kind for kind, system_id, _ in events}
+    ended = datetime.now(timezone.utc)
+    finished = []
+    for system in changed:
+        # Covers runs started here and runs a concurrent reload saw before they started
+        if system["status"] == IrrigationStatus.ACTIVE and system.get("last_activated") is not None:
+            irrigation_scheduler.schedule_stop(system["id"], system["last_activated"], system.get("duration"))
+            if kinds[system["id"]] == START:
+                send_valve_command(system, True, system.get("duration"))
+        elif system["status"] == IrrigationStatus.IDLE and kinds[system["id"]] != START:
+            send_valve_command(system, False)
+            finished.append(usage.irrigation_usage(system, ended, IRRIGATION_DEFAULT_DURATION_MINUTES))
+        event_hub.publish("irrigation", "irrigation", (system["id"],), IrrigationSystem(**system), zone_id=system.get("zone_id"))
+    dashboard_cache.invalidate()
+    await record_usage([event for event in finished if event is not None])
+
+async def record_usage(events: List[dict]):
+    try:
+        await usage.record(db, events)
+    except Exception:
+        # The run itself is done; `python usage.py rebuild` repairs the daily totals from stored events
+        logger.exception("Usage accounting failed for %d events", len(events))
+
+@api_router.get("/usage")
+async def get_usage_report(start: Optional[date] = None, end: Optional[date] = None, zone_id: Optional[str] = None,
+                           group_by: str = "zone,type"):
+    """Water and fertilizer used between start and end (exclusive), from the daily usage totals"""
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start).days > USAGE_REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range exceeds {USAGE_REPORT_MAX_DAYS} days")
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in REPORT_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by {', '.join(unknown)}; use {', '.join(REPORT_GROUPS)}")
+
+    started = time.perf_counter()
+    rows = await usage.report(db, start, end, groups, zone_id)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "group_by": groups,
+        "totals": {
+            "liters": round(sum(row["liters"] for row in rows), 3),
+            "minutes": round(sum(row["minutes"] for row in rows), 3),
+            "events": sum(row["events"] for row in rows),
+        },
+        "rows": rows,
+        "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+irrigation_scheduler = IrrigationScheduler(run_irrigation_events, default_duration_minutes=IRRIGATION_DEFAULT_DURATION_MINUTES)
+
 # Drone Endpoints
 @api_router.post("/drones", response_model=DroneData)
 async def create_drone(drone: DroneDataCreate):
     drone_dict = drone.dict()
     drone_obj = DroneData(**drone_dict)
-    await db.drones.insert_one(drone_obj.dict())
+    document = drone_obj.dict()
+    await insert_synced("drones", [document])
+    drone_obj.change_seq = document["change_seq"]
+    fleet.merge_document(document)
+    dashboard_cache.invalidate()
+    event_hub.publish("drones", "drone", (drone_obj.id,), drone_obj, drone_id=drone_obj.id)
     return drone_obj
 
 @api_router.get("/drones", response_model=List[DroneData])
-async def get_drones():
-    drones = await db.drones.find().sort("last_updated", -1).to_list(length=None)
+async def get_drones(response: Response, since: Optional[int] = None):
+    drones = await list_synced("drones", response, since, {}, "last_updated")
     return [DroneData(**drone) for drone in drones]
 
 @api_router.put("/drones/{drone_id}/mission")
 async def send_drone_mission(drone_id: str, target_lat: float, target_lng: float, payload_type: str):
-    result = await db.drones.update_one(
-        {"id": drone_id},
-        {
-            "$set": {
-                "status": DroneStatus.IN_FLIGHT,
-                "target_lat": target_lat,
-                "target_lng": target_lng,
-                "payload_type": payload_type,
-                "last_updated": datetime.now(timezone.utc).isoformat()
+    mission = {
+        "status": DroneStatus.IN_FLIGHT.value,
+        "target_lat": target_lat,
+        "target_lng": target_lng,
+        "payload_type": payload_type,
+    }
+    await update_drone_state(drone_id, mission, persist=True)
+    send_mission_commands({drone_id: mission})
+    return {"message": "Mission assigned to drone", "target": {"lat": target_lat, "lng": target_lng}}
+
+@api_router.post("/drones/missions")
+async def send_drone_missions(request: BulkDroneMission):
+    """Assign missions to many drones, persisted in one bulk_write; unknown ids are reported per item"""
+    ids = [item.id for item in request.items]
+    positions = bulk_item_positions(ids)
+    missing = [drone_id for drone_id in positions if drone_id not in fleet]
+    if missing:
+        # Drones created by another worker since the last fleet refresh
+        async for document in db.drones.find({"id": {"$in": missing}}, {"_id": 0}):
+            fleet.merge_document(document)
+    missions = {}
+    for drone_id, index in positions.items():
+        if drone_id in fleet:
+            item = request.items[index]
+            missions[drone_id] = {
+                "status": DroneStatus.IN_FLIGHT.value,
+                "target_lat": item.target_lat,
+                "target_lng": item.target_lng,
+                "payload_type": item.payload_type or fleet.drones[drone_id].payload_type,
             }
-        }
+    if missions:
+        await apply_drone_updates(missions, persist=True)
+        send_mission_commands(missions)
+    return {"assigned": len(missions), **bulk_item_results(ids, positions, set(missions), "assigned", {})}
+
+@api_router.post("/drones/{drone_id}/mission/plan")
+async def plan_drone_mission(drone_id: str, request: MissionPlanRequest):
+    """Boustrophedon coverage plan for spraying a zone, split into sorties by battery and payload"""
+    drone = fleet.drones.get(drone_id)
+    if drone is None:
+        document = await db.drones.find_one({"id": drone_id}, {"_id": 0})
+        if document is None:
+            raise HTTPException(status_code=404, detail="Drone not found")
+        drone = DroneState(document)
+    zone = zone_index.documents.get(request.zone_id) or await db.farm_zones.find_one({"id": request.zone_id}, {"_id": 0})
+    if zone is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
+
+    boundary = zone.get("boundary")
+    boundary_source = "boundary"
+    if not boundary:
+        boundary = square_boundary(zone["latitude"], zone["longitude"], zone["area_size"])
+        boundary_source = "area_square"
+    started = time.perf_counter()
+    try:
+        plan = plan_coverage(
+            boundary,
+            home=(drone.lat, drone.lng),
+            swath=request.swath_width_m,
+            angle_deg=request.angle_deg,
+            battery_percent=drone.battery or 0.0,
+            payload_percent=drone.payload if drone.payload is not None else 100.0,
+            full_range_m=request.full_range_m or MISSION_FULL_RANGE_M,
+            tank_coverage_ha=request.tank_coverage_ha or MISSION_TANK_COVERAGE_HA,
+            reserve_percent=MISSION_RESERVE_PERCENT if request.reserve_percent is None else request.reserve_percent,
+        )
+    except PlanningError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {
+        "drone_id": drone_id,
+        "zone_id": request.zone_id,
+        "boundary_source": boundary_source,
+        "swath_width_m": request.swath_width_m,
+        **plan,
+        "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+@api_router.post("/drones/dispatch")
+async def dispatch_drones(request: DispatchRequest):
+    """Assign idle drones to many zone tasks at once, minimizing total distance, in one bulk write"""
+    return await assign_drone_tasks(request.tasks, request.min_payload, request.dry_run)
+
+async def assign_drone_tasks(requested: List[DispatchTask], min_payload: float, dry_run: bool = False) -> dict:
+    started = time.perf_counter()
+    unassigned = []
+    tasks = []
+    for index, task in enumerate(requested):
+        zone = zone_index.documents.get(task.zone_id)
+        if zone is None:
+            unassigned.append({"task": index, "zone_id": task.zone_id, "reason": "zone not found"})
+        else:
+            tasks.append((index, task, zone))
+    drones = [
+        drone for drone in fleet.drones.values()
+        if drone.status == DroneStatus.IDLE.value and drone.lat is not None and drone.lng is not None
+        and (FLEET_SIM_DISPATCH or not is_simulated(drone))
+    ]
+    matches = plan_dispatch(
+        [drone.lat for drone in drones], [drone.lng for drone in drones],
+        [drone.battery or 0.0 for drone in drones], [drone.payload or 0.0 for drone in drones],
+        [drone.payload_type for drone in drones],
+        [zone["latitude"] for _, _, zone in tasks], [zone["longitude"] for _, _, zone in tasks],
+        [task.payload_type for _, task, _ in tasks],
+        full_range_m=MISSION_FULL_RANGE_M, reserve_percent=MISSION_RESERVE_PERCENT, min_payload=min_payload,
     )
-    if result.modified_count == 0:
+
+    assignments = []
+    matched = set()
+    for task_position, drone_position, distance in matches:
+        index, task, zone = tasks[task_position]
+        drone = drones[drone_position]
+        matched.add(task_position)
+        assignments.append({
+            "task": index,
+            "zone_id": task.zone_id,
+            "drone_id": drone.id,
+            "payload_type": task.payload_type or drone.payload_type,
+            "target": {"lat": zone["latitude"], "lng": zone["longitude"]},
+            "distance_m": round(distance, 1),
+        })
+    unassigned += [
+        {"task": index, "zone_id": task.zone_id, "reason": "no eligible drone"}
+        for position, (index, task, _) in enumerate(tasks) if position not in matched
+    ]
+
+    if assignments and not dry_run:
+        missions = {
+            assignment["drone_id"]: {
+                "status": DroneStatus.IN_FLIGHT.value,
+                "target_lat": assignment["target"]["lat"],
+                "target_lng": assignment["target"]["lng"],
+                "payload_type": assignment["payload_type"],
+            }
+            for assignment in assignments
+        }
+        await apply_drone_updates(missions, persist=True)
+        send_mission_commands(missions)
+
+    return {
+        "assignments": assignments,
+        "unassigned": sorted(unassigned, key=lambda item: item["task"]),
+        "total_distance_m": round(sum(assignment["distance_m"] for assignment in assignments), 1),
+        "dry_run": dry_run,
+        "compute_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+async def update_drone_state(drone_id: str, fields: dict, persist: bool = False):
+    """Apply DroneState attribute changes, persisting and refreshing the dashboard on status change"""
+    if drone_id not in fleet:
+        # Created by another worker since the last fleet refresh
+        document = await db.drones.find_one({"id": drone_id}, {"_id": 0})
+        if document is None:
+            raise HTTPException(status_code=404, detail="Drone not found")
+        fleet.merge_document(document)
+    await apply_drone_updates({drone_id: fields}, persist=persist)
+
+async def apply_drone_updates(updates: Dict[str, dict], persist: bool = False, account_usage: bool = True):
+    """Apply DroneState changes to in-memory drones; status changes (or all, with persist) go out in one bulk_write"""
+    to_persist = []
+    sprays = []
+    for drone_id, fields in updates.items():
+        previous_status = fleet.update(drone_id, fields)
+        if previous_status is not None or persist:
+            to_persist.append(drone_id)
+        drone = fleet.drones[drone_id]
+        if fields.get("lat") is not None:
+            tracks.record(drone_id, drone.updated, drone.lat, drone.lng, drone.altitude, drone.battery, drone.status)
+        if previous_status is not None and account_usage:
+            if previous_status == DroneStatus.SPRAYING.value:
+                sprays.append(spray_meter.finish(drone_id, drone.updated, drone.payload))
+            if drone.status == DroneStatus.SPRAYING.value:
+                zones = zone_index.locate(drone.lat, drone.lng) if drone.lat is not None and drone.lng is not None else []
+                spray_meter.start(drone_id, drone.updated, drone.payload, zones[0][1] if zones else None, drone.payload_type)
+    if to_persist:
+        await fleet.persist(db, change_sequence, to_persist)
+        dashboard_cache.invalidate()
+    sprays = [event for event in sprays if event is not None]
+    if sprays:
+        await record_usage(sprays)
+    for drone_id, fields in updates.items():
+        changed = {DroneState.FIELDS[attribute]: value for attribute, value in fields.items() if value is not None}
+        event_hub.publish("drones", "drone", (drone_id,), {"id": drone_id, **changed}, drone_id=drone_id)
+
+@api_router.post("/drones/{drone_id}/telemetry")
+async def report_drone_telemetry(drone_id: str, telemetry: DroneTelemetry):
+    """High-rate position/battery report; persisted in batches, or at once when status changes"""
+    fleet.telemetry_count += 1
+    await update_drone_state(drone_id, {
+        "lat": telemetry.lat,
+        "lng": telemetry.lng,
+        "altitude": telemetry.altitude,
+        "heading": telemetry.heading,
+        "speed": telemetry.speed,
+        "battery": telemetry.battery_level,
+        "payload": telemetry.payload_remaining,
+        "status": telemetry.status.value if telemetry.status else None,
+    })
+    return {"message": "Telemetry accepted"}
+
+@api_router.get("/drones/{drone_id}/track")
+async def get_drone_track(drone_id: str, from_: Optional[datetime] = Query(None, alias="from"),
+                          to: Optional[datetime] = None, flight: Optional[int] = None,
+                          max_points: Optional[int] = None):
+    """Recorded positions of a drone as columns (default: the last 24 hours)"""
+    end = to or datetime.now(timezone.utc)
+    start = from_ or end - timedelta(hours=24)
+    start, end = as_datetime(start), as_datetime(end)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    if max_points is not None and max_points < 2:
+        raise HTTPException(status_code=400, detail="max_points must be at least 2")
+    if drone_id not in fleet and await db.drones.find_one({"id": drone_id}, {"_id": 1}) is None:
         raise HTTPException(status_code=404, detail="Drone not found")
-    return {"message": "Mission assigned to drone", "target": {"lat": target_lat, "lng": target_lng}}
+
+    samples, flights = await load_track(db, tracks, drone_id, start, end, flight)
+    body = {"drone_id": drone_id, "from": start.isoformat(), "to": end.isoformat(), **track_columns(samples, flights, max_points)}
+    # Built by hand: a day of 10 Hz samples is too large for jsonable_encoder
+    return Response(content=json.dumps(body), media_type="application/json")
+
+@api_router.get("/sensors/latest")
+async def get_latest_sensor_data(zone_id: Optional[str] = None):
+    """Current farm state: the newest reading of each sensor type in each zone"""
+    zones = latest_readings.snapshot(zone_id)
+    return {
+        "zones": {
+            zone: {sensor_type: SensorData(**reading) for sensor_type, reading in readings.items()}
+            for zone, readings in zones.items()
+        },
+        "last_updated": datetime.now(timezone.utc).isoformat(),
+    }
 
 @api_router.get("/sensors/historical")
-async def get_historical_sensor_data(zone_id: Optional[str] = None, hours: int = 24):
-    """Get historical sensor data for charts - hourly aggregated"""
-    # Get all sensor data (we'll simulate historical data from existing data)
-    query = {}
-    if zone_id:
-        query["zone_id"] = zone_id
-    
-    sensors = await db.sensor_data.find(query).sort("timestamp", -1).limit(hours * 7).to_list(length=None)
-    
-    if not sensors:
-        return {"data": [], "hours": hours, "zone_id": zone_id}
-    
-    # Create simulated hourly data for the last 24 hours
-    from datetime import datetime, timezone, timedelta
-    import random
-    
-    end_time = datetime.now(timezone.utc)
-    chart_data = []
-    
-    # Generate hourly data points
-    for i in range(hours):
-        hour_time = end_time - timedelta(hours=hours-1-i)
-        hour_data = {"time": hour_time.isoformat()}
-        
-        # For each sensor type, create realistic trending values
-        base_sensors = {}
-        for sensor in sensors:
-            sensor_type = sensor["sensor_type"]
-            if sensor_type not in base_sensors:
-                base_sensors[sensor_type] = sensor["value"]
-        
-        for sensor_type, base_value in base_sensors.items():
-            # Add hourly variation
-            if sensor_type == "soil_moisture":
-                # Moisture patterns (higher at night, lower during day)
-                hour = hour_time.hour
-                if 6 <= hour <= 18:  # Day time
-                    variation = -random.uniform(2, 8)
-                else:  # Night time
-                    variation = random.uniform(0, 5)
-                hour_data[sensor_type] = max(15, min(80, base_value + variation))
-                
-            elif sensor_type in ["nutrient_n", "nutrient_p", "nutrient_k"]:
-                # Nutrients decrease over time, spike at specific hours
-                if i % 8 == 0:  # Fertilization every 8 hours
-                    variation = random.uniform(10, 25)
-                else:
-                    variation = -random.uniform(0.5, 3)
-                hour_data[sensor_type] = max(10, min(120, base_value + variation))
-                
-            else:
-                # Other sensors with small random variations
-                variation = random.uniform(-2, 2)
-                hour_data[sensor_type] = round(base_value + variation, 1)
-        
-        chart_data.append(hour_data)
-    
-    return {"data": chart_data, "hours": hours, "zone_id": zone_id}
+async def get_historical_sensor_data(zone_id: Optional[str] = None, hours: int = 24, bucket: str = "1h",
+                                     max_points: int = HISTORY_MAX_POINTS, fill: str = "none"):
+    """Get historical sensor data for charts - mean/min/max per time bucket (5m, 1h or 1d)"""
+    width = history.BUCKET_WIDTHS.get(bucket)
+    if width is None:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(history.BUCKET_WIDTHS)}")
+    if hours < 1 or hours > HISTORY_MAX_HOURS:
+        raise HTTPException(status_code=400, detail=f"hours must be between 1 and {HISTORY_MAX_HOURS}")
+    if not history.from_rollups(width) and hours > HISTORY_RAW_MAX_HOURS:
+        raise HTTPException(status_code=400, detail=f"{bucket} buckets allow at most {HISTORY_RAW_MAX_HOURS} hours; use 1h or 1d for longer ranges")
+    if fill not in resample.FILL_METHODS:
+        raise HTTPException(status_code=400, detail=f"fill must be one of {', '.join(resample.FILL_METHODS)}")
+    if max_points < 3:
+        raise HTTPException(status_code=400, detail="max_points must be at least 3")
+
+    now = datetime.now(timezone.utc)
+    if width > 3600:
+        # Start on the day `hours` ago, so hours=24 covers yesterday as well as today so far
+        start = history.bucket_start(now - timedelta(hours=hours), width)
+        buckets = int((history.bucket_start(now, width) - start).total_seconds()) // width + 1
+    else:
+        buckets = -(-hours * 3600 // width)
+        start = history.bucket_start(now, width) - timedelta(seconds=width * (buckets - 1))
+    series = await history.aggregate_history(db, start, width, zone_id)
+
+    if not series:
+        return {"data": [], "hours": hours, "bucket": bucket, "zone_id": zone_id}
+
+    chart_data = history.chart_rows(series, start, width, buckets, fill=fill, max_points=max_points)
+    return {"data": chart_data, "hours": hours, "bucket": bucket, "zone_id": zone_id}
+
+@api_router.get("/drones/nearest")
+async def get_nearest_drones(lat: float, lng: float, limit: int = 5, min_battery: float = 0.0, status: str = "idle"):
+    """Closest drones to a point, filtered by battery level and status (comma-separated, empty for any)"""
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    statuses = set(status.split(",")) if status else None
+    if statuses and not statuses <= {drone_status.value for drone_status in DroneStatus}:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(drone_status.value for drone_status in DroneStatus)}")
+    nearest = fleet.nearest(lat, lng, limit, min_battery=min_battery, statuses=statuses)
+    return {
+        "drones": [{**drone.position(), "distance_m": round(distance, 1)} for distance, drone in nearest],
+        "point": [lat, lng],
+    }
 
 @api_router.get("/drones/positions")
 async def get_drone_positions():
-    """Get real-time drone positions for map"""
-    drones = await db.drones.find().to_list(length=None)
-    positions = []
-    
-    for drone in drones:
-        position = {
-            "id": drone["id"],
-            "name": drone["drone_name"],
-            "status": drone["status"],
-            "battery": drone["battery_level"],
-            "payload": drone["payload_remaining"],
-            "payload_type": drone.get("payload_type", "unknown"),
-            "position": [drone["current_lat"], drone["current_lng"]],
-            "target": [drone.get("target_lat"), drone.get("target_lng")] if drone.get("target_lat") else None
-        }
-        positions.append(position)
-    
-    return {"drones": positions, "last_updated": datetime.now(timezone.utc).isoformat()}
+    """Get real-time drone positions for map (from the in-memory fleet state)"""
+    return {"drones": fleet.positions(), "last_updated": datetime.now(timezone.utc).isoformat()}
 
 # Dashboard Summary
-@api_router.get("/dashboard", response_model=DashboardSummary)
-async def get_dashboard_summary():
-    # Get counts
-    total_zones = await db.farm_zones.count_documents({})
-    active_irrigations = await db.irrigation_systems.count_documents({"status": IrrigationStatus.ACTIVE})
-    drones_active = await db.drones.count_documents({"status": {"$in": [DroneStatus.IN_FLIGHT, DroneStatus.SPRAYING]}})
-    critical_alerts = await db.sensor_data.count_documents({"alert_level": "critical"})
-    
-    # Get recent data
-    recent_sensors = await db.sensor_data.find().sort("timestamp", -1).limit(10).to_list(length=None)
-    irrigation_systems = await db.irrigation_systems.find().sort("created_at", -1).limit(5).to_list(length=None)
-    drone_fleet = await db.drones.find().sort("last_updated", -1).to_list(length=None)
-    
-    return DashboardSummary(
+async def build_dashboard_summary() -> bytes:
+    # All counts and recent-data queries go out at once
+    (
+        total_zones,
+        active_irrigations,
+        drones_active,
+        recent_sensors,
+        irrigation_systems,
+        drone_fleet,
+    ) = await asyncio.gather(
+        db.farm_zones.count_documents({}),
+        db.irrigation_systems.count_documents({"status": IrrigationStatus.ACTIVE}),
+        db.drones.count_documents({"status": {"$in": [DroneStatus.IN_FLIGHT, DroneStatus.SPRAYING]}}),
+        db.sensor_data.find().sort("timestamp", -1).limit(10).to_list(length=None),
+        db.irrigation_systems.find().sort("created_at", -1).limit(5).to_list(length=None),
+        db.drones.find().sort("last_updated", -1).to_list(length=None),
+    )
+
+    summary = DashboardSummary(
         total_zones=total_zones,
         active_irrigations=active_irrigations,
         drones_active=drones_active,
-        critical_alerts=critical_alerts,
+        critical_alerts=alert_counters.count("critical", ALERT_DASHBOARD_WINDOW),
         recent_sensor_data=[SensorData(**sensor) for sensor in recent_sensors],
         irrigation_systems=[IrrigationSystem(**system) for system in irrigation_systems],
         drone_fleet=[DroneData(**drone) for drone in drone_fleet]
     )
+    return json.dumps(jsonable_encoder(summary)).encode()
+
+@api_router.get("/dashboard", response_model=DashboardSummary)
+async def get_dashboard_summary(request: Request):
+    body, etag = await dashboard_cache.get(build_dashboard_summary)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.get("/alerts/stats")
+async def get_alert_stats(zone_id: Optional[str] = None):
+    """Warning and critical reading counts per zone over each rolling window"""
+    return {**alert_counters.stats(zone_id), "last_updated": datetime.now(timezone.utc).isoformat()}
+
+@api_router.get("/stream")
+async def stream_events(request: Request, topics: Optional[str] = None,
+                        zone_id: Optional[str] = None, drone_id: Optional[str] = None):
+    """Server-sent events for readings, drone updates and irrigation changes
+
+    topics, zone_id and drone_id take comma-separated lists; topics defaults to all.
+    """
+    wanted = set(topics.split(",")) if topics else set(PUSH_TOPICS)
+    unknown = wanted - set(PUSH_TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics {', '.join(sorted(unknown))}; expected {', '.join(PUSH_TOPICS)}")
+    zones = set(zone_id.split(",")) if zone_id else set()
+    drones = set(drone_id.split(",")) if drone_id else set()
+
+    subscriber = event_hub.subscribe(wanted, zones, drones)
+    return StreamingResponse(
+        event_hub.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/system/indexes")
+async def get_index_status():
+    """Build status of the indexes ensured at startup"""
+    return index_provisioner.report()
 
 # Clear all data for fresh simulation
 @api_router.delete("/clear-data")
 async def clear_all_data():
     """Clear all data for fresh simulation"""
-    await db.sensor_data.delete_many({})
+    if ingest_buffer is not None:
+        # Otherwise queued readings are written into the emptied collection
+        dropped = await ingest_buffer.discard()
+        if dropped:
+            logger.info("Discarded %d buffered readings before clearing data", dropped)
+    for collection in ("sensor_data", "irrigation_systems", "drones"):
+        async with change_sequence.reset(db, collection):
+            await db[collection].delete_many({})
     await db.farm_zones.delete_many({})
-    await db.irrigation_systems.delete_many({})
-    await db.drones.delete_many({})
+    await db[rollups.ROLLUP_COLLECTION].delete_many({})
+    await db[LATEST_COLLECTION].delete_many({})
+    await db[TRACK_COLLECTION].delete_many({})
+    await db[usage.USAGE_EVENTS].delete_many({})
+    await db[usage.USAGE_DAILY].delete_many({})
+    zone_thresholds.clear()
+    rule_engine.clear()
+    queued_drone_tasks.clear()
+    latest_readings.clear()
+    alert_counters.clear()
+    dedup_cache.clear()
+    await stop_fleet_simulation()
+    irrigation_scheduler.clear()
+    command_bus.clear()
+    tracks.clear()
+    spray_meter.clear()
+    fleet.clear()
+    zone_index.clear()
+    dashboard_cache.invalidate()
+    event_hub.resync("data cleared")
     return {"message": "All data cleared"}
 
 @api_router.post("/simulate-data")
@@ -373,6 +1457,9 @@ async def simulate_sensor_data():
         
         for zone in sample_zones:
             await db.farm_zones.insert_one(zone.dict())
+            zone_thresholds.set_zone(zone.id, zone.irrigation_threshold)
+            rule_engine.set_zone(zone.id, zone.irrigation_threshold)
+            zone_index.put(zone.dict())
         
         zones = await db.farm_zones.find().to_list(length=None)
     
@@ -389,6 +1476,7 @@ async def simulate_sensor_data():
     ]
     
     created_sensors = []
+    generated = []
     
     # Generate data for the last 24 hours (hourly)
     for hour_offset in range(24):
@@ -428,37 +1516,34 @@ async def simulate_sensor_data():
                 
                 value = round(base_value, 1)
                 
-                # Determine alert level
-                alert_level = "normal"
-                if sensor_type == SensorType.SOIL_MOISTURE and value < 30:
-                    alert_level = "critical" if value < 20 else "warning"
-                elif sensor_type in [SensorType.NUTRIENT_N, SensorType.NUTRIENT_P, SensorType.NUTRIENT_K] and value < 40:
-                    alert_level = "critical" if value < 25 else "warning"
-                
                 sensor_data = SensorData(
                     zone_id=zone["id"],
                     sensor_type=sensor_type,
                     value=value,
                     unit=unit,
-                    alert_level=alert_level,
                     timestamp=timestamp
                 )
                 
-                await db.sensor_data.insert_one(sensor_data.dict())
+                generated.append(sensor_data)
                 if hour_offset == 0:  # Only count current data
                     created_sensors.append(sensor_data)
     
+    classify_readings(generated)
+    await write_sensor_batch(generated)
+    
     # Create sample irrigation systems
     irrigation_count = await db.irrigation_systems.count_documents({})
     if irrigation_count == 0:
-        for zone in zones:
-            irrigation = IrrigationSystem(
+        irrigation_systems = [
+            IrrigationSystem(
                 zone_id=zone["id"],
                 status=random.choice([IrrigationStatus.IDLE, IrrigationStatus.SCHEDULED]),
                 fertilizer_type=random.choice(["NPK", "Organik", "Urea"]),
                 flow_rate=random.uniform(5.0, 15.0)
             )
-            await db.irrigation_systems.insert_one(irrigation.dict())
+            for zone in zones
+        ]
+        await insert_synced("irrigation_systems", [irrigation.dict() for irrigation in irrigation_systems])
     
     # Create sample drones with realistic positions
     drone_count = await db.drones.count_documents({})
@@ -472,11 +1557,106 @@ async def simulate_sensor_data():
             DroneData(drone_name="Drone-Cabai-3", status=DroneStatus.CHARGING, battery_level=25.0, 
                      current_lat=-7.393100, current_lng=109.676800, payload_remaining=100.0, payload_type="pestisida_organik"),
         ]
-        for drone in sample_drones:
-            await db.drones.insert_one(drone.dict())
+        await insert_synced("drones", [drone.dict() for drone in sample_drones])
+        await fleet.load(db)
     
+    dashboard_cache.invalidate()
+    event_hub.resync("data simulated")
     return {"message": "Historical data generated successfully", "sensors_created": len(created_sensors), "hours_generated": 24}
 
+async def run_fleet_simulation(simulation: FleetSimulation, tick: float):
+    """Step the simulated fleet every tick and apply it through the drone write path"""
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(tick)
+        now = time.perf_counter()
+        try:
+            changed = simulation.step(now - last)
+            updates = {drone_id: fields for drone_id, fields in simulation.updates(changed).items() if drone_id in fleet}
+            fleet.telemetry_count += len(updates)
+            # Simulated sprays are not real consumption
+            await apply_drone_updates(updates, account_usage=False)
+        except Exception:
+            logger.exception("Fleet simulation step failed")
+        simulation.last_tick_ms = (time.perf_counter() - now) * 1000
+        last = now
+
+async def stop_fleet_simulation(remove: bool = False) -> int:
+    """Stop the running simulation; with ``remove`` its drones are deleted. Returns the simulated drone count"""
+    global fleet_simulation, fleet_simulation_task
+    simulation, task = fleet_simulation, fleet_simulation_task
+    fleet_simulation = fleet_simulation_task = None
+    if simulation is None:
+        return 0
+    task.cancel()
+    background_tasks.remove(task)
+    await fleet.persist(db, change_sequence, simulation.ids)
+    if remove:
+        async with change_sequence.reset(db, "drones"):
+            await db.drones.delete_many({"id": {"$in": simulation.ids}})
+        await db[TRACK_COLLECTION].delete_many({"drone_id": {"$in": simulation.ids}})
+        tracks.discard(simulation.ids)
+        await fleet.load(db)
+        dashboard_cache.invalidate()
+        event_hub.resync("fleet simulation removed")
+    return len(simulation)
+
+@api_router.post("/simulate-fleet/start")
+async def start_fleet_simulation(config: FleetSimulationStart):
+    """Create a fleet of moving simulated drones for load testing"""
+    global fleet_simulation, fleet_simulation_task
+    if fleet_simulation is not None:
+        raise HTTPException(status_code=409, detail="Fleet simulation already running")
+    if config.drones < 1 or config.drones > FLEET_SIM_MAX_DRONES:
+        raise HTTPException(status_code=400, detail=f"drones must be between 1 and {FLEET_SIM_MAX_DRONES}")
+    if config.tick_ms < 20:
+        raise HTTPException(status_code=400, detail="tick_ms must be at least 20")
+
+    zones = list(zone_index.documents.values())
+    targets = [
+        (zone["latitude"], zone["longitude"], zone_index.zones[zone["id"]][2])
+        for zone in zones
+    ]
+    center = (
+        (sum(zone["latitude"] for zone in zones) / len(zones), sum(zone["longitude"] for zone in zones) / len(zones))
+        if zones else (-7.392220, 109.677500)
+    )
+    simulation = FleetSimulation(
+        [str(uuid.uuid4()) for _ in range(config.drones)], center, targets,
+        speed_mps=config.speed_mps, reserve_percent=MISSION_RESERVE_PERCENT, seed=config.seed,
+    )
+    documents = [DroneData(**document).dict() for document in simulation.documents(FLEET_SIM_NAME_PREFIX)]
+    await insert_synced("drones", documents)
+    for document in documents:
+        fleet.merge_document(document)
+    dashboard_cache.invalidate()
+    event_hub.resync("fleet simulation started")
+
+    fleet_simulation = simulation
+    fleet_simulation_task = asyncio.create_task(run_fleet_simulation(simulation, config.tick_ms / 1000))
+    background_tasks.append(fleet_simulation_task)
+    return {"message": "Fleet simulation started", "drones": len(simulation), "tick_ms": config.tick_ms}
+
+@api_router.post("/simulate-fleet/stop")
+async def stop_fleet_simulation_endpoint(remove: bool = True):
+    """Stop the fleet simulation, deleting its drones unless remove=false"""
+    stopped = await stop_fleet_simulation(remove)
+    if not stopped:
+        raise HTTPException(status_code=404, detail="No fleet simulation running")
+    return {"message": "Fleet simulation stopped", "drones": stopped, "removed": remove}
+
+@api_router.get("/simulate-fleet")
+async def get_fleet_simulation():
+    """Simulation progress: drones per status, ticks, and time spent per tick"""
+    if fleet_simulation is None:
+        return {"running": False, "fleet": fleet.stats()}
+    return {
+        "running": True,
+        **fleet_simulation.stats(),
+        "last_tick_ms": round(fleet_simulation.last_tick_ms, 2),
+        "fleet": fleet.stats(),
+    }
+
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -487,6 +1667,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", CHANGE_CURSOR_HEADER],
 )
 
 # Configure logging
@@ -496,6 +1677,175 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def refresh_zone_thresholds():
+    zones = await db.farm_zones.find({}, {"_id": 0}).to_list(length=None)
+    zone_thresholds.load(zones)
+    rule_engine.load(zones)
+    zone_index.load(zones)
+
+async def zone_threshold_refresher():
+    while True:
+        await asyncio.sleep(ZONE_THRESHOLD_REFRESH_SECONDS)
+        try:
+            await refresh_zone_thresholds()
+        except Exception:
+            logger.exception("Zone threshold refresh failed")
+
+@app.on_event("startup")
+async def load_zone_thresholds():
+    try:
+        await refresh_zone_thresholds()
+    except Exception:
+        logger.exception("Could not load zone thresholds, using defaults")
+    background_tasks.append(asyncio.create_task(zone_threshold_refresher()))
+
+async def sensor_latest_refresher():
+    while True:
+        await asyncio.sleep(SENSOR_LATEST_REFRESH_SECONDS)
+        try:
+            await latest_readings.load(db)
+        except Exception:
+            logger.exception("Latest sensor value refresh failed")
+
+@app.on_event("startup")
+async def load_latest_readings():
+    try:
+        await latest_readings.load(db)
+    except Exception:
+        logger.exception("Could not load latest sensor values")
+    background_tasks.append(asyncio.create_task(sensor_latest_refresher()))
+
+async def alert_counter_refresher(cursor: int):
+    while True:
+        await asyncio.sleep(ALERT_COUNTER_REFRESH_SECONDS)
+        try:
+            cursor = await alert_counters.catch_up(db, change_sequence, cursor)
+        except Exception:
+            logger.exception("Alert counter refresh failed")
+
+@app.on_event("startup")
+async def load_alert_counters():
+    cursor = 0
+    try:
+        cursor = await alert_counters.rebuild(db, change_sequence)
+    except Exception:
+        logger.exception("Could not rebuild alert counters")
+    background_tasks.append(asyncio.create_task(alert_counter_refresher(cursor)))
+
+async def fleet_persister(cursor: int):
+    while True:
+        await asyncio.sleep(FLEET_PERSIST_INTERVAL_MS / 1000)
+        try:
+            if await fleet.persist(db, change_sequence):
+                dashboard_cache.invalidate()
+            # Only drones other workers changed since the last pass
+            cursor = await fleet.sync(db, change_sequence, cursor)
+        except Exception:
+            logger.exception("Fleet state persistence failed")
+
+@app.on_event("startup")
+async def load_fleet_state():
+    cursor = 0
+    try:
+        # Read the cursor first: drones written meanwhile are merged on the first pass
+        cursor = await change_sequence.cursor(db, "drones")
+        await fleet.load(db)
+    except Exception:
+        logger.exception("Could not load drone fleet state")
+    background_tasks.append(asyncio.create_task(fleet_persister(cursor)))
+
+async def irrigation_schedule_refresher():
+    while True:
+        await asyncio.sleep(IRRIGATION_SCHEDULE_REFRESH_SECONDS)
+        try:
+            irrigation_scheduler.load(await db.irrigation_systems.find({}, {"_id": 0}).to_list(length=None))
+        except Exception:
+            logger.exception("Irrigation schedule reload failed")
+
+@app.on_event("startup")
+async def start_irrigation_scheduler():
+    try:
+        irrigation_scheduler.load(await db.irrigation_systems.find({}, {"_id": 0}).to_list(length=None))
+    except Exception:
+        logger.exception("Could not load irrigation schedule")
+    irrigation_scheduler.start()
+    background_tasks.append(asyncio.create_task(irrigation_schedule_refresher()))
+
+async def rule_task_dispatcher():
+    while True:
+        await asyncio.sleep(RULE_DISPATCH_INTERVAL_SECONDS)
+        if not queued_drone_tasks:
+            continue
+        keys = list(queued_drone_tasks)
+        try:
+            result = await assign_drone_tasks([queued_drone_tasks[key] for key in keys], min_payload=10.0)
+        except Exception:
+            logger.exception("Dispatch of %d rule-triggered drone tasks failed", len(keys))
+            continue
+        # Tasks still waiting for an eligible drone stay queued for the next round
+        waiting = {item["task"] for item in result["unassigned"] if item["reason"] == "no eligible drone"}
+        for position, key in enumerate(keys):
+            if position not in waiting:
+                queued_drone_tasks.pop(key, None)
+
+@app.on_event("startup")
+async def start_rule_task_dispatcher():
+    background_tasks.append(asyncio.create_task(rule_task_dispatcher()))
+
+async def track_flusher():
+    while True:
+        await asyncio.sleep(TRACK_FLUSH_SECONDS)
+        try:
+            await tracks.flush(db)
+        except Exception:
+            logger.exception("Drone track flush failed")
+
+@app.on_event("startup")
+async def start_track_flusher():
+    background_tasks.append(asyncio.create_task(track_flusher()))
+
+@app.on_event("startup")
+async def start_command_bus():
+    try:
+        await command_bus.start()
+    except Exception:
+        logger.exception("Could not start the device command bus")
+
+@app.on_event("startup")
+async def provision_indexes():
+    # Runs in the background so a large first-time build does not delay startup
+    background_tasks.append(asyncio.create_task(index_provisioner.ensure(db)))
+
+@app.on_event("startup")
+async def start_ingest_buffer():
+    global ingest_buffer
+    if SENSOR_WRITE_BEHIND:
+        ingest_buffer = IngestBuffer(
+            flush_sensor_buffer,
+            max_size=INGEST_BUFFER_MAX,
+            batch_size=INGEST_BATCH_SIZE,
+            flush_interval=INGEST_FLUSH_INTERVAL_MS / 1000,
+        )
+        ingest_buffer.start()
+        logger.info("Sensor write-behind buffer enabled (capacity %d)", INGEST_BUFFER_MAX)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # The final flush evaluates rules, which start irrigation and queue valve
+    # commands, so drain it while the scheduler and command bus still run
+    if ingest_buffer is not None:
+        await ingest_buffer.close()
+    event_hub.close()
+    await irrigation_scheduler.close()
+    await command_bus.close()
+    for task in background_tasks:
+        task.cancel()
+    try:
+        await fleet.persist(db, change_sequence)
+    except Exception:
+        logger.exception("Could not persist drone fleet state on shutdown")
+    try:
+        await tracks.flush(db, force=True)
+    except Exception:
+        logger.exception("Could not write buffered drone tracks on shutdown")
+    client.close()
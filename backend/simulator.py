@@ -0,0 +1,165 @@
+"""Moving drone fleet for load testing the map and telemetry paths
+
+All drone state lives in NumPy arrays and ``step`` advances the whole fleet
+at once. Each drone cycles through idle -> in_flight -> spraying ->
+returning -> charging -> idle, flying to a target in a farm zone and back
+to its home point. Flying and spraying drain the battery, spraying drains
+the payload, and a drone heads home early when its battery reaches the
+reserve.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from spatial import METERS_PER_DEGREE
+
+
+IDLE, IN_FLIGHT, SPRAYING, RETURNING, CHARGING = range(5)
+STATUS_NAMES = ("idle", "in_flight", "spraying", "returning", "charging")
+
+
+class FleetSimulation:
+    def __init__(self, drone_ids: Sequence[str], center: Tuple[float, float],
+                 targets: Sequence[Tuple[float, float, float]], spread_m: float = 1500.0,
+                 speed_mps: float = 8.0, battery_drain: float = 0.05, spray_rate: float = 0.5,
+                 charge_rate: float = 0.5, reserve_percent: float = 20.0, seed: Optional[int] = None):
+        """``targets`` are (lat, lng, radius_m) areas drones are sent to; rates are percent per second"""
+        self.ids = list(drone_ids)
+        self.rng = np.random.default_rng(seed)
+        self.speed_mps = speed_mps
+        self.battery_drain = battery_drain
+        self.spray_rate = spray_rate
+        self.charge_rate = charge_rate
+        self.reserve_percent = reserve_percent
+        self.targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+        if not len(self.targets):
+            self.targets = np.array([[center[0], center[1], spread_m]])
+
+        count = len(self.ids)
+        self.home_lat, self.home_lng = self._scatter(np.full(count, center[0]), np.full(count, center[1]), np.full(count, spread_m))
+        self.lat = self.home_lat.copy()
+        self.lng = self.home_lng.copy()
+        self.target_lat = self.home_lat.copy()
+        self.target_lng = self.home_lng.copy()
+        self.heading = np.zeros(count)
+        self.speed = np.zeros(count)
+        self.altitude = np.zeros(count)
+        self.battery = self.rng.uniform(60, 100, count)
+        self.payload = np.full(count, 100.0)
+        self.status = np.full(count, IDLE, dtype=np.int8)
+        self.ticks = 0
+        self.transitions = 0
+        self.last_tick_ms = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _scatter(self, lat: np.ndarray, lng: np.ndarray, radius_m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Uniform random points within ``radius_m`` of each (lat, lng)"""
+        distance = radius_m * np.sqrt(self.rng.random(len(lat)))
+        bearing = self.rng.uniform(0, 2 * math.pi, len(lat))
+        north = distance * np.cos(bearing) / METERS_PER_DEGREE
+        east = distance * np.sin(bearing) / (METERS_PER_DEGREE * np.cos(np.radians(lat)))
+        return lat + north, lng + east
+
+    def _move(self, moving: np.ndarray, dest_lat: np.ndarray, dest_lng: np.ndarray, dt: float) -> np.ndarray:
+        """Advance ``moving`` drones toward their destinations; returns which of them arrived"""
+        north = (dest_lat - self.lat) * METERS_PER_DEGREE
+        east = (dest_lng - self.lng) * METERS_PER_DEGREE * np.cos(np.radians(self.lat))
+        distance = np.hypot(north, east)
+        step = self.speed_mps * dt
+        arrived = moving & (distance <= step)
+        fraction = np.where(arrived, 1.0, step / np.maximum(distance, 1e-9))
+        fraction = np.where(moving, fraction, 0.0)
+        self.lat = self.lat + (dest_lat - self.lat) * fraction
+        self.lng = self.lng + (dest_lng - self.lng) * fraction
+        self.heading = np.where(moving, np.degrees(np.arctan2(east, north)) % 360, self.heading)
+        return arrived
+
+    def step(self, dt: float) -> np.ndarray:
+        """Advance the fleet by ``dt`` seconds; returns a mask of drones whose status changed"""
+        status = self.status
+        flying = status == IN_FLIGHT
+        returning = status == RETURNING
+        spraying = status == SPRAYING
+        charging = status == CHARGING
+        moving = flying | returning
+
+        dest_lat = np.where(returning, self.home_lat, self.target_lat)
+        dest_lng = np.where(returning, self.home_lng, self.target_lng)
+        arrived = self._move(moving, dest_lat, dest_lng, dt)
+
+        self.battery = np.where(moving | spraying, np.maximum(self.battery - self.battery_drain * dt, 0.0), self.battery)
+        self.battery = np.where(charging, np.minimum(self.battery + self.charge_rate * dt, 100.0), self.battery)
+        self.payload = np.where(spraying, np.maximum(self.payload - self.spray_rate * dt, 0.0), self.payload)
+        self.payload = np.where(charging, 100.0, self.payload)
+
+        new_status = status.copy()
+        new_status[flying & arrived] = SPRAYING
+        new_status[spraying & (self.payload <= 0)] = RETURNING
+        new_status[(flying | spraying) & (self.battery <= self.reserve_percent)] = RETURNING
+        new_status[returning & arrived] = CHARGING
+        new_status[charging & (self.battery >= 100.0)] = IDLE
+        # Idle drones take off for a new random spot in one of the target areas
+        idle = status == IDLE
+        if idle.any():
+            picks = self.targets[self.rng.integers(0, len(self.targets), int(idle.sum()))]
+            self.target_lat[idle], self.target_lng[idle] = self._scatter(picks[:, 0], picks[:, 1], picks[:, 2])
+            new_status[idle] = IN_FLIGHT
+        back_home = (new_status == RETURNING) & (status != RETURNING)
+        self.target_lat[back_home] = self.home_lat[back_home]
+        self.target_lng[back_home] = self.home_lng[back_home]
+
+        self.speed = np.where((new_status == IN_FLIGHT) | (new_status == RETURNING), self.speed_mps, 0.0)
+        self.altitude = np.where(new_status == SPRAYING, 3.0, np.where(self.speed > 0, 30.0, 0.0))
+        changed = new_status != status
+        self.status = new_status
+        self.ticks += 1
+        self.transitions += int(changed.sum())
+        return changed
+
+    def updates(self, changed: np.ndarray) -> Dict[str, dict]:
+        """DroneState attribute changes for every drone that is not sitting idle"""
+        active = np.flatnonzero((self.status != IDLE) | changed)
+        columns = zip(
+            active.tolist(), self.lat[active].tolist(), self.lng[active].tolist(), self.heading[active].tolist(),
+            self.speed[active].tolist(), self.altitude[active].tolist(), self.battery[active].tolist(),
+            self.payload[active].tolist(), self.status[active].tolist(),
+            self.target_lat[active].tolist(), self.target_lng[active].tolist(),
+        )
+        return {
+            self.ids[index]: {
+                "lat": lat, "lng": lng, "heading": round(heading, 1), "speed": speed, "altitude": altitude,
+                "battery": round(battery, 2), "payload": round(payload, 2), "status": STATUS_NAMES[status],
+                "target_lat": target_lat, "target_lng": target_lng,
+            }
+            for index, lat, lng, heading, speed, altitude, battery, payload, status, target_lat, target_lng in columns
+        }
+
+    def documents(self, name_prefix: str) -> List[dict]:
+        """Initial drones documents for the simulated fleet"""
+        return [
+            {
+                "id": drone_id,
+                "drone_name": f"{name_prefix}{index + 1:04d}",
+                "status": STATUS_NAMES[IDLE],
+                "battery_level": round(float(self.battery[index]), 2),
+                "current_lat": float(self.lat[index]),
+                "current_lng": float(self.lng[index]),
+                "target_lat": None,
+                "target_lng": None,
+                "payload_type": "air",
+                "payload_remaining": 100.0,
+            }
+            for index, drone_id in enumerate(self.ids)
+        ]
+
+    def stats(self) -> dict:
+        counts = np.bincount(self.status, minlength=len(STATUS_NAMES))
+        return {
+            "drones": len(self.ids),
+            "ticks": self.ticks,
+            "transitions": self.transitions,
+            "status": {name: int(count) for name, count in zip(STATUS_NAMES, counts)},
+        }
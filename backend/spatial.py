@@ -0,0 +1,217 @@
+"""Uniform lat/lng grid indexes for nearest-drone and point-in-zone queries
+
+Both indexes bucket objects into square cells of ``cell_degrees``. Nearest
+queries search rings of cells outward from the query point and stop once no
+unvisited cell can hold anything closer. If the rings cover more cells than
+there are points, the rest of the search is a plain scan, so sparse fleets
+spread over a large area stay cheap.
+"""
+import heapq
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def point_in_polygon(lat: float, lng: float, polygon: Sequence[Sequence[float]]) -> bool:
+    """Even-odd ray test against [[lat, lng], ...] vertices"""
+    inside = False
+    previous_lat, previous_lng = polygon[-1]
+    for vertex_lat, vertex_lng in polygon:
+        if (vertex_lat > lat) != (previous_lat > lat):
+            crossing = vertex_lng + (lat - vertex_lat) * (previous_lng - vertex_lng) / (previous_lat - vertex_lat)
+            if lng < crossing:
+                inside = not inside
+        previous_lat, previous_lng = vertex_lat, vertex_lng
+    return inside
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle (haversine) distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+Cell = Tuple[int, int]
+
+
+class PointGrid:
+    """Moving points (drones) by id"""
+
+    def __init__(self, cell_degrees: float = 0.01):
+        self.cell_degrees = cell_degrees
+        self.cells: Dict[Cell, Set[str]] = {}
+        self.points: Dict[str, Tuple[float, float, Cell]] = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell_of(self, lat: float, lng: float) -> Cell:
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def put(self, key: str, lat: float, lng: float):
+        cell = self.cell_of(lat, lng)
+        previous = self.points.get(key)
+        if previous is not None and previous[2] != cell:
+            self._discard(key, previous[2])
+        self.points[key] = (lat, lng, cell)
+        self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key: str):
+        previous = self.points.pop(key, None)
+        if previous is not None:
+            self._discard(key, previous[2])
+
+    def clear(self):
+        self.cells = {}
+        self.points = {}
+
+    def _discard(self, key: str, cell: Cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self.cells[cell]
+
+    def _ring(self, center: Cell, radius: int) -> Iterable[Cell]:
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for d in range(-radius, radius + 1):
+            yield row - radius, col + d
+            yield row + radius, col + d
+        for d in range(-radius + 1, radius):
+            yield row + d, col - radius
+            yield row + d, col + radius
+
+    def nearest(self, lat: float, lng: float, limit: int,
+                accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[float, str]]:
+        """Up to ``limit`` (distance_m, key) pairs closest to the point, nearest first"""
+        if limit <= 0 or not self.points:
+            return []
+        center = self.cell_of(lat, lng)
+        # Smallest ground distance covered by one cell, used to bound each ring
+        cell_m = self.cell_degrees * METERS_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + self.cell_degrees, 90))), 1e-6)
+        best: List[Tuple[float, str]] = []  # max-heap via negated distance
+        visited = 0
+        radius = 0
+        while True:
+            # Anything in ring `radius` or beyond is at least (radius - 1) cells away
+            if len(best) == limit and (radius - 1) * cell_m > -best[0][0]:
+                break
+            if visited > len(self.points):
+                return self._scan(lat, lng, limit, accept)
+            for cell in self._ring(center, radius):
+                visited += 1
+                for key in self.cells.get(cell, ()):
+                    self._consider(best, key, lat, lng, limit, accept)
+            radius += 1
+        return sorted((-negated, key) for negated, key in best)
+
+    def _consider(self, best, key, lat, lng, limit, accept):
+        if accept is not None and not accept(key):
+            return
+        point_lat, point_lng, _ = self.points[key]
+        distance = distance_m(lat, lng, point_lat, point_lng)
+        if len(best) < limit:
+            heapq.heappush(best, (-distance, key))
+        elif distance < -best[0][0]:
+            heapq.heapreplace(best, (-distance, key))
+
+    def _scan(self, lat, lng, limit, accept) -> List[Tuple[float, str]]:
+        best: List[Tuple[float, str]] = []
+        for key in self.points:
+            self._consider(best, key, lat, lng, limit, accept)
+        return sorted((-negated, key) for negated, key in best)
+
+
+class ZoneGrid:
+    """Zone shapes by id, for point-in-zone lookups
+
+    A zone with a ``boundary`` polygon is matched against it; otherwise the
+    zone is a circle of its area around its center point.
+    """
+
+    def __init__(self, cell_degrees: float = 0.01):
+        self.cell_degrees = cell_degrees
+        self.cells: Dict[Cell, Set[str]] = {}
+        self.zones: Dict[str, Tuple[float, float, float, List[Cell]]] = {}  # id -> (lat, lng, radius_m, cells)
+        self.boundaries: Dict[str, List[Tuple[float, float]]] = {}
+        self.documents: Dict[str, dict] = {}
+
+    def __len__(self):
+        return len(self.zones)
+
+    def put(self, zone: dict):
+        """Index a farm_zones document (id, latitude, longitude, area_size in hectares, optional boundary)"""
+        self.remove(zone["id"])
+        lat, lng = zone["latitude"], zone["longitude"]
+        radius = math.sqrt(max(zone.get("area_size") or 0.0, 0.0) * 10000 / math.pi)
+        boundary = zone.get("boundary")
+        if boundary:
+            self.boundaries[zone["id"]] = [tuple(vertex) for vertex in boundary]
+            cells = list(self._cells_covering(boundary))
+        else:
+            cells = list(self._cells_within(lat, lng, radius))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(zone["id"])
+        self.zones[zone["id"]] = (lat, lng, radius, cells)
+        self.documents[zone["id"]] = zone
+
+    def remove(self, zone_id: str):
+        previous = self.zones.pop(zone_id, None)
+        self.boundaries.pop(zone_id, None)
+        self.documents.pop(zone_id, None)
+        if previous is None:
+            return
+        for cell in previous[3]:
+            members = self.cells.get(cell)
+            if members is not None:
+                members.discard(zone_id)
+                if not members:
+                    del self.cells[cell]
+
+    def load(self, zones: Iterable[dict]):
+        self.clear()
+        for zone in zones:
+            self.put(zone)
+
+    def clear(self):
+        self.cells = {}
+        self.zones = {}
+        self.boundaries = {}
+        self.documents = {}
+
+    def _cells_within(self, lat: float, lng: float, radius_m: float) -> Iterable[Cell]:
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        size = self.cell_degrees
+        for row in range(int(math.floor((lat - dlat) / size)), int(math.floor((lat + dlat) / size)) + 1):
+            for col in range(int(math.floor((lng - dlng) / size)), int(math.floor((lng + dlng) / size)) + 1):
+                yield row, col
+
+    def _cells_covering(self, polygon: Sequence[Sequence[float]]) -> Iterable[Cell]:
+        size = self.cell_degrees
+        lats = [vertex[0] for vertex in polygon]
+        lngs = [vertex[1] for vertex in polygon]
+        for row in range(int(math.floor(min(lats) / size)), int(math.floor(max(lats) / size)) + 1):
+            for col in range(int(math.floor(min(lngs) / size)), int(math.floor(max(lngs) / size)) + 1):
+                yield row, col
+
+    def locate(self, lat: float, lng: float) -> List[Tuple[float, str]]:
+        """Zones containing the point as (distance to zone center in m, zone id), closest center first"""
+        cell = (int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees)))
+        matches = []
+        for zone_id in self.cells.get(cell, ()):
+            zone_lat, zone_lng, radius, _ = self.zones[zone_id]
+            distance = distance_m(lat, lng, zone_lat, zone_lng)
+            boundary = self.boundaries.get(zone_id)
+            if point_in_polygon(lat, lng, boundary) if boundary else distance <= radius:
+                matches.append((distance, zone_id))
+        return sorted(matches)
@@ -0,0 +1,110 @@
+"""Per-zone alert thresholds held in memory so readings classify in O(1)"""
+import logging
+import math
+from typing import Dict, Iterable, List, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# (warning below, critical below) for sensor types a zone does not configure
+DEFAULT_THRESHOLDS: Dict[str, Tuple[float, float]] = {
+    "soil_moisture": (30.0, 20.0),
+    "nutrient_n": (40.0, 25.0),
+    "nutrient_p": (40.0, 25.0),
+    "nutrient_k": (40.0, 25.0),
+}
+
+# A zone threshold like {"soil_moisture": 35} warns below 35 and is critical
+# below 35 * CRITICAL_RATIO, matching the 30/20 split of the defaults
+CRITICAL_RATIO = 2 / 3
+
+
+def threshold_level(sensor_type: str, value) -> float:
+    """A configured level as a finite float; raises ValueError for anything else"""
+    if isinstance(value, bool):
+        raise ValueError(f"{sensor_type}: {value!r} is not a number")
+    try:
+        level = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{sensor_type}: {value!r} is not a number") from None
+    if not math.isfinite(level):
+        raise ValueError(f"{sensor_type}: {value!r} is not a finite number")
+    return level
+
+
+def compile_thresholds(irrigation_threshold: dict) -> Dict[str, Tuple[float, float]]:
+    """Turn a FarmZone.irrigation_threshold into {sensor_type: (warning, critical)}
+
+    Values may be a number (the warning level) or a dict with explicit
+    ``warning`` and ``critical`` levels. Raises ValueError for a level that
+    is not a finite number.
+    """
+    table = dict(DEFAULT_THRESHOLDS)
+    for sensor_type, limit in (irrigation_threshold or {}).items():
+        if isinstance(limit, dict):
+            if "warning" not in limit:
+                continue
+            warning = threshold_level(sensor_type, limit["warning"])
+            critical = threshold_level(sensor_type, limit.get("critical", warning * CRITICAL_RATIO))
+        else:
+            warning = threshold_level(sensor_type, limit)
+            critical = warning * CRITICAL_RATIO
+        table[sensor_type] = (warning, critical)
+    return table
+
+
+class ZoneThresholdTable:
+    """Compiled thresholds per zone, refreshed whenever zones change"""
+
+    def __init__(self):
+        self._zones: Dict[str, Dict[str, Tuple[float, float]]] = {}
+
+    def __len__(self):
+        return len(self._zones)
+
+    def load(self, zones: Iterable[dict]):
+        """Replace the whole table from farm_zones documents; a zone with invalid thresholds uses the defaults"""
+        table = {}
+        for zone in zones:
+            try:
+                table[zone["id"]] = compile_thresholds(zone.get("irrigation_threshold"))
+            except ValueError as e:
+                logger.warning("Zone %s has an invalid irrigation_threshold (%s), using default thresholds", zone["id"], e)
+        self._zones = table
+
+    def set_zone(self, zone_id: str, irrigation_threshold: dict):
+        self._zones[zone_id] = compile_thresholds(irrigation_threshold)
+
+    def clear(self):
+        self._zones = {}
+
+    def limits(self, zone_id: str) -> Dict[str, Tuple[float, float]]:
+        return self._zones.get(zone_id, DEFAULT_THRESHOLDS)
+
+    def classify(self, zone_id: str, sensor_type: str, value: float) -> str:
+        limits = self.limits(zone_id).get(sensor_type)
+        if limits is None:
+            return "normal"
+        warning, critical = limits
+        if value < critical:
+            return "critical"
+        if value < warning:
+            return "warning"
+        return "normal"
+
+    def classify_many(self, readings: Iterable[Tuple[str, str, float]]) -> List[str]:
+        """Classify (zone_id, sensor_type, value) tuples"""
+        zones = self._zones
+        levels = []
+        for zone_id, sensor_type, value in readings:
+            limits = zones.get(zone_id, DEFAULT_THRESHOLDS).get(sensor_type)
+            if limits is None:
+                levels.append("normal")
+            elif value < limits[1]:
+                levels.append("critical")
+            elif value < limits[0]:
+                levels.append("warning")
+            else:
+                levels.append("normal")
+        return levels
@@ -0,0 +1,201 @@
+"""Drone track history in compressed columnar chunks
+
+Samples (time, lat, lng, altitude, battery) are buffered per drone and
+written as one ``drone_tracks`` document per chunk. A chunk holds up to
+``chunk_samples`` samples of a single flight. Each column is scaled to
+integers (ms, 1e-7 degrees, decimeters, 0.01 %) and delta-encoded. The int32
+deltas are byte-shuffled so zlib sees runs of similar bytes, then stored as
+one binary blob. Decoding a chunk is a decompress, a reshape and a cumsum.
+
+A flight is a contiguous airborne period (in_flight, spraying,
+returning) and is identified by the time of its first sample in ms. Ground
+samples are kept only when the drone moved, and have no flight.
+"""
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import Binary
+
+
+TRACK_COLLECTION = "drone_tracks"
+AIRBORNE_STATUSES = {"in_flight", "spraying", "returning"}
+COLUMNS = ("t", "lat", "lng", "altitude", "battery")
+# Integer units per column: ms, 1e-7 degrees, decimeters, 0.01 percent
+SCALES = np.array([1e3, 1e7, 1e7, 10.0, 100.0])
+
+
+def encode_chunk(samples: np.ndarray) -> bytes:
+    """(n, 5) float array of (epoch seconds, lat, lng, altitude, battery) -> compressed blob"""
+    scaled = np.round(samples * SCALES).astype(np.int64).T
+    deltas = np.diff(scaled, axis=1, prepend=0)
+    # First t delta is the absolute ms timestamp, which needs 64 bits; keep it in the header
+    start = int(scaled[0, 0])
+    deltas[0, 0] = 0
+    packed = np.ascontiguousarray(deltas, dtype=np.int32).view(np.uint8).reshape(-1, 4).T
+    return start.to_bytes(8, "little", signed=True) + zlib.compress(packed.tobytes(), 6)
+
+
+def decode_chunk(blob: bytes, count: int) -> np.ndarray:
+    """Inverse of encode_chunk: (count, 5) float array"""
+    start = int.from_bytes(blob[:8], "little", signed=True)
+    shuffled = np.frombuffer(zlib.decompress(blob[8:]), dtype=np.uint8).reshape(4, -1)
+    deltas = np.ascontiguousarray(shuffled.T).view(np.int32).reshape(len(COLUMNS), count)
+    scaled = np.cumsum(deltas, axis=1, dtype=np.int64)
+    scaled[0] += start
+    return scaled.T / SCALES
+
+
+class TrackBuffer:
+    __slots__ = ("flight", "samples", "opened")
+
+    def __init__(self, flight: Optional[int]):
+        self.flight = flight
+        self.samples: List[Tuple[float, float, float, float, float]] = []
+        self.opened = time.monotonic()
+
+
+class TrackRecorder:
+    def __init__(self, chunk_samples: int = 3000, flush_seconds: float = 30.0):
+        self.chunk_samples = chunk_samples
+        self.flush_seconds = flush_seconds
+        self.buffers: Dict[str, TrackBuffer] = {}
+        self.flights: Dict[str, Optional[int]] = {}
+        self.last_position: Dict[str, Tuple[float, float]] = {}
+        self.ready: List[dict] = []
+        self.samples_recorded = 0
+        self.chunks_written = 0
+        self.bytes_written = 0
+
+    def record(self, drone_id: str, at: float, lat: float, lng: float, altitude: Optional[float],
+               battery: Optional[float], status: Optional[str]):
+        """Add one sample; closes the open chunk when the drone takes off or lands"""
+        airborne = status in AIRBORNE_STATUSES
+        flight = self.flights.get(drone_id)
+        if airborne and flight is None:
+            flight = int(round(at * 1000))
+        elif not airborne:
+            flight = None
+            if self.last_position.get(drone_id) == (lat, lng):
+                self.flights[drone_id] = None
+                self._close(drone_id)
+                return
+        self.flights[drone_id] = flight
+        self.last_position[drone_id] = (lat, lng)
+
+        buffer = self.buffers.get(drone_id)
+        if buffer is not None and buffer.flight != flight:
+            self._close(drone_id)
+            buffer = None
+        if buffer is None:
+            buffer = self.buffers[drone_id] = TrackBuffer(flight)
+        buffer.samples.append((at, lat, lng, altitude or 0.0, battery or 0.0))
+        self.samples_recorded += 1
+        if len(buffer.samples) >= self.chunk_samples:
+            self._close(drone_id)
+
+    def _close(self, drone_id: str):
+        buffer = self.buffers.pop(drone_id, None)
+        if buffer is None or not buffer.samples:
+            return
+        samples = np.array(buffer.samples)
+        self.ready.append({
+            "drone_id": drone_id,
+            "flight": buffer.flight,
+            "start": datetime.fromtimestamp(samples[0, 0], tz=timezone.utc),
+            "end": datetime.fromtimestamp(samples[-1, 0], tz=timezone.utc),
+            "count": len(samples),
+            "data": Binary(encode_chunk(samples)),
+        })
+
+    async def flush(self, db, force: bool = False) -> int:
+        """Write full chunks, plus buffers open longer than flush_seconds (or all, with force)"""
+        now = time.monotonic()
+        for drone_id in [drone_id for drone_id, buffer in self.buffers.items()
+                         if force or now - buffer.opened >= self.flush_seconds]:
+            self._close(drone_id)
+        chunks, self.ready = self.ready, []
+        if not chunks:
+            return 0
+        try:
+            await db[TRACK_COLLECTION].insert_many(chunks, ordered=False)
+        except Exception:
+            self.ready = chunks + self.ready
+            raise
+        self.chunks_written += len(chunks)
+        self.bytes_written += sum(len(chunk["data"]) for chunk in chunks)
+        return len(chunks)
+
+    def pending(self, drone_id: str) -> List[Tuple[Optional[int], np.ndarray]]:
+        """Samples not yet written, as (flight, samples) pairs"""
+        pending = [(chunk["flight"], decode_chunk(chunk["data"], chunk["count"])) for chunk in self.ready if chunk["drone_id"] == drone_id]
+        buffer = self.buffers.get(drone_id)
+        if buffer is not None and buffer.samples:
+            pending.append((buffer.flight, np.array(buffer.samples)))
+        return pending
+
+    def discard(self, drone_ids: List[str]):
+        """Drop buffered samples of deleted drones"""
+        drone_ids = set(drone_ids)
+        for drone_id in drone_ids:
+            self.buffers.pop(drone_id, None)
+            self.flights.pop(drone_id, None)
+            self.last_position.pop(drone_id, None)
+        self.ready = [chunk for chunk in self.ready if chunk["drone_id"] not in drone_ids]
+
+    def clear(self):
+        self.buffers = {}
+        self.flights = {}
+        self.last_position = {}
+        self.ready = []
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples_recorded,
+            "buffered": sum(len(buffer.samples) for buffer in self.buffers.values()),
+            "chunks": self.chunks_written,
+            "bytes": self.bytes_written,
+        }
+
+
+async def load_track(db, recorder: TrackRecorder, drone_id: str, start: datetime, end: datetime,
+                     flight: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Samples of one drone between start and end as ((n, 5) float array, flight per sample)"""
+    query = {"drone_id": drone_id, "start": {"$lte": end}, "end": {"$gte": start}}
+    if flight is not None:
+        query["flight"] = flight
+    parts = []
+    async for chunk in db[TRACK_COLLECTION].find(query, {"_id": 0}).sort("start", 1):
+        parts.append((chunk["flight"], decode_chunk(chunk["data"], chunk["count"])))
+    parts += [part for part in recorder.pending(drone_id) if flight is None or part[0] == flight]
+    if not parts:
+        return np.empty((0, len(COLUMNS))), np.empty(0)
+
+    samples = np.concatenate([part for _, part in parts])
+    flights = np.concatenate([np.full(len(part), -1 if number is None else number, dtype=np.int64) for number, part in parts])
+    order = np.argsort(samples[:, 0], kind="stable")
+    samples, flights = samples[order], flights[order]
+    keep = (samples[:, 0] >= start.timestamp()) & (samples[:, 0] <= end.timestamp())
+    return samples[keep], flights[keep]
+
+
+def track_columns(samples: np.ndarray, flights: np.ndarray, max_points: Optional[int] = None) -> dict:
+    """Columnar response body: t in epoch ms, one list per column, and the runs of each flight"""
+    total = len(samples)
+    if max_points is not None and total > max_points:
+        keep = np.unique(np.linspace(0, total - 1, max_points).round().astype(int))
+        samples, flights = samples[keep], flights[keep]
+    starts = np.flatnonzero(np.diff(flights, prepend=np.nan)) if len(flights) else np.empty(0, dtype=int)
+    counts = np.diff(np.append(starts, len(flights)))
+    return {
+        "count": len(samples),
+        "total": total,
+        "flights": [
+            {"flight": None if flights[start] < 0 else int(flights[start]), "start_index": int(start), "count": int(count)}
+            for start, count in zip(starts, counts)
+        ],
+        "t": np.round(samples[:, 0] * 1000).astype(np.int64).tolist(),
+        **{column: samples[:, position].tolist() for position, column in enumerate(COLUMNS) if column != "t"},
+    }
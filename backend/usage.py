@@ -0,0 +1,219 @@
+"""Water and fertilizer usage per completed irrigation run and drone spray
+
+Every finished run becomes one ``usage_events`` document. Its ``_id`` is
+derived from the run (system or drone id plus start time), so a run seen by
+two workers is counted once. Newly inserted events are folded into
+``usage_daily`` with $inc upserts, one document per (zone, day, source,
+type). Reports group those daily documents, so a month across all zones
+reads zones x days x types small documents instead of the raw events.
+
+An irrigation run uses ``flow_rate`` x minutes the valve was open, capped at
+the run's duration; its type is the system's ``fertilizer_type``, or
+``water``. A drone spray uses the payload percent it dropped times the tank
+size; its type is the payload type, and its zone is the one the drone was in
+when it started spraying.
+
+Rebuild the daily totals from the events with:
+
+    python usage.py rebuild
+"""
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from common import DUPLICATE_KEY_ERROR, as_datetime, bulk_write_upserts, maintenance_cli, run_with_db
+
+
+logger = logging.getLogger(__name__)
+
+USAGE_EVENTS = "usage_events"
+USAGE_DAILY = "usage_daily"
+
+IRRIGATION = "irrigation"
+DRONE = "drone"
+WATER = "water"
+# Drone payload names are Indonesian; "air" is water
+PAYLOAD_TYPES = {"air": WATER}
+REPORT_GROUPS = ("zone", "day", "month", "source", "type")
+GROUP_FIELDS = {"zone": "zone_id", "day": "day", "month": "month", "source": "source", "type": "type"}
+
+
+def day_bucket(timestamp: datetime) -> datetime:
+    return timestamp.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def usage_event(source: str, source_id: str, zone_id: Optional[str], usage_type: str, started: datetime,
+                ended: datetime, minutes: float, liters: float) -> dict:
+    day = day_bucket(ended)
+    return {
+        "_id": f"{source}:{source_id}:{started.isoformat()}",
+        "source": source,
+        "source_id": source_id,
+        "zone_id": zone_id,
+        "type": usage_type,
+        "started": started,
+        "ended": ended,
+        "minutes": round(minutes, 3),
+        "liters": round(liters, 3),
+        "day": day,
+        "month": day.strftime("%Y-%m"),
+    }
+
+
+def irrigation_usage(system: dict, ended: datetime, default_duration_minutes: int) -> Optional[dict]:
+    """Usage of the run that started at the system's last_activated and ended at ``ended``"""
+    if system.get("last_activated") is None or not system.get("flow_rate"):
+        return None
+    started = as_datetime(system["last_activated"])
+    duration = system.get("duration") or default_duration_minutes
+    minutes = min(max((ended - started).total_seconds() / 60, 0.0), duration)
+    return usage_event(IRRIGATION, system["id"], system.get("zone_id"), system.get("fertilizer_type") or WATER,
+                       started, ended, minutes, system["flow_rate"] * minutes)
+
+
+class SprayMeter:
+    """Payload level of each spraying drone when its spray started"""
+
+    def __init__(self, tank_liters: float = 10.0):
+        self.tank_liters = tank_liters
+        self.open: Dict[str, Tuple[float, float, Optional[str], Optional[str]]] = {}
+
+    def start(self, drone_id: str, at: float, payload: Optional[float], zone_id: Optional[str], payload_type: Optional[str]):
+        self.open[drone_id] = (at, payload if payload is not None else 100.0, zone_id, payload_type)
+
+    def finish(self, drone_id: str, at: float, payload: Optional[float]) -> Optional[dict]:
+        """Usage event for the drone's spray, or None if it was not spraying or used nothing"""
+        spray = self.open.pop(drone_id, None)
+        if spray is None or payload is None:
+            return None
+        started, start_payload, zone_id, payload_type = spray
+        liters = (start_payload - payload) / 100 * self.tank_liters
+        if liters <= 0:
+            return None
+        usage_type = PAYLOAD_TYPES.get(payload_type or "air", payload_type)
+        return usage_event(DRONE, drone_id, zone_id, usage_type, datetime.fromtimestamp(started, tz=timezone.utc),
+                           datetime.fromtimestamp(at, tz=timezone.utc), (at - started) / 60, liters)
+
+    def discard(self, drone_ids: Iterable[str]):
+        for drone_id in drone_ids:
+            self.open.pop(drone_id, None)
+
+    def clear(self):
+        self.open = {}
+
+
+def daily_operations(events: Iterable[dict]) -> List[UpdateOne]:
+    totals: Dict[tuple, dict] = {}
+    for event in events:
+        key = (event["zone_id"], event["day"], event["source"], event["type"])
+        total = totals.setdefault(key, {"liters": 0.0, "minutes": 0.0, "events": 0, "month": event["month"]})
+        total["liters"] += event["liters"]
+        total["minutes"] += event["minutes"]
+        total["events"] += 1
+    return [
+        UpdateOne(
+            {"zone_id": zone_id, "day": day, "source": source, "type": usage_type},
+            {
+                "$inc": {"liters": total["liters"], "minutes": total["minutes"], "events": total["events"]},
+                "$set": {"month": total["month"]},
+            },
+            upsert=True,
+        )
+        for (zone_id, day, source, usage_type), total in totals.items()
+    ]
+
+
+async def record(db, events: List[dict]) -> int:
+    """Store usage events and add the ones not recorded before to the daily totals"""
+    if not events:
+        return 0
+    try:
+        await db[USAGE_EVENTS].insert_many(events, ordered=False)
+        new_events = events
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        # Already recorded, e.g. by another worker's scheduler
+        duplicates = {error["index"] for error in errors}
+        new_events = [event for index, event in enumerate(events) if index not in duplicates]
+    ops = daily_operations(new_events)
+    if not ops:
+        return 0
+    await bulk_write_upserts(db[USAGE_DAILY], ops)
+    return len(new_events)
+
+
+async def report(db, start: date, end: date, group_by: List[str], zone_id: Optional[str] = None) -> List[dict]:
+    """Usage totals between start and end (exclusive) from the daily documents, one row per group"""
+    match = {
+        "day": {
+            "$gte": datetime(start.year, start.month, start.day, tzinfo=timezone.utc),
+            "$lt": datetime(end.year, end.month, end.day, tzinfo=timezone.utc),
+        }
+    }
+    if zone_id:
+        match["zone_id"] = zone_id
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {name: f"${GROUP_FIELDS[name]}" for name in group_by},
+            "liters": {"$sum": "$liters"},
+            "minutes": {"$sum": "$minutes"},
+            "events": {"$sum": "$events"},
+        }},
+    ]
+    rows = []
+    async for group in db[USAGE_DAILY].aggregate(pipeline):
+        keys = group["_id"] or {}
+        row = {GROUP_FIELDS[name]: keys.get(name) for name in group_by}
+        if isinstance(row.get("day"), datetime):
+            row["day"] = row["day"].date().isoformat()
+        row.update(liters=round(group["liters"], 3), minutes=round(group["minutes"], 3), events=group["events"])
+        rows.append(row)
+    rows.sort(key=lambda row: tuple(str(row[GROUP_FIELDS[name]]) for name in group_by))
+    return rows
+
+
+async def rebuild(db) -> int:
+    """Replace the daily totals with totals recomputed from usage_events
+
+    Runs recorded while it is running can be missed, so stop the backend first.
+    """
+    await db[USAGE_DAILY].delete_many({})
+    await db[USAGE_EVENTS].aggregate([
+        {"$group": {
+            "_id": {"zone_id": "$zone_id", "day": "$day", "source": "$source", "type": "$type"},
+            "month": {"$first": "$month"},
+            "liters": {"$sum": "$liters"},
+            "minutes": {"$sum": "$minutes"},
+            "events": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "zone_id": "$_id.zone_id",
+            "day": "$_id.day",
+            "source": "$_id.source",
+            "type": "$_id.type",
+            "month": 1, "liters": 1, "minutes": 1, "events": 1,
+        }},
+        {"$merge": {"into": USAGE_DAILY, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ], allowDiskUse=True).to_list(length=None)
+    return await db[USAGE_DAILY].count_documents({})
+
+
+if __name__ == "__main__":
+    import typer
+
+    cli = maintenance_cli("Maintain the daily usage totals")
+
+    @cli.command("rebuild")
+    def rebuild_command():
+        """Recompute usage_daily from usage_events"""
+        count = run_with_db(rebuild)
+        typer.echo(f"{count} daily usage totals rebuilt")
+
+    cli()
@@ -6,9 +6,19 @@ Tests comprehensive backend functionality including API endpoints, data flow, an
 
 import requests
 import json
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import time
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from typing import Dict, List, Any
+from urllib.parse import urlparse
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+from ingest_codec import FRAME_CONTENT_TYPE, encode_frame
 
 # Configuration
 BASE_URL = "https://farm-sense-control.preview.emergentagent.com/api"
@@ -143,6 +153,355 @@ class SmartFarmTester:
             self.log_test("Get Sensors", False, f"Get sensors request failed: {str(e)}")
         return False
     
+    def test_drone_telemetry(self):
+        """Test POST /api/drones/{id}/telemetry updates the map positions immediately"""
+        try:
+            drones = requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()
+            if not drones:
+                self.log_test("Drone Telemetry", False, "No drones available for test")
+                return False
+            drone_id = drones[0]["id"]
+
+            telemetry = {"lat": -7.392301, "lng": 109.677612, "heading": 135.0, "speed": 4.5}
+            response = requests.post(f"{self.base_url}/drones/{drone_id}/telemetry", json=telemetry, headers=self.headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Drone Telemetry", False, f"Telemetry returned status {response.status_code}", response.text)
+                return False
+
+            positions = requests.get(f"{self.base_url}/drones/positions", headers=self.headers, timeout=10).json()["drones"]
+            drone = next((d for d in positions if d["id"] == drone_id), None)
+            missing = requests.post(f"{self.base_url}/drones/invalid-drone-id/telemetry", json=telemetry, headers=self.headers, timeout=10)
+            if drone and drone["position"] == [telemetry["lat"], telemetry["lng"]] and drone["heading"] == 135.0 and missing.status_code == 404:
+                self.log_test("Drone Telemetry", True, "Telemetry reflected in drone positions")
+                return True
+            self.log_test("Drone Telemetry", False, "Drone position not updated or unknown drone accepted", drone)
+        except Exception as e:
+            self.log_test("Drone Telemetry", False, f"Drone telemetry request failed: {str(e)}")
+        return False
+    
+    def test_drone_track(self):
+        """Test GET /api/drones/{id}/track returns recorded telemetry as columns"""
+        try:
+            drones = requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()
+            if not drones:
+                self.log_test("Drone Track", False, "No drones available for test")
+                return False
+            drone_id = drones[0]["id"]
+            path = [(-7.3920 + step * 0.0001, 109.6770) for step in range(5)]
+            for lat, lng in path:
+                requests.post(f"{self.base_url}/drones/{drone_id}/telemetry",
+                              json={"lat": lat, "lng": lng, "status": "in_flight", "battery_level": 80.0},
+                              headers=self.headers, timeout=10)
+
+            response = requests.get(f"{self.base_url}/drones/{drone_id}/track", headers=self.headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Drone Track", False, f"Track returned status {response.status_code}", response.text)
+                return False
+            track = response.json()
+            recorded = list(zip(track["lat"], track["lng"]))[-len(path):]
+            close = all(abs(a - b) < 1e-6 and abs(c - d) < 1e-6 for (a, c), (b, d) in zip(recorded, path))
+            if close and track["t"] == sorted(track["t"]) and track["flights"]:
+                self.log_test("Drone Track", True, f"{track['count']} samples in {len(track['flights'])} flight segments")
+                return True
+            self.log_test("Drone Track", False, "Recorded track does not match telemetry", track)
+        except Exception as e:
+            self.log_test("Drone Track", False, f"Drone track request failed: {str(e)}")
+        return False
+    
+    def test_spatial_queries(self):
+        """Test GET /api/drones/nearest and GET /api/zones/locate"""
+        try:
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if not zones:
+                self.log_test("Spatial Queries", False, "No zones available for test")
+                return False
+            zone = zones[0]
+            point = {"lat": zone["latitude"], "lng": zone["longitude"]}
+
+            located = requests.get(f"{self.base_url}/zones/locate", params=point, headers=self.headers, timeout=10)
+            outside = requests.get(f"{self.base_url}/zones/locate", params={"lat": 0.0, "lng": 0.0}, headers=self.headers, timeout=10)
+            nearest = requests.get(f"{self.base_url}/drones/nearest", params={**point, "limit": 3, "status": ""}, headers=self.headers, timeout=10)
+            if located.status_code != 200 or outside.status_code != 404 or nearest.status_code != 200:
+                self.log_test("Spatial Queries", False, f"Unexpected status codes {located.status_code}/{outside.status_code}/{nearest.status_code}")
+                return False
+
+            distances = [drone["distance_m"] for drone in nearest.json()["drones"]]
+            if located.json()["zone"]["id"] == zone["id"] and distances == sorted(distances):
+                self.log_test("Spatial Queries", True, f"Zone located, {len(distances)} drones ordered by distance")
+                return True
+            self.log_test("Spatial Queries", False, "Wrong zone or unordered drones", {"zone": located.json(), "distances": distances})
+        except Exception as e:
+            self.log_test("Spatial Queries", False, f"Spatial query request failed: {str(e)}")
+        return False
+    
+    def test_mission_plan(self):
+        """Test POST /api/drones/{id}/mission/plan coverage planning"""
+        try:
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            drones = requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()
+            if not zones or not drones:
+                self.log_test("Mission Plan", False, "No zones or drones available for test")
+                return False
+            payload = {"zone_id": zones[0]["id"], "swath_width_m": 5.0, "tank_coverage_ha": 0.5}
+            response = requests.post(f"{self.base_url}/drones/{drones[0]['id']}/mission/plan", json=payload, headers=self.headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Mission Plan", False, f"Mission plan returned status {response.status_code}", response.text)
+                return False
+
+            plan = response.json()
+            sorties = plan["sorties"]
+            sprayed = sum(sortie["spray_area_ha"] for sortie in sorties)
+            if sorties and all(sortie["spray_area_ha"] <= 0.5 + 1e-6 for sortie in sorties) and sprayed >= plan["area_ha"] * 0.95:
+                self.log_test("Mission Plan", True, f"{len(sorties)} sorties covering {sprayed:.2f} ha in {plan['compute_ms']} ms")
+                return True
+            self.log_test("Mission Plan", False, "Sorties exceed tank or miss coverage", plan)
+        except Exception as e:
+            self.log_test("Mission Plan", False, f"Mission plan request failed: {str(e)}")
+        return False
+    
+    def test_drone_dispatch(self):
+        """Test POST /api/drones/dispatch batch assignment (dry run)"""
+        try:
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if not zones:
+                self.log_test("Drone Dispatch", False, "No zones available for test")
+                return False
+            payload = {
+                "tasks": [{"zone_id": zone["id"]} for zone in zones] + [{"zone_id": "missing-zone"}],
+                "dry_run": True,
+            }
+            response = requests.post(f"{self.base_url}/drones/dispatch", json=payload, headers=self.headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Drone Dispatch", False, f"Dispatch returned status {response.status_code}", response.text)
+                return False
+
+            result = response.json()
+            drone_ids = [assignment["drone_id"] for assignment in result["assignments"]]
+            covered = len(result["assignments"]) + len(result["unassigned"]) == len(payload["tasks"])
+            missing = any(item["reason"] == "zone not found" for item in result["unassigned"])
+            if covered and missing and len(drone_ids) == len(set(drone_ids)):
+                self.log_test("Drone Dispatch", True, f"{len(drone_ids)} tasks assigned to distinct drones in {result['compute_ms']} ms")
+                return True
+            self.log_test("Drone Dispatch", False, "Tasks missing from result or drone assigned twice", result)
+        except Exception as e:
+            self.log_test("Drone Dispatch", False, f"Dispatch request failed: {str(e)}")
+        return False
+    
+    def test_fleet_simulation(self):
+        """Test /api/simulate-fleet start, status and stop"""
+        try:
+            start = requests.post(f"{self.base_url}/simulate-fleet/start", json={"drones": 20, "tick_ms": 100, "seed": 7}, headers=self.headers, timeout=30)
+            if start.status_code != 200:
+                self.log_test("Fleet Simulation", False, f"Start returned status {start.status_code}", start.text)
+                return False
+            # Dispatch straight away, while most simulated drones are still idle
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            dispatch = requests.post(f"{self.base_url}/drones/dispatch", json={
+                "tasks": [{"zone_id": zone["id"]} for zone in zones], "dry_run": True,
+            }, headers=self.headers, timeout=10).json()
+            simulated = {drone["id"] for drone in requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()
+                         if drone["drone_name"].startswith("SIM-")}
+            dispatched = [assignment["drone_id"] for assignment in dispatch["assignments"] if assignment["drone_id"] in simulated]
+            time.sleep(1)
+            status = requests.get(f"{self.base_url}/simulate-fleet", headers=self.headers, timeout=10).json()
+            moving = sum(1 for drone in requests.get(f"{self.base_url}/drones/positions", headers=self.headers, timeout=10).json()["drones"]
+                         if drone["name"].startswith("SIM-") and drone["status"] != "idle")
+            stop = requests.post(f"{self.base_url}/simulate-fleet/stop", headers=self.headers, timeout=30)
+            remaining = [drone for drone in requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()
+                         if drone["drone_name"].startswith("SIM-")]
+
+            if status.get("running") and status["ticks"] > 0 and moving > 0 and not dispatched and stop.status_code == 200 and not remaining:
+                self.log_test("Fleet Simulation", True, f"{moving} simulated drones moving after {status['ticks']} ticks, not dispatched, removed on stop")
+                return True
+            self.log_test("Fleet Simulation", False, "Simulation did not move or clean up drones, or a simulated drone was dispatched",
+                          {"status": status, "moving": moving, "dispatched": dispatched, "remaining": len(remaining)})
+        except Exception as e:
+            self.log_test("Fleet Simulation", False, f"Fleet simulation request failed: {str(e)}")
+        return False
+    
+    def test_irrigation_schedule(self):
+        """Test PUT /api/irrigation/{id}/schedule starts the run at its start time"""
+        try:
+            systems = requests.get(f"{self.base_url}/irrigation", headers=self.headers, timeout=10).json()
+            if not systems:
+                self.log_test("Irrigation Schedule", False, "No irrigation systems available for test")
+                return False
+            system_id = systems[0]["id"]
+            start_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 1))
+            response = requests.put(f"{self.base_url}/irrigation/{system_id}/schedule",
+                                    params={"start_time": start_time, "duration": 5}, headers=self.headers, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Irrigation Schedule", False, f"Schedule returned status {response.status_code}", response.text)
+                return False
+
+            time.sleep(3)
+            system = next(s for s in requests.get(f"{self.base_url}/irrigation", headers=self.headers, timeout=10).json() if s["id"] == system_id)
+            scheduler = requests.get(f"{self.base_url}/irrigation/scheduler", headers=self.headers, timeout=10).json()
+            if system["status"] == "active" and scheduler["pending_stops"] >= 1:
+                self.log_test("Irrigation Schedule", True, f"Run started on schedule, stop due at {scheduler['next_deadline']}")
+                return True
+            self.log_test("Irrigation Schedule", False, "Scheduled run did not start", {"system": system, "scheduler": scheduler})
+        except Exception as e:
+            self.log_test("Irrigation Schedule", False, f"Irrigation schedule request failed: {str(e)}")
+        return False
+    
+    def test_threshold_rules(self):
+        """Test a reading below a zone threshold starts the zone's irrigation"""
+        try:
+            zone = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Rule Test Zone", "area_size": 0.5, "crop_type": "Padi",
+                "latitude": -7.3940, "longitude": 109.6790,
+                "irrigation_threshold": {"soil_moisture": {"warning": 35, "cooldown_minutes": 60}},
+            }, headers=self.headers, timeout=10).json()
+            system = requests.post(f"{self.base_url}/irrigation", json={"zone_id": zone["id"], "status": "idle", "flow_rate": 8.0},
+                                   headers=self.headers, timeout=10).json()
+            reading = {"zone_id": zone["id"], "sensor_type": "soil_moisture", "value": 22.0, "unit": "%"}
+            requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+            before = requests.get(f"{self.base_url}/rules", headers=self.headers, timeout=10).json()["fired"]
+            requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+            rules = requests.get(f"{self.base_url}/rules", headers=self.headers, timeout=10).json()
+
+            systems = requests.get(f"{self.base_url}/irrigation", params={"zone_id": zone["id"]}, headers=self.headers, timeout=10).json()
+            started = next((s for s in systems if s["id"] == system["id"]), {}).get("status") == "active"
+            fired_once = any(firing["zone_id"] == zone["id"] for firing in rules["recent"]) and rules["fired"] == before
+            invalid = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Invalid Threshold Zone", "area_size": 0.5, "crop_type": "Padi",
+                "latitude": -7.3940, "longitude": 109.6790, "irrigation_threshold": {"soil_moisture": "abc"},
+            }, headers=self.headers, timeout=10)
+            bad_action = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Invalid Action Zone", "area_size": 0.5, "crop_type": "Padi",
+                "latitude": -7.3940, "longitude": 109.6790,
+                "irrigation_threshold": {"soil_moisture": {"warning": 35, "action": "irigate"}},
+            }, headers=self.headers, timeout=10)
+            if started and fired_once and invalid.status_code == 400 and bad_action.status_code == 400:
+                self.log_test("Threshold Rules", True, "Low soil moisture started irrigation; repeat reading did not fire again; bad threshold and action rejected")
+                return True
+            self.log_test("Threshold Rules", False, "Rule did not fire exactly once or bad threshold accepted",
+                          {"systems": systems, "rules": rules, "invalid_status": invalid.status_code,
+                           "bad_action_status": bad_action.status_code})
+        except Exception as e:
+            self.log_test("Threshold Rules", False, f"Threshold rule test failed: {str(e)}")
+        return False
+    
+    def test_device_commands(self):
+        """Test activating a valve queues a command for its gateway that can be acked"""
+        try:
+            zone = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Command Test Zone", "area_size": 0.5, "crop_type": "Padi",
+                "latitude": -7.3945, "longitude": 109.6795, "irrigation_threshold": {},
+            }, headers=self.headers, timeout=10).json()
+            gateway_id = f"gw-{uuid.uuid4().hex[:8]}"
+            system = requests.post(f"{self.base_url}/irrigation", json={
+                "zone_id": zone["id"], "status": "idle", "flow_rate": 8.0, "gateway_id": gateway_id,
+            }, headers=self.headers, timeout=10).json()
+            requests.put(f"{self.base_url}/irrigation/{system['id']}/activate", params={"duration": 5},
+                         headers=self.headers, timeout=10)
+
+            waiting = []
+            for _ in range(20):
+                waiting = requests.get(f"{self.base_url}/commands", params={"gateway_id": gateway_id},
+                                       headers=self.headers, timeout=10).json()["waiting"]
+                if waiting:
+                    break
+                time.sleep(0.1)
+            command = next((item for item in waiting if item["device_id"] == system["id"]), None)
+            if command is None or command["payload"] != {"action": "open", "duration": 5}:
+                self.log_test("Device Commands", False, "Valve command not sent to the gateway", waiting)
+                return False
+
+            ack = requests.post(f"{self.base_url}/commands/ack", json={"gateway_id": gateway_id, "ids": [command["id"]]},
+                                headers=self.headers, timeout=10).json()
+            status = requests.get(f"{self.base_url}/commands", params={"gateway_id": gateway_id},
+                                  headers=self.headers, timeout=10).json()
+            if ack["acked"] == 1 and not status["waiting"]:
+                self.log_test("Device Commands", True, f"Valve command acked, latency {status['ack_latency_ms']['last']} ms")
+                return True
+            self.log_test("Device Commands", False, "Ack did not clear the command", {"ack": ack, "status": status})
+        except Exception as e:
+            self.log_test("Device Commands", False, f"Device command test failed: {str(e)}")
+        return False
+    
+    def test_bulk_irrigation_activate(self):
+        """Test activating several irrigation systems in one request"""
+        try:
+            zone = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Bulk Test Zone", "area_size": 1.0, "crop_type": "Padi",
+                "latitude": -7.3950, "longitude": 109.6800, "irrigation_threshold": {},
+            }, headers=self.headers, timeout=10).json()
+            system_ids = [
+                requests.post(f"{self.base_url}/irrigation", json={"zone_id": zone["id"], "status": "idle", "flow_rate": 8.0},
+                              headers=self.headers, timeout=10).json()["id"]
+                for _ in range(3)
+            ]
+            missing_id = str(uuid.uuid4())
+            items = [{"id": system_id, "duration": 12} for system_id in system_ids] + [{"id": missing_id, "duration": 12}]
+            result = requests.post(f"{self.base_url}/irrigation/activate", json={"items": items}, headers=self.headers, timeout=10).json()
+
+            systems = requests.get(f"{self.base_url}/irrigation", params={"zone_id": zone["id"]}, headers=self.headers, timeout=10).json()
+            active = all(system["status"] == "active" and system["duration"] == 12 for system in systems)
+            if result["activated"] == 3 and result["not_found"] == [missing_id] and active:
+                self.log_test("Bulk Irrigation Activate", True, "3 systems activated in one request, unknown id reported")
+                return True
+            self.log_test("Bulk Irrigation Activate", False, "Unexpected bulk activation result", result)
+        except Exception as e:
+            self.log_test("Bulk Irrigation Activate", False, f"Bulk activation test failed: {str(e)}")
+        return False
+    
+    def test_bulk_drone_missions(self):
+        """Test assigning missions to several drones in one request"""
+        try:
+            drone_ids = [
+                requests.post(f"{self.base_url}/drones", json={
+                    "drone_name": f"BULK-{index}", "status": "idle", "battery_level": 90.0,
+                    "current_lat": -7.3950, "current_lng": 109.6800, "payload_type": "air",
+                }, headers=self.headers, timeout=10).json()["id"]
+                for index in range(3)
+            ]
+            missing_id = str(uuid.uuid4())
+            items = [
+                {"id": drone_id, "target_lat": -7.3960 - index * 0.001, "target_lng": 109.6810}
+                for index, drone_id in enumerate(drone_ids)
+            ] + [{"id": missing_id, "target_lat": -7.3960, "target_lng": 109.6810}]
+            result = requests.post(f"{self.base_url}/drones/missions", json={"items": items}, headers=self.headers, timeout=10).json()
+
+            drones = {drone["id"]: drone for drone in requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10).json()}
+            assigned = all(drones[drone_id]["status"] == "in_flight" and drones[drone_id]["payload_type"] == "air" for drone_id in drone_ids)
+            if result["assigned"] == 3 and result["not_found"] == [missing_id] and assigned:
+                self.log_test("Bulk Drone Missions", True, "3 drones re-tasked in one request, unknown id reported")
+                return True
+            self.log_test("Bulk Drone Missions", False, "Unexpected bulk mission result", result)
+        except Exception as e:
+            self.log_test("Bulk Drone Missions", False, f"Bulk mission test failed: {str(e)}")
+        return False
+    
+    def test_usage_report(self):
+        """Test a finished drone spray shows up in the zone's usage report"""
+        try:
+            zone = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Usage Test Zone", "area_size": 1.0, "crop_type": "Padi",
+                "latitude": -7.4100, "longitude": 109.7000, "irrigation_threshold": {},
+            }, headers=self.headers, timeout=10).json()
+            drone = requests.post(f"{self.base_url}/drones", json={
+                "drone_name": "USAGE-1", "status": "in_flight", "battery_level": 90.0,
+                "current_lat": -7.4100, "current_lng": 109.7000, "payload_type": "pupuk_organik", "payload_remaining": 80.0,
+            }, headers=self.headers, timeout=10).json()
+            for status, payload in (("spraying", 80.0), ("returning", 50.0)):
+                requests.post(f"{self.base_url}/drones/{drone['id']}/telemetry", json={
+                    "lat": -7.4100, "lng": 109.7000, "status": status, "payload_remaining": payload,
+                }, headers=self.headers, timeout=10)
+
+            report = requests.get(f"{self.base_url}/usage", params={"zone_id": zone["id"], "group_by": "zone,source,type"},
+                                  headers=self.headers, timeout=10).json()
+            rows = report.get("rows", [])
+            sprayed = [row for row in rows if row["source"] == "drone" and row["type"] == "pupuk_organik"]
+            if len(sprayed) == 1 and sprayed[0]["events"] == 1 and sprayed[0]["liters"] > 0:
+                self.log_test("Usage Report", True, f"{sprayed[0]['liters']} L sprayed, report built in {report['compute_ms']} ms")
+                return True
+            self.log_test("Usage Report", False, "Spray not in the usage report", report)
+        except Exception as e:
+            self.log_test("Usage Report", False, f"Usage report test failed: {str(e)}")
+        return False
+    
     def test_get_irrigation(self):
         """Test GET /api/irrigation to retrieve irrigation systems"""
         try:
@@ -189,6 +548,13 @@ class SmartFarmTester:
             system_id = self.irrigation_systems[0]["id"]
             duration = 15
             
+            rejected = requests.put(f"{self.base_url}/irrigation/{system_id}/activate?duration=0",
+                                    headers=self.headers, timeout=10)
+            if rejected.status_code != 400:
+                self.log_test("Activate Irrigation", False,
+                              f"duration=0 returned status {rejected.status_code}, expected 400", rejected.text)
+                return False
+            
             response = requests.put(
                 f"{self.base_url}/irrigation/{system_id}/activate?duration={duration}", 
                 headers=self.headers, 
@@ -402,57 +768,345 @@ class SmartFarmTester:
             self.log_test("Dashboard Summary", False, f"Dashboard request failed: {str(e)}")
         return False
     
+    def test_dashboard_etag(self):
+        """Test GET /api/dashboard answers 304 for a current ETag and a new ETag after a write"""
+        try:
+            response = requests.get(f"{self.base_url}/dashboard", headers=self.headers, timeout=15)
+            etag = response.headers.get("ETag")
+            if response.status_code != 200 or not etag:
+                self.log_test("Dashboard ETag", False, f"Dashboard returned status {response.status_code} without ETag", response.text)
+                return False
+
+            cached = requests.get(f"{self.base_url}/dashboard", headers={**self.headers, "If-None-Match": etag}, timeout=15)
+            if cached.status_code != 304:
+                self.log_test("Dashboard ETag", False, f"Expected 304 for current ETag, got {cached.status_code}")
+                return False
+
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if zones:
+                reading = {"zone_id": zones[0]["id"], "sensor_type": "temperature", "value": 27.5, "unit": "°C"}
+                requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+                changed = requests.get(f"{self.base_url}/dashboard", headers={**self.headers, "If-None-Match": etag}, timeout=15)
+                if changed.status_code != 200 or changed.headers.get("ETag") == etag:
+                    self.log_test("Dashboard ETag", False, f"Dashboard not refreshed after a sensor write (status {changed.status_code})")
+                    return False
+
+            self.log_test("Dashboard ETag", True, "Dashboard revalidates with ETag and refreshes after writes")
+            return True
+        except Exception as e:
+            self.log_test("Dashboard ETag", False, f"Dashboard ETag request failed: {str(e)}")
+        return False
+    
+    def expected_alert_level(self, sensor: Dict) -> str:
+        """Alert level the server should assign from the zone's irrigation_threshold"""
+        # (warning below, critical below) when the zone does not configure the sensor type
+        limits = {
+            "soil_moisture": (30, 20),
+            "nutrient_n": (40, 25),
+            "nutrient_p": (40, 25),
+            "nutrient_k": (40, 25),
+        }
+        zone = next((z for z in self.zones if z["id"] == sensor["zone_id"]), None)
+        if zone:
+            for sensor_type, warning in zone.get("irrigation_threshold", {}).items():
+                if not isinstance(warning, dict):
+                    limits[sensor_type] = (warning, warning * 2 / 3)
+        
+        if sensor["sensor_type"] not in limits:
+            return "normal"
+        warning, critical = limits[sensor["sensor_type"]]
+        if sensor["value"] < critical:
+            return "critical"
+        if sensor["value"] < warning:
+            return "warning"
+        return "normal"
+    
     def test_sensor_alert_logic(self):
-        """Test sensor alert logic for critical and warning levels"""
+        """Test sensor alert levels are classified against each zone's thresholds"""
         try:
             response = requests.get(f"{self.base_url}/sensors", headers=self.headers, timeout=10)
             if response.status_code == 200:
                 sensors = response.json()
                 
-                # Check soil moisture alerts
-                soil_sensors = [s for s in sensors if s["sensor_type"] == "soil_moisture"]
-                critical_soil = [s for s in soil_sensors if s["alert_level"] == "critical" and s["value"] < 20]
-                warning_soil = [s for s in soil_sensors if s["alert_level"] == "warning" and s["value"] >= 20 and s["value"] < 30]
-                
-                # Check nutrient alerts
-                nutrient_sensors = [s for s in sensors if s["sensor_type"] in ["nutrient_n", "nutrient_p", "nutrient_k"]]
-                critical_nutrients = [s for s in nutrient_sensors if s["alert_level"] == "critical" and s["value"] < 25]
-                warning_nutrients = [s for s in nutrient_sensors if s["alert_level"] == "warning" and s["value"] >= 25 and s["value"] < 40]
-                
-                alert_logic_correct = True
                 issues = []
+                critical = 0
+                warning = 0
+                for sensor in sensors:
+                    expected = self.expected_alert_level(sensor)
+                    if sensor["alert_level"] != expected:
+                        issues.append(f"{sensor['sensor_type']} {sensor['value']} in zone {sensor['zone_id']} "
+                                      f"should be {expected} but is {sensor['alert_level']}")
+                    elif expected == "critical":
+                        critical += 1
+                    elif expected == "warning":
+                        warning += 1
                 
-                # Verify critical soil moisture alerts
-                for sensor in soil_sensors:
-                    if sensor["value"] < 20 and sensor["alert_level"] != "critical":
-                        alert_logic_correct = False
-                        issues.append(f"Soil moisture {sensor['value']} should be critical but is {sensor['alert_level']}")
-                    elif 20 <= sensor["value"] < 30 and sensor["alert_level"] != "warning":
-                        alert_logic_correct = False
-                        issues.append(f"Soil moisture {sensor['value']} should be warning but is {sensor['alert_level']}")
-                
-                # Verify nutrient alerts
-                for sensor in nutrient_sensors:
-                    if sensor["value"] < 25 and sensor["alert_level"] != "critical":
-                        alert_logic_correct = False
-                        issues.append(f"Nutrient {sensor['sensor_type']} {sensor['value']} should be critical but is {sensor['alert_level']}")
-                    elif 25 <= sensor["value"] < 40 and sensor["alert_level"] != "warning":
-                        alert_logic_correct = False
-                        issues.append(f"Nutrient {sensor['sensor_type']} {sensor['value']} should be warning but is {sensor['alert_level']}")
-                
-                if alert_logic_correct:
+                if not issues:
                     self.log_test("Sensor Alert Logic", True, 
-                                f"Alert logic working correctly. Critical: {len(critical_soil + critical_nutrients)}, "
-                                f"Warning: {len(warning_soil + warning_nutrients)}")
+                                f"Alert logic working correctly. Critical: {critical}, Warning: {warning}")
                     return True
                 else:
-                    self.log_test("Sensor Alert Logic", False, f"Alert logic issues found: {issues}")
+                    self.log_test("Sensor Alert Logic", False, f"Alert logic issues found: {issues[:10]}")
             else:
                 self.log_test("Sensor Alert Logic", False, f"Could not retrieve sensors for alert logic test")
         except Exception as e:
             self.log_test("Sensor Alert Logic", False, f"Alert logic test failed: {str(e)}")
         return False
     
+    def test_sensor_batch_ingest(self):
+        """Test POST /api/sensors/batch with a mix of valid and invalid readings"""
+        if not self.zones:
+            self.log_test("Sensor Batch Ingest", False, "No zones available for testing")
+            return False
+        
+        try:
+            zone_id = self.zones[0]["id"]
+            readings = [
+                {"zone_id": zone_id, "sensor_type": "soil_moisture", "value": 42.5, "unit": "%"},
+                {"zone_id": zone_id, "sensor_type": "temperature", "value": 28.1, "unit": "°C"},
+                {"zone_id": zone_id, "sensor_type": "not_a_sensor", "value": 1.0, "unit": "?"},
+                {"zone_id": zone_id, "sensor_type": "humidity", "value": float("inf"), "unit": "%"},
+            ]
+            # json.dumps writes Infinity, which requests' json= refuses to send
+            response = requests.post(f"{self.base_url}/sensors/batch", data=json.dumps({"readings": readings}), 
+                                   headers=self.headers, timeout=10)
+            if response.status_code == 200:
+                data = response.json()
+                errors = data.get("errors", [])
+                if data.get("accepted") == 2 and data.get("rejected") == 2 and len(data.get("ids", [])) == 2:
+                    if [error["index"] for error in errors] == [2, 3]:
+                        self.log_test("Sensor Batch Ingest", True, "Batch accepted 2 readings and reported the invalid and infinite ones by index")
+                        return True
+                    else:
+                        self.log_test("Sensor Batch Ingest", False, "Per-item errors not reported correctly", errors)
+                else:
+                    self.log_test("Sensor Batch Ingest", False, "Unexpected batch counts", data)
+            else:
+                self.log_test("Sensor Batch Ingest", False, f"Batch ingest returned status {response.status_code}", response.text)
+        except Exception as e:
+            self.log_test("Sensor Batch Ingest", False, f"Batch ingest request failed: {str(e)}")
+        return False
+    
+    def test_sensor_non_finite_values(self):
+        """Test POST /api/sensors rejects NaN and Infinity sent as JSON and latest values stay readable"""
+        if not self.zones:
+            self.log_test("Sensor Non-Finite Values", False, "No zones available for testing")
+            return False
+        
+        try:
+            statuses = []
+            for value in (float("nan"), float("inf"), float("-inf")):
+                reading = {"zone_id": self.zones[0]["id"], "sensor_type": "humidity", "value": value, "unit": "%"}
+                # json.dumps writes NaN/Infinity, which requests' json= refuses to send
+                response = requests.post(f"{self.base_url}/sensors", data=json.dumps(reading), headers=self.headers, timeout=10)
+                statuses.append(response.status_code)
+            latest = requests.get(f"{self.base_url}/sensors/latest", headers=self.headers, timeout=10)
+            if statuses == [400, 400, 400] and latest.status_code == 200:
+                self.log_test("Sensor Non-Finite Values", True, "NaN, Infinity and -Infinity rejected with 400; latest values still served")
+                return True
+            self.log_test("Sensor Non-Finite Values", False, f"Statuses {statuses}, latest returned {latest.status_code}")
+        except Exception as e:
+            self.log_test("Sensor Non-Finite Values", False, f"Non-finite value test failed: {str(e)}")
+        return False
+    
+    def test_ingest_write_behind(self):
+        """Test the write-behind buffer: queued readings become readable and a full buffer answers 503
+
+        Backpressure is only provoked when INGEST_BUFFER_MAX is small (at most 1000).
+        """
+        if not self.zones:
+            self.log_test("Ingest Write-Behind", False, "No zones available for testing")
+            return False
+        
+        try:
+            stats = requests.get(f"{self.base_url}/ingest/stats", headers=self.headers, timeout=10).json()
+            if not stats.get("write_behind"):
+                self.log_test("Ingest Write-Behind", True, "Write-behind disabled (SENSOR_WRITE_BEHIND=false); readings are written synchronously")
+                return True
+            missing = [key for key in ("depth", "capacity", "batch_size", "flushed", "rejected") if key not in stats]
+            if missing:
+                self.log_test("Ingest Write-Behind", False, f"Ingest stats missing {missing}", stats)
+                return False
+
+            zone_id = self.zones[0]["id"]
+            reading = {"zone_id": zone_id, "sensor_type": "ph_level", "value": 6.42, "unit": "pH"}
+            created = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10).json()
+            deadline = time.time() + stats["flush_interval_ms"] / 1000 * 4 + 5
+            stored = False
+            while not stored and time.time() < deadline:
+                time.sleep(stats["flush_interval_ms"] / 1000)
+                sensors = requests.get(f"{self.base_url}/sensors", params={"zone_id": zone_id, "sensor_type": "ph_level", "limit": 20},
+                                       headers=self.headers, timeout=10).json()
+                stored = created["id"] in [sensor["id"] for sensor in sensors]
+            flushed = requests.get(f"{self.base_url}/ingest/stats", headers=self.headers, timeout=10).json()
+            if not stored or flushed["flushed"] <= stats["flushed"]:
+                self.log_test("Ingest Write-Behind", False, "Buffered reading was not flushed to sensor_data", flushed)
+                return False
+
+            message = "Buffered reading readable after flush"
+            if stats["capacity"] <= 1000:
+                def post(_):
+                    return requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=30)
+                with ThreadPoolExecutor(max_workers=16) as pool:
+                    responses = list(pool.map(post, range(stats["capacity"] + stats["batch_size"])))
+                refused = [response for response in responses if response.status_code == 503]
+                unexpected = [response.status_code for response in responses if response.status_code not in (200, 503)]
+                after = requests.get(f"{self.base_url}/ingest/stats", headers=self.headers, timeout=10).json()
+                # The counter is shared: other clients of the backend may be refused during the burst too
+                if unexpected or any("Retry-After" not in response.headers for response in refused) or \
+                        after["rejected"] - flushed["rejected"] < len(refused):
+                    self.log_test("Ingest Write-Behind", False, "Backpressure responses inconsistent",
+                                  {"unexpected": unexpected[:10], "refused": len(refused), "stats": after})
+                    return False
+                message += f"; {len(refused)} of {len(responses)} burst readings refused with 503 and Retry-After"
+            self.log_test("Ingest Write-Behind", True, message)
+            return True
+        except Exception as e:
+            self.log_test("Ingest Write-Behind", False, f"Write-behind test failed: {str(e)}")
+        return False
+    
+    def test_sensor_frame_ingest(self):
+        """Test POST /api/sensors/frame with a binary frame"""
+        if not self.zones:
+            self.log_test("Sensor Frame Ingest", False, "No zones available for testing")
+            return False
+        
+        try:
+            zone_id = self.zones[0]["id"]
+            # Records: zone, sensor type code, value, timestamp (None = time received)
+            frame = encode_frame([
+                (zone_id, 0, 42.5, None),
+                (zone_id, 6, 71.0, datetime.now(timezone.utc)),
+                (zone_id, 99, 1.0, None),
+                (zone_id, 0, float("nan"), None),
+            ])
+            
+            response = requests.post(f"{self.base_url}/sensors/frame", data=frame, 
+                                   headers={"Content-Type": FRAME_CONTENT_TYPE}, timeout=10)
+            if response.status_code == 200:
+                data = response.json()
+                errors = data.get("errors", [])
+                if data.get("accepted") == 2 and [error["index"] for error in errors] == [2, 3]:
+                    bad = requests.post(f"{self.base_url}/sensors/frame", data=b"XX\x01\x00\x00", 
+                                      headers={"Content-Type": FRAME_CONTENT_TYPE}, timeout=10)
+                    wrong_type = requests.post(f"{self.base_url}/sensors/frame", data=frame,
+                                             headers={"Content-Type": "application/octet-stream"}, timeout=10)
+                    if bad.status_code == 400 and wrong_type.status_code == 415:
+                        self.log_test("Sensor Frame Ingest", True, "Binary frame decoded, unknown sensor code and NaN reported, bad frame and content type rejected")
+                        return True
+                    else:
+                        self.log_test("Sensor Frame Ingest", False, f"Malformed frame returned status {bad.status_code}, wrong content type {wrong_type.status_code}", bad.text)
+                else:
+                    self.log_test("Sensor Frame Ingest", False, "Unexpected frame ingest result", data)
+            else:
+                self.log_test("Sensor Frame Ingest", False, f"Frame ingest returned status {response.status_code}", response.text)
+        except Exception as e:
+            self.log_test("Sensor Frame Ingest", False, f"Frame ingest request failed: {str(e)}")
+        return False
+    
+    def test_sensor_retransmit_dedup(self):
+        """Test that a reading resent with the same device_id + sequence is stored once"""
+        if not self.zones:
+            self.log_test("Sensor Retransmit Dedup", False, "No zones available for testing")
+            return False
+        
+        try:
+            reading = {
+                "zone_id": self.zones[0]["id"], "sensor_type": "humidity", "value": 65.0, "unit": "%",
+                "device_id": f"test-gateway-{uuid.uuid4()}", "sequence": 1,
+            }
+            first = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+            retry = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+            batch = requests.post(f"{self.base_url}/sensors/batch", json={"readings": [reading]}, 
+                                headers=self.headers, timeout=10)
+            
+            if first.status_code == 200 and retry.status_code == 200 and batch.status_code == 200:
+                if first.json()["id"] == retry.json()["id"] and batch.json().get("duplicates") == 1:
+                    self.log_test("Sensor Retransmit Dedup", True, "Retransmitted reading kept its id and was not stored again")
+                    return True
+                else:
+                    self.log_test("Sensor Retransmit Dedup", False, "Retransmit was not deduplicated", 
+                                {"first": first.json(), "retry": retry.json(), "batch": batch.json()})
+            else:
+                self.log_test("Sensor Retransmit Dedup", False, 
+                            f"Unexpected statuses {first.status_code}/{retry.status_code}/{batch.status_code}")
+        except Exception as e:
+            self.log_test("Sensor Retransmit Dedup", False, f"Dedup test request failed: {str(e)}")
+        return False
+    
+    def test_latest_sensor_data(self):
+        """Test GET /api/sensors/latest returns the newest reading per zone and sensor type"""
+        try:
+            zones_response = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10)
+            if zones_response.status_code != 200 or not zones_response.json():
+                self.log_test("Latest Sensor Data", False, "No zones available for test")
+                return False
+            zone_id = zones_response.json()[0]["id"]
+
+            reading = {"zone_id": zone_id, "sensor_type": "ph_level", "value": 6.8, "unit": "pH"}
+            create_response = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+            if create_response.status_code != 200:
+                self.log_test("Latest Sensor Data", False, f"Sensor create returned status {create_response.status_code}", create_response.text)
+                return False
+
+            response = requests.get(f"{self.base_url}/sensors/latest", params={"zone_id": zone_id}, headers=self.headers, timeout=10)
+            if response.status_code == 200:
+                zones = response.json().get("zones", {})
+                latest = zones.get(zone_id, {}).get("ph_level")
+                if set(zones) == {zone_id} and latest and latest["id"] == create_response.json()["id"]:
+                    self.log_test("Latest Sensor Data", True, f"Zone reports {len(zones[zone_id])} current sensor values")
+                    return True
+                else:
+                    self.log_test("Latest Sensor Data", False, "Latest view does not hold the new reading", zones)
+            else:
+                self.log_test("Latest Sensor Data", False, f"Latest sensor data returned status {response.status_code}", response.text)
+        except Exception as e:
+            self.log_test("Latest Sensor Data", False, f"Latest sensor data request failed: {str(e)}")
+        return False
+    
+    def test_sensor_delta_sync(self):
+        """Test GET /api/sensors?since=<cursor> returns only readings stored after the cursor"""
+        try:
+            initial = requests.get(f"{self.base_url}/sensors", params={"limit": 1}, headers=self.headers, timeout=10)
+            cursor = initial.headers.get("X-Change-Cursor")
+            if initial.status_code != 200 or cursor is None:
+                self.log_test("Sensor Delta Sync", False, f"Sensors returned status {initial.status_code} without a change cursor")
+                return False
+
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if not zones:
+                self.log_test("Sensor Delta Sync", False, "No zones available for test")
+                return False
+            reading = {"zone_id": zones[0]["id"], "sensor_type": "nutrient_k", "value": 48.0, "unit": "ppm"}
+            created = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10).json()
+
+            delta = requests.get(f"{self.base_url}/sensors", params={"since": cursor}, headers=self.headers, timeout=10)
+            ids = [sensor["id"] for sensor in delta.json()]
+            next_cursor = int(delta.headers.get("X-Change-Cursor", -1))
+            if delta.status_code == 200 and created["id"] in ids and next_cursor > int(cursor):
+                again = requests.get(f"{self.base_url}/sensors", params={"since": next_cursor}, headers=self.headers, timeout=10)
+                if created["id"] in [sensor["id"] for sensor in again.json()]:
+                    self.log_test("Sensor Delta Sync", False, "Reading returned again after advancing the cursor")
+                    return False
+                # Removing simulated drones resets the drones cursor
+                drones = requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10)
+                drone_cursor = drones.headers.get("X-Change-Cursor")
+                requests.post(f"{self.base_url}/simulate-fleet/start", json={"drones": 5, "tick_ms": 500}, headers=self.headers, timeout=10)
+                requests.post(f"{self.base_url}/simulate-fleet/stop", headers=self.headers, timeout=30)
+                expired = requests.get(f"{self.base_url}/drones", params={"since": drone_cursor}, headers=self.headers, timeout=10)
+                reloaded = requests.get(f"{self.base_url}/drones", headers=self.headers, timeout=10)
+                resumed = requests.get(f"{self.base_url}/drones", params={"since": reloaded.headers.get("X-Change-Cursor")},
+                                       headers=self.headers, timeout=10)
+                if expired.status_code == 410 and resumed.status_code == 200:
+                    self.log_test("Sensor Delta Sync", True, f"Delta returned {len(ids)} new readings, cursor {cursor} -> {next_cursor}; removed drones expire the drones cursor")
+                    return True
+                self.log_test("Sensor Delta Sync", False, f"Cursor after removing drones returned {expired.status_code}, reloaded cursor {resumed.status_code}")
+            else:
+                self.log_test("Sensor Delta Sync", False, "New reading missing from delta", ids)
+        except Exception as e:
+            self.log_test("Sensor Delta Sync", False, f"Delta sync request failed: {str(e)}")
+        return False
+    
     def test_historical_sensor_data_default(self):
         """Test GET /api/sensors/historical with default 24 hours"""
         try:
@@ -585,6 +1239,145 @@ class SmartFarmTester:
             self.log_test("Historical Data Zone Filter", False, f"Zone filter request failed: {str(e)}")
         return False
     
+    def test_historical_sensor_data_buckets(self):
+        """Test GET /api/sensors/historical with daily and 5-minute buckets"""
+        try:
+            daily = requests.get(f"{self.base_url}/sensors/historical?hours=48&bucket=1d", 
+                               headers=self.headers, timeout=15)
+            fine = requests.get(f"{self.base_url}/sensors/historical?hours=1&bucket=5m", 
+                              headers=self.headers, timeout=15)
+            invalid = requests.get(f"{self.base_url}/sensors/historical?bucket=2h", 
+                                 headers=self.headers, timeout=15)
+            raw_too_long = requests.get(f"{self.base_url}/sensors/historical?hours=168&bucket=5m", 
+                                      headers=self.headers, timeout=15)
+            
+            if daily.status_code == 200 and fine.status_code == 200 and invalid.status_code == 400 and raw_too_long.status_code == 400:
+                daily_data = daily.json().get("data", [])
+                fine_data = fine.json().get("data", [])
+                # hours=48 starts on the day two days ago: that day, yesterday and today
+                if len(daily_data) == 3 and len(fine_data) in (0, 12):
+                    point = next((p for p in daily_data if "soil_moisture" in p), None)
+                    if point is None or point["soil_moisture_min"] <= point["soil_moisture"] <= point["soil_moisture_max"]:
+                        self.log_test("Historical Data Buckets", True, 
+                                    f"Daily buckets: {len(daily_data)}, 5-minute buckets: {len(fine_data)}, invalid bucket and long 5-minute window rejected")
+                        return True
+                    else:
+                        self.log_test("Historical Data Buckets", False, "Mean outside min/max range", point)
+                else:
+                    self.log_test("Historical Data Buckets", False, 
+                                f"Unexpected bucket counts: daily {len(daily_data)}, 5-minute {len(fine_data)}")
+            else:
+                self.log_test("Historical Data Buckets", False, 
+                            f"Unexpected statuses {daily.status_code}/{fine.status_code}/{invalid.status_code}/{raw_too_long.status_code}")
+        except Exception as e:
+            self.log_test("Historical Data Buckets", False, f"Bucket request failed: {str(e)}")
+        return False
+    
+    def test_historical_rollups(self):
+        """Test hourly and daily chart buckets (read from the hourly rollups) match the raw readings
+
+        Against a local backend (BASE_URL on localhost) that backend/.env points at, the
+        rollups are also rebuilt with ``rollups.py backfill`` and checked again; the CLI
+        writes to the database in backend/.env, not to the server behind BASE_URL.
+        """
+        def parse_time(value):
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+        def expected_buckets(readings, width):
+            buckets = {}
+            for reading in readings:
+                at = parse_time(reading["timestamp"])
+                start = at.replace(minute=0, second=0, microsecond=0)
+                if width == "1d":
+                    start = start.replace(hour=0)
+                buckets.setdefault(start, []).append(reading["value"])
+            return {start: (round(sum(values) / len(values), 2), min(values), max(values)) for start, values in buckets.items()}
+
+        def chart_buckets(zone_id, hours, bucket):
+            response = requests.get(f"{self.base_url}/sensors/historical",
+                                    params={"zone_id": zone_id, "hours": hours, "bucket": bucket}, headers=self.headers, timeout=15)
+            return {
+                parse_time(row["time"]): (row["soil_moisture"], row["soil_moisture_min"], row["soil_moisture_max"])
+                for row in response.json().get("data", []) if "soil_moisture" in row
+            }
+
+        def mismatches(expected, actual):
+            if set(expected) != set(actual):
+                return {"expected": sorted(map(str, expected)), "actual": sorted(map(str, actual))}
+            return {str(start): (expected[start], actual[start]) for start in expected
+                    if any(abs(a - b) > 0.011 for a, b in zip(expected[start], actual[start]))}
+
+        try:
+            zone = requests.post(f"{self.base_url}/zones", json={
+                "zone_name": "Rollup Test Zone", "area_size": 0.5, "crop_type": "Padi",
+                "latitude": -7.3950, "longitude": 109.6800, "irrigation_threshold": {},
+            }, headers=self.headers, timeout=10).json()
+            now = datetime.now(timezone.utc)
+            # Values exact in float32; two readings in an earlier hour and two in the current one
+            frame = encode_frame([
+                (zone["id"], 0, 40.5, now - timedelta(minutes=100)),
+                (zone["id"], 0, 38.25, now - timedelta(minutes=95)),
+                (zone["id"], 0, 30.0, now - timedelta(seconds=90)),
+                (zone["id"], 0, 44.75, now - timedelta(seconds=30)),
+            ])
+            stored = requests.post(f"{self.base_url}/sensors/frame", data=frame,
+                                   headers={"Content-Type": FRAME_CONTENT_TYPE}, timeout=10).json()
+            raw = requests.get(f"{self.base_url}/sensors", params={"zone_id": zone["id"], "sensor_type": "soil_moisture", "limit": 100},
+                               headers=self.headers, timeout=10).json()
+            if stored.get("accepted") != 4 or len(raw) != 4:
+                self.log_test("Historical Rollups", False, "Test readings were not stored", {"stored": stored, "raw": len(raw)})
+                return False
+
+            hourly = mismatches(expected_buckets(raw, "1h"), chart_buckets(zone["id"], 3, "1h"))
+            daily = mismatches(expected_buckets(raw, "1d"), chart_buckets(zone["id"], 48, "1d"))
+            if hourly or daily:
+                self.log_test("Historical Rollups", False, "Rollup buckets differ from raw readings", {"1h": hourly, "1d": daily})
+                return False
+
+            message = "Hourly and daily buckets match the raw readings"
+            if urlparse(self.base_url).hostname in ("localhost", "127.0.0.1") and (BACKEND_DIR / ".env").exists():
+                backfill = subprocess.run([sys.executable, "rollups.py", "backfill", "--hours", "3"], cwd=BACKEND_DIR,
+                                          capture_output=True, text=True, timeout=300)
+                rebuilt = mismatches(expected_buckets(raw, "1h"), chart_buckets(zone["id"], 3, "1h"))
+                if backfill.returncode != 0 or rebuilt:
+                    self.log_test("Historical Rollups", False, "Backfill failed or changed the hourly buckets",
+                                  {"returncode": backfill.returncode, "stderr": backfill.stderr[-500:], "1h": rebuilt})
+                    return False
+                message += f"; backfill rebuilt them unchanged ({backfill.stdout.strip()})"
+            self.log_test("Historical Rollups", True, message)
+            return True
+        except Exception as e:
+            self.log_test("Historical Rollups", False, f"Rollup test failed: {str(e)}")
+        return False
+    
+    def test_historical_sensor_data_downsampling(self):
+        """Test GET /api/sensors/historical caps points per sensor type with max_points"""
+        try:
+            max_points = 6
+            response = requests.get(f"{self.base_url}/sensors/historical?hours=24&max_points={max_points}", 
+                                  headers=self.headers, timeout=15)
+            if response.status_code == 200:
+                chart_data = response.json().get("data", [])
+                per_type = {}
+                for point in chart_data:
+                    for key in point:
+                        if key != "time" and not key.endswith(("_min", "_max")):
+                            per_type[key] = per_type.get(key, 0) + 1
+                
+                if chart_data and per_type and all(count <= max_points for count in per_type.values()):
+                    self.log_test("Historical Data Downsampling", True, 
+                                f"Series downsampled to at most {max_points} points: {per_type}")
+                    return True
+                else:
+                    self.log_test("Historical Data Downsampling", False, "Series not downsampled", per_type)
+            else:
+                self.log_test("Historical Data Downsampling", False, 
+                            f"Downsampling request returned status {response.status_code}", response.text)
+        except Exception as e:
+            self.log_test("Historical Data Downsampling", False, f"Downsampling request failed: {str(e)}")
+        return False
+    
     def test_drone_positions_api(self):
         """Test GET /api/drones/positions for map visualization"""
         try:
@@ -654,6 +1447,90 @@ class SmartFarmTester:
             self.log_test("Drone Positions API", False, f"Drone positions request failed: {str(e)}")
         return False
     
+    def test_alert_stats(self):
+        """Test GET /api/alerts/stats counts a new critical reading in every window"""
+        try:
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if not zones:
+                self.log_test("Alert Stats", False, "No zones available for test")
+                return False
+            zone_id = zones[0]["id"]
+
+            before = requests.get(f"{self.base_url}/alerts/stats", params={"zone_id": zone_id}, headers=self.headers, timeout=10)
+            if before.status_code != 200:
+                self.log_test("Alert Stats", False, f"Alert stats returned status {before.status_code}", before.text)
+                return False
+
+            # Far below any soil moisture threshold, so always critical
+            reading = {"zone_id": zone_id, "sensor_type": "soil_moisture", "value": 1.0, "unit": "%"}
+            requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10)
+
+            after = requests.get(f"{self.base_url}/alerts/stats", params={"zone_id": zone_id}, headers=self.headers, timeout=10).json()
+            windows = after.get("windows", [])
+            grew = all(
+                after["totals"][window]["critical"] == before.json()["totals"][window]["critical"] + 1
+                for window in windows
+            )
+            if windows and grew:
+                self.log_test("Alert Stats", True, f"Critical counts per window: {after['totals']}")
+                return True
+            self.log_test("Alert Stats", False, "Critical reading not counted in every window", after)
+        except Exception as e:
+            self.log_test("Alert Stats", False, f"Alert stats request failed: {str(e)}")
+        return False
+    
+    def test_event_stream(self):
+        """Test GET /api/stream pushes a new reading for a subscribed zone"""
+        try:
+            zones = requests.get(f"{self.base_url}/zones", headers=self.headers, timeout=10).json()
+            if not zones:
+                self.log_test("Event Stream", False, "No zones available for test")
+                return False
+            zone_id = zones[0]["id"]
+
+            params = {"topics": "readings", "zone_id": zone_id}
+            with requests.get(f"{self.base_url}/stream", params=params, stream=True, timeout=10) as stream:
+                if stream.status_code != 200:
+                    self.log_test("Event Stream", False, f"Stream returned status {stream.status_code}", stream.text)
+                    return False
+                event = None
+                created = None
+                for line in stream.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:") and event == "ready":
+                        reading = {"zone_id": zone_id, "sensor_type": "humidity", "value": 71.5, "unit": "%"}
+                        created = requests.post(f"{self.base_url}/sensors", json=reading, headers=self.headers, timeout=10).json()
+                    elif line.startswith("data:") and event == "reading":
+                        pushed = json.loads(line[len("data:"):])
+                        if created and pushed.get("id") == created.get("id"):
+                            self.log_test("Event Stream", True, "New reading pushed to the subscribed stream")
+                            return True
+            self.log_test("Event Stream", False, "Stream closed before the reading was pushed")
+        except Exception as e:
+            self.log_test("Event Stream", False, f"Event stream request failed: {str(e)}")
+        return False
+    
+    def test_index_status(self):
+        """Test GET /api/system/indexes reports the startup index build"""
+        try:
+            response = requests.get(f"{self.base_url}/system/indexes", headers=self.headers, timeout=10)
+            if response.status_code == 200:
+                data = response.json()
+                indexes = data.get("indexes", [])
+                failed = [f"{i['collection']}.{i['name']}: {i['error']}" for i in indexes if i["status"] == "failed"]
+                names = {i["name"] for i in indexes}
+                if "zone_type_timestamp" in names and not failed:
+                    self.log_test("Index Status", True, f"Index status reported: {data.get('summary')}")
+                    return True
+                else:
+                    self.log_test("Index Status", False, "Missing or failed indexes", failed or names)
+            else:
+                self.log_test("Index Status", False, f"Index status returned status {response.status_code}", response.text)
+        except Exception as e:
+            self.log_test("Index Status", False, f"Index status request failed: {str(e)}")
+        return False
+    
     def test_clear_data_api(self):
         """Test DELETE /api/clear-data to clear all database records"""
         try:
@@ -815,10 +1692,32 @@ class SmartFarmTester:
             ("Get Zones", self.test_get_zones),
             ("Get Sensors", self.test_get_sensors),
             ("Sensor Alert Logic", self.test_sensor_alert_logic),
+            ("Sensor Batch Ingest", self.test_sensor_batch_ingest),
+            ("Sensor Non-Finite Values", self.test_sensor_non_finite_values),
+            ("Ingest Write-Behind", self.test_ingest_write_behind),
+            ("Sensor Frame Ingest", self.test_sensor_frame_ingest),
+            ("Sensor Retransmit Dedup", self.test_sensor_retransmit_dedup),
+            ("Latest Sensor Data", self.test_latest_sensor_data),
+            ("Sensor Delta Sync", self.test_sensor_delta_sync),
             ("Historical Data Default", self.test_historical_sensor_data_default),
             ("Historical Data Custom Hours", self.test_historical_sensor_data_custom_hours),
             ("Historical Data Zone Filter", self.test_historical_sensor_data_zone_filter),
+            ("Historical Data Buckets", self.test_historical_sensor_data_buckets),
+            ("Historical Rollups", self.test_historical_rollups),
+            ("Historical Data Downsampling", self.test_historical_sensor_data_downsampling),
             ("Drone Positions API", self.test_drone_positions_api),
+            ("Drone Telemetry", self.test_drone_telemetry),
+            ("Drone Track", self.test_drone_track),
+            ("Spatial Queries", self.test_spatial_queries),
+            ("Mission Plan", self.test_mission_plan),
+            ("Drone Dispatch", self.test_drone_dispatch),
+            ("Fleet Simulation", self.test_fleet_simulation),
+            ("Irrigation Schedule", self.test_irrigation_schedule),
+            ("Threshold Rules", self.test_threshold_rules),
+            ("Device Commands", self.test_device_commands),
+            ("Bulk Irrigation Activate", self.test_bulk_irrigation_activate),
+            ("Bulk Drone Missions", self.test_bulk_drone_missions),
+            ("Usage Report", self.test_usage_report),
             ("Get Irrigation", self.test_get_irrigation),
             ("Activate Irrigation", self.test_activate_irrigation),
             ("Activate Irrigation Invalid ID", self.test_activate_irrigation_invalid_id),
@@ -826,6 +1725,10 @@ class SmartFarmTester:
             ("Drone Mission", self.test_drone_mission),
             ("Drone Mission Invalid ID", self.test_drone_mission_invalid_id),
             ("Dashboard Summary", self.test_dashboard_summary),
+            ("Dashboard ETag", self.test_dashboard_etag),
+            ("Alert Stats", self.test_alert_stats),
+            ("Event Stream", self.test_event_stream),
+            ("Index Status", self.test_index_status),
             ("Clear Data API", self.test_clear_data_api),
         ]
         
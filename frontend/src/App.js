@@ -338,6 +338,31 @@ const DroneCard = ({ drone, onSendMission }) => {
   );
 };
 
+// Apply a pushed drone update (full drone or changed fields) to the map markers
+const mergeDronePosition = (positions, update) => {
+  const current = positions?.find((drone) => drone.id === update.id);
+  const merged = {
+    ...current,
+    id: update.id,
+    name: update.drone_name ?? current?.name,
+    status: update.status ?? current?.status,
+    battery: update.battery_level ?? current?.battery,
+    payload: update.payload_remaining ?? current?.payload,
+    payload_type: update.payload_type ?? current?.payload_type ?? 'unknown',
+    position: update.current_lat !== undefined ? [update.current_lat, update.current_lng] : current?.position,
+    target: update.target_lat !== undefined && update.target_lat !== null ? [update.target_lat, update.target_lng] : current?.target ?? null,
+  };
+  if (!merged.position) return positions;
+  return current ? positions.map((drone) => (drone.id === update.id ? merged : drone)) : [...(positions || []), merged];
+};
+
+// Changed fields update a listed item; an unlisted item is only added when complete
+const mergeById = (items, update, isComplete) => {
+  const current = items.find((item) => item.id === update.id);
+  if (current) return items.map((item) => (item.id === update.id ? { ...item, ...update } : item));
+  return isComplete ? [update, ...items] : items;
+};
+
 const SmartFarmDashboard = () => {
   const [dashboardData, setDashboardData] = useState(null);
   const [historicalData, setHistoricalData] = useState(null);
@@ -420,12 +445,41 @@ const SmartFarmDashboard = () => {
     };
     
     loadAllData();
-    const interval = setInterval(() => {
+
+    // Live updates instead of polling. "ready" is sent on every (re)connect and
+    // "resync" when the server dropped events, so both refetch the snapshot.
+    const stream = new EventSource(`${API}/stream`);
+    const resync = () => {
       fetchDashboardData();
-      fetchDronePositions(); // Update drone positions more frequently
-    }, 30000); // Refresh every 30 seconds
-    
-    return () => clearInterval(interval);
+      fetchDronePositions();
+    };
+    stream.addEventListener('ready', resync);
+    stream.addEventListener('resync', resync);
+    stream.addEventListener('reading', (event) => {
+      const reading = JSON.parse(event.data);
+      setDashboardData((data) => data && {
+        ...data,
+        critical_alerts: data.critical_alerts + (reading.alert_level === 'critical' ? 1 : 0),
+        recent_sensor_data: [reading, ...data.recent_sensor_data.filter((sensor) => sensor.id !== reading.id)].slice(0, 10),
+      });
+    });
+    stream.addEventListener('drone', (event) => {
+      const drone = JSON.parse(event.data);
+      setDronePositions((positions) => mergeDronePosition(positions, drone));
+      setDashboardData((data) => {
+        if (!data) return data;
+        const droneFleet = mergeById(data.drone_fleet, drone, drone.drone_name !== undefined);
+        return {
+          ...data,
+          drone_fleet: droneFleet,
+          drones_active: droneFleet.filter((item) => item.status === 'in_flight' || item.status === 'spraying').length,
+        };
+      });
+    });
+    // Irrigation changes are rare and move the active count, so take a fresh summary
+    stream.addEventListener('irrigation', fetchDashboardData);
+
+    return () => stream.close();
   }, []);
 
   if (loading) {